@@ -0,0 +1,453 @@
+"""
+常驻后台代理 (可选)：以管理员权限运行，保持温热的设备列表和参数缓存并负责写入 / 重启，
+不需要提升权限的客户端 (命令行、热键脚本) 通过本地 IPC 调用 list / get / set / subscribe。
+反复切换时省去 UAC、解释器冷启动和完整扫描，只剩一次往返加上设备重启本身。
+
+    python main.py agent                    # 启动代理 (需要管理员权限)
+    python main.py agent --simulate 1000    # 在模拟树上启动 (非 Windows 也可以，见 simulator.py)
+    python main.py agent --stop             # 停止正在运行的代理
+    python main.py set "*MX*" mac           # 代理在运行时，list / get / set 自动通过它执行
+
+传输层为 multiprocessing.connection 的回环 TCP 连接 (127.0.0.1，随机端口)。
+没有使用命名管道：提升权限的进程创建的管道默认只允许管理员写入，普通权限的客户端无法发送请求。
+连接时用 authkey 做 HMAC 握手；authkey 在代理启动时随机生成，与地址一起写入设备缓存旁边的
+agent.json，只有能读取该文件的用户才能连接。消息只用 send_bytes / recv_bytes 传输 UTF-8 JSON (从不 unpickle)：
+
+    请求: {"id": 1, "op": "ping" | "list" | "get" | "set" | "subscribe" | "shutdown", ...参数}
+    响应: {"id": 1, "ok": true, "result": ...}  或  {"id": 1, "ok": false, "error": "..."}
+    事件: {"event": "devices", "devices": [...]}            设备插拔 / 重新扫描之后
+          {"event": "params", "pnp_id", "params": {...}}    其他工具修改了设备参数
+          {"event": "applied", "results": [...]}            修改完成 (包括 wait=false 的修改)
+
+op 参数：
+    list       {"refresh": false}  -> [设备]，refresh 时先做一次增量扫描；params 为当前取值
+    get        {"pnp_id"}          -> {参数名: 值}，设备没有参数键时为 null
+    set        {"target", "values", "restart": true, "restart_mode": "parent", "wait": true}
+               target 为 PNP ID 或名称通配符。wait 时返回 apply_to_devices() 的结果列表；
+               否则交给 ApplyCoordinator 合并连续修改并立即返回 {"queued": [PNP ID]}，结果以 applied 事件推送
+    subscribe  {}                  -> 之后该连接只接收事件
+"""
+import binascii
+import json
+import os
+import socket
+import threading
+from multiprocessing.connection import AuthenticationError, Connection, Listener, answer_challenge, deliver_challenge
+
+from devices import (
+    ENUM_ROOT,
+    RESTART_EACH_CHILD,
+    RESTART_SHARED_PARENT,
+    WHEEL_PARAMETERS,
+    WIN32_BACKEND,
+    ApplyCoordinator,
+    DeviceCache,
+    DeviceIndex,
+    DeviceRecord,
+    DeviceRestarter,
+    HotplugMonitor,
+    IncrementalScanner,
+    RestartPlanner,
+    StateCache,
+    Win32DeviceEventSource,
+    Win32RegistryWatcher,
+    apply_to_devices,
+)
+from profiles import find_targets
+
+PROTOCOL_VERSION = 1
+# 插拔事件的轮询间隔 (秒)
+AGENT_POLL_INTERVAL = 0.2
+# 客户端等待响应的超时 (秒)，需要覆盖一次批量重启
+AGENT_TIMEOUT = 60.0
+# 客户端连接和 authkey 握手的超时 (秒)；代理卡住时命令行应尽快回退为直接执行
+AGENT_CONNECT_TIMEOUT = 2.0
+# 监听队列长度
+AGENT_BACKLOG = 16
+
+class AgentError(Exception):
+    """代理返回的错误或协议错误"""
+
+def agent_info_path() -> str:
+    """agent.json 的位置：与设备缓存在同一目录"""
+    return os.path.join(os.path.dirname(DeviceCache.default_path()), "agent.json")
+
+def write_agent_info(path: str, address, authkey: bytes):
+    """原子写入代理地址和 authkey；非 Windows 上文件权限为 0600"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"version": PROTOCOL_VERSION, "address": list(address),
+                   "authkey": binascii.hexlify(authkey).decode("ascii"), "pid": os.getpid()}, f)
+    os.replace(tmp_path, path)
+
+def read_agent_info(path: str):
+    """返回 (address, authkey)，文件不存在、损坏或版本不匹配时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != PROTOCOL_VERSION:
+            return None
+        host, port = data["address"]
+        return (host, int(port)), binascii.unhexlify(data["authkey"])
+    except (OSError, ValueError, KeyError, TypeError, binascii.Error):
+        return None
+
+def _pnp_id_from_param_path(reg_path: str) -> str:
+    """SYSTEM\\CurrentControlSet\\Enum\\<pnp_id>\\Device Parameters -> <pnp_id>"""
+    return reg_path[len(ENUM_ROOT) + 1:].rsplit("\\", 1)[0]
+
+class Agent:
+    """
+    代理的状态与请求处理，与传输层无关 (handle() 直接接受 / 返回字典)。
+    设备列表由 IncrementalScanner 维护，插拔事件经 HotplugMonitor 增量合并；
+    参数取值经 StateCache 缓存 (有 watcher 时)，外部修改时推送 params 事件。
+    """
+
+    def __init__(self, backend=None, watcher=None, event_source=None, restarter=None):
+        self.backend = backend or WIN32_BACKEND
+        self.scanner = IncrementalScanner(self.backend)
+        self.restarter = restarter or DeviceRestarter(self.backend)
+        self.state_cache = StateCache(self.backend, watcher, on_change=self._on_params_changed)
+        self.apply_coordinator = ApplyCoordinator(self.backend, on_result=self._on_applied, restarter=self.restarter)
+        self.hotplug = HotplugMonitor(event_source, self.scanner) if event_source else None
+        self.devices = DeviceIndex()
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()        # devices / scanner
+        self._apply_lock = threading.Lock()  # 同步修改逐个执行
+        self._subscribers = []
+
+    def start(self):
+        """首次完整扫描并开始接收插拔通知"""
+        self.refresh()
+        if self.hotplug and not self.hotplug.start(self.devices):
+            self.hotplug = None
+
+    def refresh(self):
+        with self._lock:
+            self.devices = DeviceIndex(self.scanner.scan())
+            devices = list(self.devices)
+        self.state_cache.watch(dev.reg_path for dev in devices)
+        if self.hotplug:
+            self.hotplug.reset(devices)
+        self.publish({"event": "devices", "devices": self._describe(devices)})
+
+    def poll(self):
+        """把积累的插拔事件应用到设备列表 (由服务线程定期调用)"""
+        if not self.hotplug:
+            return
+        with self._lock:
+            # 监视器与 refresh() 共用 self.scanner 的 devnode 快照，探测新设备时不能与扫描同时进行
+            deltas = self.hotplug.poll()
+            if not deltas:
+                return
+            for kind, item in deltas:
+                if kind == "added":
+                    self.devices.add(item)
+                else:
+                    self.devices.discard(item)
+            devices = list(self.devices)
+        self.state_cache.watch(dev.reg_path for dev in devices)
+        self.publish({"event": "devices", "devices": self._describe(devices)})
+
+    # === 订阅 ===
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except OSError:
+                # 客户端已断开
+                self.unsubscribe(callback)
+
+    def _on_applied(self, result: dict):
+        self.state_cache.invalidate(f"{ENUM_ROOT}\\{result['pnp_id']}\\Device Parameters")
+        self.publish({"event": "applied", "results": [result]})
+
+    def _on_params_changed(self, reg_path: str):
+        self.publish({"event": "params", "pnp_id": _pnp_id_from_param_path(reg_path),
+                      "params": self.state_cache.get_params(reg_path)})
+
+    # === 请求处理 ===
+
+    def handle(self, request: dict) -> dict:
+        """处理一个请求，总是返回响应字典 (不抛出异常)"""
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise AgentError("请求必须是 JSON 对象")
+            handler = getattr(self, f"_op_{request.get('op')}", None)
+            if handler is None:
+                raise AgentError(f"未知的操作: {request.get('op')}")
+            return {"id": request_id, "ok": True, "result": handler(request)}
+        except AgentError as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:
+            print(f"Error: 代理处理请求失败: {e}")
+            return {"id": request_id, "ok": False, "error": f"代理内部错误: {e}"}
+
+    def _describe(self, devices) -> list:
+        return [dict(dev.to_dict(), params=self.state_cache.get_params(dev.reg_path)) for dev in devices]
+
+    def _op_ping(self, request):
+        return {"version": PROTOCOL_VERSION, "pid": os.getpid(), "devices": len(self.devices)}
+
+    def _op_list(self, request):
+        if request.get("refresh"):
+            self.refresh()
+        with self._lock:
+            devices = list(self.devices)
+        return self._describe(devices)
+
+    def _op_get(self, request):
+        pnp_id = request.get("pnp_id")
+        if not isinstance(pnp_id, str) or pnp_id.count("\\") < 2:
+            raise AgentError(f"无效的 pnp_id: {pnp_id}")
+        device = self.devices.get(pnp_id) or DeviceRecord.from_pnp_id(pnp_id, "")
+        params = self.state_cache.get_params(device.reg_path)
+        # 参数键不存在与空的参数键在 StateCache 中都是 {}，与命令行的本地路径一致返回 None
+        return params or None
+
+    def _op_set(self, request):
+        target, values = request.get("target"), request.get("values")
+        if not isinstance(target, str) or not target:
+            raise AgentError("缺少 target")
+        if (not isinstance(values, dict) or not values
+                or any(name not in WHEEL_PARAMETERS or value not in (0, 1) for name, value in values.items())):
+            raise AgentError(f"无效的 values: {values}")
+        restart_mode = request.get("restart_mode", RESTART_SHARED_PARENT)
+        if restart_mode not in (RESTART_EACH_CHILD, RESTART_SHARED_PARENT):
+            raise AgentError(f"未知的重启模式: {restart_mode}")
+
+        with self._lock:
+            targets = find_targets(self.devices, target)
+        if not request.get("wait", True):
+            for device in targets:
+                self.apply_coordinator.submit(device, values)
+            return {"queued": [device.pnp_id for device in targets]}
+
+        with self._apply_lock:
+            results = apply_to_devices(targets, values, self.backend, restart=False)
+            if request.get("restart", True):
+                planner = RestartPlanner(self.backend, restart_mode)
+                outcomes = planner.execute(planner.plan([r["pnp_id"] for r in results if r["written"]]),
+                                           restarter=self.restarter)
+                for r in results:
+                    r["restart"] = outcomes.get(r["pnp_id"])
+        for device in targets:
+            self.state_cache.invalidate(device.reg_path)
+        if results:
+            self.publish({"event": "applied", "results": results})
+        return results
+
+    def _op_shutdown(self, request):
+        self.stopped.set()
+        return None
+
+class _Channel:
+    """一个客户端连接：发送加锁，事件推送和响应可能来自不同线程"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    def send(self, message: dict):
+        data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self.conn.send_bytes(data)
+
+    def recv(self) -> dict:
+        return json.loads(self.conn.recv_bytes().decode("utf-8"))
+
+def _connect(address, authkey: bytes, timeout: float) -> Connection:
+    """
+    与 multiprocessing.connection.Client 相同的连接和双向 HMAC 握手，但连接和等待握手都有超时：
+    代理没有响应时抛出 AgentError，而不是无限期阻塞。
+    """
+    sock = socket.create_connection(tuple(address), timeout=timeout)
+    sock.settimeout(None)
+    conn = Connection(sock.detach())
+    try:
+        if not conn.poll(timeout):
+            raise AgentError(f"代理在 {timeout:.0f} 秒内没有完成握手")
+        answer_challenge(conn, authkey)
+        deliver_challenge(conn, authkey)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+class AgentServer:
+    """
+    在回环地址上接受连接，每个连接一个线程；serve_forever() 在调用线程上轮询插拔事件。
+    authkey 握手在各连接自己的线程上进行，握手失败或中途断开的连接不会影响接受其他连接。
+    """
+
+    def __init__(self, agent: Agent, address=("127.0.0.1", 0), authkey: bytes = None):
+        self.agent = agent
+        self.authkey = authkey or os.urandom(32)
+        # 默认 backlog 为 1，连续到达的连接会被丢弃并等待 TCP 重传 (约 1 秒)
+        self._listener = Listener(address, family="AF_INET", backlog=AGENT_BACKLOG)
+        self.address = self._listener.address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self, poll_interval: float = AGENT_POLL_INTERVAL):
+        self.start()
+        try:
+            while not self.agent.stopped.wait(poll_interval):
+                self.agent.poll()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.agent.stopped.set()
+        self._listener.close()
+
+    def _accept_loop(self):
+        while not self.agent.stopped.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self.agent.stopped.is_set():
+                    return  # 监听已关闭
+                continue
+            threading.Thread(target=self._serve_connection, args=(_Channel(conn),), daemon=True).start()
+
+    def _serve_connection(self, channel: _Channel):
+        subscribed = None
+        try:
+            deliver_challenge(channel.conn, self.authkey)
+            answer_challenge(channel.conn, self.authkey)
+            while True:
+                try:
+                    request = channel.recv()
+                except ValueError:
+                    channel.send({"id": None, "ok": False, "error": "无法解析的请求"})
+                    continue
+                if isinstance(request, dict) and request.get("op") == "subscribe":
+                    channel.send({"id": request.get("id"), "ok": True, "result": None})
+                    if subscribed is None:
+                        subscribed = channel.send
+                        self.agent.subscribe(subscribed)
+                    continue
+                channel.send(self.agent.handle(request))
+        except (EOFError, OSError, AuthenticationError):
+            pass  # 客户端断开或握手失败
+        finally:
+            if subscribed is not None:
+                self.agent.unsubscribe(subscribed)
+            channel.conn.close()
+
+class AgentClient:
+    """不需要管理员权限的客户端；所有方法在代理返回错误时抛出 AgentError"""
+
+    def __init__(self, address, authkey: bytes, timeout: float = AGENT_TIMEOUT,
+                 connect_timeout: float = AGENT_CONNECT_TIMEOUT):
+        self.timeout = timeout
+        self._channel = _Channel(_connect(address, authkey, connect_timeout))
+        self._next_id = 0
+
+    @classmethod
+    def connect(cls, info_path: str = None, timeout: float = AGENT_TIMEOUT):
+        """按 agent.json 连接正在运行的代理，没有代理 (或无法连接) 时返回 None"""
+        info = read_agent_info(info_path or agent_info_path())
+        if info is None:
+            return None
+        try:
+            return cls(info[0], info[1], timeout)
+        except (OSError, EOFError, AuthenticationError, AgentError):
+            return None
+
+    def close(self):
+        self._channel.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def call(self, op: str, **params):
+        self._next_id += 1
+        request_id = self._next_id
+        self._channel.send(dict(params, id=request_id, op=op))
+        while True:
+            if not self._channel.conn.poll(self.timeout):
+                raise AgentError(f"代理在 {self.timeout:.0f} 秒内没有响应")
+            try:
+                message = self._channel.recv()
+            except (EOFError, OSError) as e:
+                raise AgentError(f"与代理的连接已断开: {e}") from e
+            if message.get("id") != request_id:
+                continue  # 订阅之前残留的事件
+            if not message.get("ok"):
+                raise AgentError(message.get("error") or "未知错误")
+            return message.get("result")
+
+    def ping(self) -> dict:
+        return self.call("ping")
+
+    def list(self, refresh: bool = False) -> list:
+        return self.call("list", refresh=refresh)
+
+    def get(self, pnp_id: str):
+        return self.call("get", pnp_id=pnp_id)
+
+    def set(self, target: str, values: dict, restart: bool = True, restart_mode: str = RESTART_SHARED_PARENT,
+            wait: bool = True):
+        return self.call("set", target=target, values=values, restart=restart, restart_mode=restart_mode, wait=wait)
+
+    def shutdown(self):
+        return self.call("shutdown")
+
+    def subscribe(self):
+        """订阅事件，返回事件字典的迭代器 (阻塞等待；连接断开时结束)"""
+        self.call("subscribe")
+        while True:
+            try:
+                yield self._channel.recv()
+            except (EOFError, OSError):
+                return
+
+def run_agent(simulate: int = None, info_path: str = None) -> int:
+    """启动代理并阻塞到 shutdown / Ctrl+C；simulate 为模拟树的实例数量"""
+    if simulate is not None:
+        from simulator import SimulatedBackend
+        backend = SimulatedBackend.generate(simulate)
+        agent = Agent(backend, restarter=DeviceRestarter(backend, clock=backend.clock, sleep=backend.sleep))
+    else:
+        agent = Agent(watcher=Win32RegistryWatcher(), event_source=Win32DeviceEventSource())
+    agent.start()
+
+    server = AgentServer(agent)
+    info_path = info_path or agent_info_path()
+    write_agent_info(info_path, server.address, server.authkey)
+    print(f"代理已启动: {server.address[0]}:{server.address[1]}，{len(agent.devices)} 个设备")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        try:
+            os.remove(info_path)
+        except OSError:
+            pass
+    return 0
@@ -0,0 +1,488 @@
+"""
+基于 simulator.py 的性能基准 (不需要 Windows)：在 10 / 1k / 10k / 100k 个实例的模拟树上测量
+扫描耗时、每个设备的后端调用次数、内存峰值和重启延迟，并与保存的基线对比。
+
+    python benchmark.py                    # 运行并与 benchmark_baseline.json 对比，有退化时返回 1
+    python benchmark.py --update-baseline  # 用本次结果覆盖基线
+    python benchmark.py --sizes 10 1000    # 只跑部分规模
+
+场景：
+    scan         CM_Get_Device_ID_List 批量扫描 (MouseEnumerator.scan)
+    scan_walk    没有批量接口时逐实例遍历注册表
+    rewalk       同一个 MouseEnumerator 的第二次遍历 (GhostIndex 跳过幽灵实例)
+    rescan       IncrementalScanner 在树没有变化时的第二次扫描
+    rescan_walk  没有批量接口时 IncrementalScanner 的第二次扫描
+    first_device 没有批量接口时 iter_scan() 产出第一个设备的耗时 (幽灵实例占绝大多数的树)
+    startup_cold   启动到第一次显示列表：没有缓存时的一次冷扫描 (MouseEnumerator.scan)
+    startup_cached 启动到第一次显示列表：DeviceCache.load + validate (之后再在后台完整扫描)
+    scan_native  scan 改走 Win32Backend + cfgmgr.py 绑定，cfgmgr32 换成 SimulatedCfgMgr32 (注册表仍用模拟器)
+    restart      DeviceRestarter 重启一个设备 (虚拟时钟)
+    list_keyed   KeyedDeviceList 渲染 N 个设备 (无界面控件)
+    list_virtual VirtualDeviceList 渲染 N 个设备 (无界面控件)
+    records      创建 N 条 DeviceRecord、建立 DeviceIndex 并逐个按 PNP ID 查找
+    agent_toggle 通过本地代理 (agent.py，回环连接) 反复切换一个设备的滚轮方向，含重启
+    provision    按 VID/PID 通配符批量预置全部实例 (含幽灵实例)，只重启在线的设备
+    import_cli   子进程中 python -X importtime -c "import cli" (与规模无关，只运行一次)
+    import_gui   同上，import gui；缺少 customtkinter 时跳过
+
+指标：
+    wall_ms           实际耗时 (多次取最小值)，只反映 Python 侧开销；agent_toggle 为每次切换的往返耗时。
+                      只显示并记入基线，不参与退化判断
+    api_ms            按模拟器 latency 累计的系统调用耗时 (虚拟时间，可复现)
+    calls_per_device  后端调用次数 / 找到的设备数 (restart、agent_toggle 为每次操作的调用次数，first_device 为第一个设备之前的调用次数，
+                      provision 为每个被修改实例的调用次数，scan_native 为 CM_* 原生调用次数)
+    peak_kb           tracemalloc 记录的内存峰值
+    restart_ms        重启的禁用 + 启用延迟 (虚拟时间)
+    bytes_per_device  records 场景中每条记录 (含索引) 占用的内存
+    buffers_per_device scan_native 中 cfgmgr.py 新分配的缓冲区个数 / 找到的设备数
+    widgets_initial   首次渲染创建的控件数
+    widgets_refresh   刷新 (移除一个、新增一个设备) 时创建的控件数
+    configure_refresh 刷新时 configure / select / deselect 的调用次数
+    configure_select  切换选中项时的调用次数
+    gui_modules       导入时加载的 tkinter / customtkinter 模块数 (命令行路径必须为 0)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import instrumentation
+from agent import Agent, AgentClient, AgentServer
+from device_list import KeyedDeviceList, VirtualDeviceList
+from cfgmgr import CfgMgr32
+from devices import (
+    PARAM_WHEEL,
+    DeviceCache,
+    DeviceIndex,
+    DeviceRecord,
+    DeviceRestarter,
+    IncrementalScanner,
+    MouseEnumerator,
+    Win32Backend,
+)
+from profiles import Profile, ProfileRule
+from provisioning import import_plan
+from simulator import SimulatedBackend, SimulatedCfgMgr32
+
+BASELINE_VERSION = 1
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_SIZES = (10, 1000, 10000, 100000)
+
+# 只显示、不与基线对比的指标：wall_ms 受机器和负载影响，无法稳定判断退化
+REPORTED_ONLY = ("wall_ms",)
+# 可复现指标允许相对基线变差的比例
+TOLERANCES = {
+    "api_ms": 0.01,
+    "calls_per_device": 0.01,
+    "peak_kb": 0.25,
+    "restart_ms": 0.01,
+    "bytes_per_device": 0.1,
+    "buffers_per_device": 0.01,
+    "widgets_initial": 0.0,
+    "widgets_refresh": 0.0,
+    "configure_refresh": 0.0,
+    "configure_select": 0.0,
+    "gui_modules": 0.0,
+}
+# import_* 场景中视为 GUI 依赖的顶层模块
+GUI_MODULES = ("tkinter", "_tkinter", "customtkinter")
+# agent_toggle 中每轮切换的次数
+AGENT_TOGGLES = 20
+
+def _repeats(size: int) -> int:
+    return 5 if size <= 1000 else 1
+
+def _measure_scan(size: int, make_scanner, bulk_list: bool = True, warm: bool = False) -> dict:
+    sim = SimulatedBackend.generate(size, bulk_list=bulk_list)
+
+    def prepare():
+        # 每次计时都用新的扫描器，warm 时先扫描一次填充缓存
+        scanner = make_scanner(sim)
+        if warm:
+            scanner.scan()
+        return scanner
+
+    best = None
+    for _ in range(_repeats(size)):
+        scanner = prepare()
+        recorder = instrumentation.enable()
+        start_api = sim.now
+        start = time.perf_counter()
+        devices = scanner.scan()
+        elapsed = time.perf_counter() - start
+        instrumentation.disable()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, sim.now - start_api, sum(recorder.counters.values()), len(devices))
+    elapsed, api_time, calls, found = best
+
+    scanner = prepare()
+    tracemalloc.start()
+    scanner.scan()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_ms": elapsed * 1000,
+        "api_ms": api_time * 1000,
+        "calls_per_device": calls / max(found, 1),
+        "peak_kb": peak / 1024,
+        "devices": found,
+    }
+
+def _measure_first_device(size: int) -> dict:
+    sim = SimulatedBackend.generate(size, bulk_list=False)
+    best = None
+    for _ in range(_repeats(size)):
+        scan = MouseEnumerator(sim).iter_scan()
+        recorder = instrumentation.enable()
+        start_api = sim.now
+        start = time.perf_counter()
+        first = next(scan, None)
+        elapsed = time.perf_counter() - start
+        # 取到第一个设备后取消：之后不应再有后端调用
+        calls = sum(recorder.counters.values())
+        scan.close()
+        instrumentation.disable()
+        if first is None:
+            raise RuntimeError("流式扫描没有找到任何设备")
+        if sum(recorder.counters.values()) != calls:
+            raise RuntimeError("取消流式扫描后仍有后端调用")
+        if best is None or elapsed < best[0]:
+            best = (elapsed, sim.now - start_api, calls)
+    elapsed, api_time, calls = best
+    return {
+        "wall_ms": elapsed * 1000,
+        "api_ms": api_time * 1000,
+        "calls_per_device": float(calls),
+    }
+
+def _measure_startup(size: int, cached: bool) -> dict:
+    sim = SimulatedBackend.generate(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DeviceCache(os.path.join(tmp, "device_cache.json"))
+        cache.save(MouseEnumerator(sim).scan())
+        best = None
+        for _ in range(_repeats(size)):
+            recorder = instrumentation.enable()
+            start_api = sim.now
+            start = time.perf_counter()
+            if cached:
+                devices = DeviceCache.validate(cache.load(), sim)
+            else:
+                devices = MouseEnumerator(sim).scan()
+            elapsed = time.perf_counter() - start
+            instrumentation.disable()
+            if best is None or elapsed < best[0]:
+                best = (elapsed, sim.now - start_api, sum(recorder.counters.values()), len(devices))
+    elapsed, api_time, calls, found = best
+    return {
+        "wall_ms": elapsed * 1000,
+        "api_ms": api_time * 1000,
+        "calls_per_device": calls / max(found, 1),
+        "devices": found,
+    }
+
+class _NativeBackend(Win32Backend):
+    """CfgMgr32 部分走真实的 Win32Backend + ctypes 绑定 (库为 SimulatedCfgMgr32)，注册表部分转给模拟器"""
+
+    def __init__(self, sim: SimulatedBackend):
+        self.library = SimulatedCfgMgr32(sim)
+        super().__init__(CfgMgr32(self.library))
+        for name in ("enum_subkeys", "enum_subkey_info", "query_key_info", "write_values", "read_all_values", "query_values"):
+            setattr(self, name, getattr(sim, name))
+
+def _measure_scan_native(size: int) -> dict:
+    sim = SimulatedBackend.generate(size)
+    best = None
+    for _ in range(_repeats(size)):
+        # 每次都用新的绑定：首次分配的缓冲区也计入
+        backend = _NativeBackend(sim)
+        recorder = instrumentation.enable()
+        start = time.perf_counter()
+        devices = MouseEnumerator(backend).scan()
+        elapsed = time.perf_counter() - start
+        instrumentation.disable()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, sum(backend.library.calls.values()), recorder.counters.get("alloc.cfgmgr", 0), len(devices))
+    elapsed, calls, buffers, found = best
+    return {
+        "wall_ms": elapsed * 1000,
+        "calls_per_device": calls / max(found, 1),
+        "buffers_per_device": buffers / max(found, 1),
+        "devices": found,
+    }
+
+def _measure_restart(size: int) -> dict:
+    sim = SimulatedBackend.generate(size)
+    devices = MouseEnumerator(sim).scan()
+    restarter = DeviceRestarter(sim, clock=sim.clock, sleep=sim.sleep)
+    recorder = instrumentation.enable()
+    result = restarter.restart(devices[0].pnp_id)
+    instrumentation.disable()
+    if not result["ok"]:
+        raise RuntimeError(f"模拟重启失败: {result['error']}")
+    return {
+        "restart_ms": (result["disable_latency"] + result["enable_latency"]) * 1000,
+        "calls_per_device": float(sum(recorder.counters.values())),
+    }
+
+def _measure_agent_toggle(size: int) -> dict:
+    sim = SimulatedBackend.generate(size)
+    agent = Agent(sim, restarter=DeviceRestarter(sim, clock=sim.clock, sleep=sim.sleep))
+    agent.start()
+    server = AgentServer(agent)
+    server.start()
+    try:
+        with AgentClient(server.address, server.authkey) as client:
+            target = client.list()[0]["pnp_id"]
+            best = None
+            for _ in range(_repeats(size)):
+                recorder = instrumentation.enable()
+                start = time.perf_counter()
+                for i in range(AGENT_TOGGLES):
+                    results = client.set(target, {PARAM_WHEEL: i % 2})
+                    if not (results and results[0]["restart"] and results[0]["restart"]["ok"]):
+                        raise RuntimeError(f"通过代理切换失败: {results}")
+                elapsed = time.perf_counter() - start
+                instrumentation.disable()
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, sum(recorder.counters.values()))
+    finally:
+        server.stop()
+    return {
+        "wall_ms": best[0] / AGENT_TOGGLES * 1000,
+        "calls_per_device": best[1] / AGENT_TOGGLES,
+    }
+
+# 模拟树中幽灵型号的 VID 为 10xx，在线接收器为 046D:C52x
+_PROVISION_PLAN = Profile([ProfileRule({"vid": "10*"}, "mac"), ProfileRule({"vid": "046D", "pid": "C5*"}, "mac", "on")])
+
+def _measure_provision(size: int) -> dict:
+    best = None
+    for _ in range(_repeats(size)):
+        # 导入会修改树，每次都从新生成的树开始
+        sim = SimulatedBackend.generate(size)
+        restarter = DeviceRestarter(sim, clock=sim.clock, sleep=sim.sleep)
+        recorder = instrumentation.enable()
+        start_api = sim.now
+        start = time.perf_counter()
+        result = import_plan(_PROVISION_PLAN, sim, restarter=restarter)
+        elapsed = time.perf_counter() - start
+        instrumentation.disable()
+        if result["failed"] or not all(outcome["ok"] for outcome in result["restarts"].values()):
+            raise RuntimeError(f"模拟预置失败: {result['failed']}")
+        if best is None or elapsed < best[0]:
+            best = (elapsed, sim.now - start_api, sum(recorder.counters.values()), len(result["written"]))
+    elapsed, api_time, calls, written = best
+    return {
+        "wall_ms": elapsed * 1000,
+        "api_ms": api_time * 1000,
+        "calls_per_device": calls / max(written, 1),
+        "devices": written,
+    }
+
+class _HeadlessWidget:
+    """无界面环境下代替 CustomTkinter 控件：接受所有调用但什么都不做"""
+
+    def __init__(self, *args, **kwargs):
+        self.checked = 0
+
+    def pack(self, **kwargs): pass
+    def pack_forget(self): pass
+    def configure(self, **kwargs): pass
+    def destroy(self): pass
+    def bind(self, *args): pass
+    def set(self, *args): pass
+    def select(self): self.checked = 1
+    def deselect(self): self.checked = 0
+    def get(self): return self.checked
+
+class _HeadlessWidgets:
+    CTkFrame = CTkScrollableFrame = CTkCheckBox = CTkButton = CTkLabel = CTkScrollbar = _HeadlessWidget
+
+_LIST_THEME = {key: "#000000" for key in ("text_main", "text_sub", "list_hover", "list_selected", "accent")}
+
+def _synthetic_pnp_ids(size: int):
+    """按模拟器的比例生成实例 ID：少量型号 (device-ID) 下挂大量实例"""
+    for i in range(size):
+        yield f"HID\\VID_046D&PID_{0xC52B + i % 16:04X}&MI_01&COL01\\7&{i:08x}&0&0000"
+
+def _measure_records(size: int) -> dict:
+    pnp_ids = list(_synthetic_pnp_ids(size))
+    best = None
+    for _ in range(_repeats(size)):
+        start = time.perf_counter()
+        index = DeviceIndex(DeviceRecord.from_pnp_id(pnp_id, "USB Receiver", {"FlipFlopWheel": 0}) for pnp_id in pnp_ids)
+        found = sum(1 for pnp_id in pnp_ids if index.get(pnp_id) is not None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    if found != size:
+        raise RuntimeError(f"DeviceIndex 只找到 {found}/{size} 个设备")
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    index = DeviceIndex(DeviceRecord.from_pnp_id(pnp_id, "USB Receiver", {"FlipFlopWheel": 0}) for pnp_id in pnp_ids)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "wall_ms": best * 1000,
+        "peak_kb": peak / 1024,
+        "bytes_per_device": (after - before) / size,
+        "devices": len(index),
+    }
+
+def _measure_list(size: int, list_class) -> dict:
+    devices = [DeviceRecord.from_pnp_id(pnp_id, f"Mouse {i}") for i, pnp_id in enumerate(_synthetic_pnp_ids(size))]
+    device_list = list_class(None, _HeadlessWidgets, _LIST_THEME, on_select=lambda pnp_id: None,
+                             on_check=lambda pnp_id, checked: None)
+    device_list.sync(devices, set())
+    initial = device_list.created
+
+    # 一次刷新：拔掉一个设备、插入一个新设备，其余不变
+    refreshed = devices[1:] + [DeviceRecord.from_pnp_id(devices[0].pnp_id + "_NEW", devices[0].name)]
+    created, configured = device_list.created, device_list.configured
+    device_list.sync(refreshed, set())
+    refresh = (device_list.created - created, device_list.configured - configured)
+
+    device_list.select(refreshed[0].pnp_id)
+    configured = device_list.configured
+    device_list.select(refreshed[min(1, size - 1)].pnp_id)
+    return {
+        "widgets_initial": initial,
+        "widgets_refresh": refresh[0],
+        "configure_refresh": refresh[1],
+        "configure_select": device_list.configured - configured,
+    }
+
+def _import_times(module: str):
+    """在新的解释器中导入 module，返回 -X importtime 报告的 {模块名: 累计耗时 ms}；导入失败时返回 None"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1000
+    return times
+
+def _measure_imports() -> dict:
+    results = {}
+    for module in ("cli", "gui"):
+        best = None
+        for _ in range(3):
+            times = _import_times(module)
+            if times is None:
+                break
+            if best is None or times[module] < best[module]:
+                best = times
+        if best is None:
+            print(f"跳过 import_{module}: 无法导入 (缺少依赖?)", file=sys.stderr)
+            continue
+        gui_modules = sum(1 for name in best if name.split(".")[0] in GUI_MODULES)
+        if module == "cli" and gui_modules:
+            raise RuntimeError(f"命令行路径加载了 GUI 模块: {[name for name in best if name.split('.')[0] in GUI_MODULES]}")
+        results[f"import_{module}"] = {"wall_ms": best[module], "gui_modules": gui_modules}
+    return results
+
+SCENARIOS = {
+    "scan": lambda size: _measure_scan(size, MouseEnumerator),
+    "scan_walk": lambda size: _measure_scan(size, MouseEnumerator, bulk_list=False),
+    "rewalk": lambda size: _measure_scan(size, MouseEnumerator, bulk_list=False, warm=True),
+    "rescan": lambda size: _measure_scan(size, IncrementalScanner, warm=True),
+    "rescan_walk": lambda size: _measure_scan(size, IncrementalScanner, bulk_list=False, warm=True),
+    "first_device": _measure_first_device,
+    "startup_cold": lambda size: _measure_startup(size, cached=False),
+    "startup_cached": lambda size: _measure_startup(size, cached=True),
+    "scan_native": _measure_scan_native,
+    "restart": _measure_restart,
+    "list_keyed": lambda size: _measure_list(size, KeyedDeviceList),
+    "list_virtual": lambda size: _measure_list(size, VirtualDeviceList),
+    "records": _measure_records,
+    "agent_toggle": _measure_agent_toggle,
+    "provision": _measure_provision,
+}
+
+def run_benchmarks(sizes) -> dict:
+    results = {}
+    for size in sizes:
+        for name, measure in SCENARIOS.items():
+            results[f"{name}@{size}"] = measure(size)
+    results.update(_measure_imports())
+    return results
+
+def compare(results: dict, baseline: dict) -> list:
+    """返回退化列表 [(基准名, 指标, 基线值, 本次值)]；基线中没有的基准不参与对比"""
+    regressions = []
+    for bench, metrics in results.items():
+        expected = baseline.get(bench)
+        if expected is None:
+            continue
+        for metric, tolerance in TOLERANCES.items():
+            if metric not in metrics or metric not in expected:
+                continue
+            if metrics[metric] > expected[metric] * (1 + tolerance) + 1e-9:
+                regressions.append((bench, metric, expected[metric], metrics[metric]))
+    return regressions
+
+def format_results(results: dict) -> str:
+    columns = [metric for metric in (*REPORTED_ONLY, *TOLERANCES) if any(metric in metrics for metrics in results.values())]
+    lines = [f"{'benchmark':<24}" + "".join(f"{c:>20}" for c in columns)]
+    for bench, metrics in results.items():
+        cells = "".join(f"{metrics[c]:>20.2f}" if c in metrics else f"{'-':>20}" for c in columns)
+        lines.append(f"{bench:<24}{cells}")
+    return "\n".join(lines)
+
+def load_baseline(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if data.get("version") != BASELINE_VERSION:
+        raise ValueError(f"不支持的基线版本: {data.get('version')}")
+    return data["results"]
+
+def save_baseline(path: str, results: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        rounded = {bench: {metric: round(value, 3) for metric, value in metrics.items()} for bench, metrics in results.items()}
+        json.dump({"version": BASELINE_VERSION, "results": rounded}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mouse Wheel Manager 模拟器基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="模拟树的实例数量")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes)
+    print(format_results(results))
+
+    if args.update_baseline:
+        baseline = load_baseline(args.baseline)
+        baseline.update(results)
+        save_baseline(args.baseline, baseline)
+        print(f"\n基线已更新: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"\n没有基线 ({args.baseline})，使用 --update-baseline 生成")
+        return 0
+    regressions = compare(results, baseline)
+    for bench, metric, expected, actual in regressions:
+        print(f"退化: {bench} {metric} {expected:.2f} -> {actual:.2f}", file=sys.stderr)
+    if not regressions:
+        print("\n与基线相比没有退化")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+CfgMgr32 的 ctypes 绑定层：函数原型只声明一次，出参和缓冲区按线程复用，CONFIGRET 映射为异常。
+
+    binding = CfgMgr32(ctypes.windll.cfgmgr32)
+    dev_inst = binding.locate_devnode("HID\\VID_046D&PID_C52B&MI_01&COL01\\7&...")
+    name = binding.get_property(dev_inst, DEVPKEY_FriendlyName)
+
+与直接调用 windll.cfgmgr32 相比：
+    - PROTOTYPES 中的 argtypes / restype 在 bind_prototypes() 时设置一次，参数按原型转换 (出参直接传 c_ulong)
+    - 每个线程一组出参 (c_ulong) 和一个只增不减的字符缓冲区，每次调用不再新建 ctypes 对象
+    - 属性读取按属性键记住所需大小，缓冲区足够时一次调用完成，不再先探测大小
+    - 返回值不是 CR_SUCCESS 时抛出 ConfigRetError 的子类 (按 CONFIGRET_ERRORS 映射)
+
+library 可以是任何带有同名可调用属性、并允许设置 argtypes / restype 的对象，
+例如 simulator.SimulatedCfgMgr32 (用 CFUNCTYPE 回调实现的假库)。
+新分配 (或扩大) 的缓冲区计入 instrumentation 计数器 alloc.cfgmgr。
+"""
+import ctypes
+import threading
+from ctypes import wintypes
+
+import instrumentation
+
+# =========================================================================
+# 常量与结构体
+# =========================================================================
+
+CR_SUCCESS = 0x00000000
+CR_OUT_OF_MEMORY = 0x00000002
+CR_INVALID_POINTER = 0x00000003
+CR_INVALID_FLAG = 0x00000004
+CR_INVALID_DEVNODE = 0x00000005
+CR_NO_SUCH_DEVNODE = 0x0000000D
+CR_FAILURE = 0x00000013
+CR_REMOVE_VETOED = 0x00000017
+CR_BUFFER_SMALL = 0x0000001A
+CR_INVALID_DEVICE_ID = 0x0000001E
+CR_INVALID_DATA = 0x0000001F
+CR_NO_SUCH_VALUE = 0x00000025
+CR_NOT_DISABLEABLE = 0x00000028
+CR_ACCESS_DENIED = 0x00000033
+CR_CALL_NOT_IMPLEMENTED = 0x00000034
+CR_INVALID_PROPERTY = 0x00000035
+
+DN_STARTED = 0x00000008
+# CM_Get_Device_ID_List 过滤标志：按 ClassGUID 过滤 + 仅返回在线设备
+CM_GETIDLIST_FILTER_PRESENT = 0x00000100
+CM_GETIDLIST_FILTER_CLASS = 0x00000200
+# 设备实例 ID 的最大长度 (含结尾的 \0)
+MAX_DEVICE_ID_LEN = 200
+# 没有记录过大小的属性先用这么大的缓冲区 (字节)，友好名称通常远小于此
+DEFAULT_PROPERTY_BYTES = 512
+
+DEVINST = wintypes.DWORD
+CONFIGRET = wintypes.DWORD
+PULONG = ctypes.POINTER(wintypes.ULONG)
+
+class GUID(ctypes.Structure):
+    _fields_ = [("Data1", ctypes.c_ulong), ("Data2", ctypes.c_ushort),
+                ("Data3", ctypes.c_ushort), ("Data4", ctypes.c_ubyte * 8)]
+
+class DEVPROPKEY(ctypes.Structure):
+    _fields_ = [("fmtid", GUID), ("pid", ctypes.c_ulong)]
+
+# DEVPKEY_Device_FriendlyName
+guid_friendly = GUID(0xa45c254e, 0xdf1c, 0x4efd, (ctypes.c_ubyte * 8)(0x80, 0x20, 0x67, 0xd1, 0x46, 0xa8, 0x50, 0xe0))
+DEVPKEY_FriendlyName = DEVPROPKEY(guid_friendly, 14)
+
+# 函数名 -> (restype, argtypes)；出参统一声明为 PULONG，调用时直接传 c_ulong
+PROTOTYPES = {
+    "CM_Locate_DevNodeW": (CONFIGRET, [PULONG, wintypes.LPCWSTR, wintypes.ULONG]),
+    "CM_Get_DevNode_Status": (CONFIGRET, [PULONG, PULONG, DEVINST, wintypes.ULONG]),
+    "CM_Get_Parent": (CONFIGRET, [PULONG, DEVINST, wintypes.ULONG]),
+    "CM_Get_Device_IDW": (CONFIGRET, [DEVINST, wintypes.LPWSTR, wintypes.ULONG, wintypes.ULONG]),
+    "CM_Get_Device_ID_List_SizeW": (CONFIGRET, [PULONG, wintypes.LPCWSTR, wintypes.ULONG]),
+    "CM_Get_Device_ID_ListW": (CONFIGRET, [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.ULONG, wintypes.ULONG]),
+    "CM_Get_DevNode_PropertyW": (CONFIGRET, [DEVINST, ctypes.POINTER(DEVPROPKEY), PULONG, ctypes.c_void_p, PULONG,
+                                             wintypes.ULONG]),
+    "CM_Disable_DevNode": (CONFIGRET, [DEVINST, wintypes.ULONG]),
+    "CM_Enable_DevNode": (CONFIGRET, [DEVINST, wintypes.ULONG]),
+}
+
+def bind_prototypes(library):
+    """为 library 上的 PROTOTYPES 函数设置 argtypes / restype；缺少的函数 (旧系统) 跳过"""
+    for name, (restype, argtypes) in PROTOTYPES.items():
+        function = getattr(library, name, None)
+        if function is None:
+            continue
+        function.restype = restype
+        function.argtypes = argtypes
+    return library
+
+# =========================================================================
+# CONFIGRET -> 异常
+# =========================================================================
+
+class ConfigRetError(OSError):
+    """CfgMgr32 调用返回了 CR_SUCCESS 以外的值；code 为原始 CONFIGRET，function 为函数名"""
+
+    def __init__(self, code: int, function: str):
+        self.code = code
+        self.function = function
+        super().__init__(f"{function} 失败: {configret_name(code)} (0x{code:08X})")
+
+class NoSuchDevNodeError(ConfigRetError):
+    """devnode 不存在或句柄已失效 (设备已拔出)"""
+
+class NoSuchValueError(ConfigRetError):
+    """请求的属性在该设备上没有设置"""
+
+class BufferTooSmallError(ConfigRetError):
+    """重试后缓冲区仍然不够 (两次调用之间列表一直在增长)"""
+
+class VetoedError(ConfigRetError):
+    """禁用设备被拒绝 (有程序占用，或设备不允许禁用)"""
+
+class AccessDeniedError(ConfigRetError, PermissionError):
+    """需要管理员权限"""
+
+CONFIGRET_ERRORS = {
+    CR_INVALID_DEVNODE: NoSuchDevNodeError,
+    CR_NO_SUCH_DEVNODE: NoSuchDevNodeError,
+    CR_NO_SUCH_VALUE: NoSuchValueError,
+    CR_BUFFER_SMALL: BufferTooSmallError,
+    CR_REMOVE_VETOED: VetoedError,
+    CR_NOT_DISABLEABLE: VetoedError,
+    CR_ACCESS_DENIED: AccessDeniedError,
+}
+
+_CONFIGRET_NAMES = {value: name for name, value in globals().items() if name.startswith("CR_")}
+
+def configret_name(code: int) -> str:
+    return _CONFIGRET_NAMES.get(code, "CR_UNKNOWN")
+
+def check(ret: int, function: str):
+    """ret 不是 CR_SUCCESS 时抛出对应的 ConfigRetError 子类"""
+    if ret != CR_SUCCESS:
+        raise CONFIGRET_ERRORS.get(ret, ConfigRetError)(ret, function)
+
+# =========================================================================
+# 绑定
+# =========================================================================
+
+class _Scratch(threading.local):
+    """每个线程一份的出参和缓冲区 (重启在线程池中并行执行)"""
+
+    def __init__(self):
+        self.handle = wintypes.ULONG()
+        self.status = wintypes.ULONG()
+        self.problem = wintypes.ULONG()
+        self.prop_type = wintypes.ULONG()
+        self.size = wintypes.ULONG()
+        self.device_id = None  # MAX_DEVICE_ID_LEN 个字符，首次使用时分配
+        self.buffer = None     # 属性值 / ID 列表共用，只增不减
+
+class CfgMgr32:
+    """CfgMgr32 的类型化封装，失败时抛出 ConfigRetError；可以在多个线程中同时使用"""
+
+    def __init__(self, library):
+        self.library = bind_prototypes(library)
+        self._scratch = _Scratch()
+        self._property_sizes = {}  # bytes(DEVPROPKEY) -> 该属性出现过的最大字节数
+
+    def locate_devnode(self, pnp_id: str) -> int:
+        scratch = self._scratch
+        check(self.library.CM_Locate_DevNodeW(scratch.handle, pnp_id, 0), "CM_Locate_DevNodeW")
+        return scratch.handle.value
+
+    def get_status(self, dev_inst: int):
+        """返回 (DN_* 状态位, CM_PROB_* 问题代码)"""
+        scratch = self._scratch
+        check(self.library.CM_Get_DevNode_Status(scratch.status, scratch.problem, dev_inst, 0), "CM_Get_DevNode_Status")
+        return scratch.status.value, scratch.problem.value
+
+    def get_parent(self, dev_inst: int) -> int:
+        scratch = self._scratch
+        check(self.library.CM_Get_Parent(scratch.handle, dev_inst, 0), "CM_Get_Parent")
+        return scratch.handle.value
+
+    def get_device_id(self, dev_inst: int) -> str:
+        scratch = self._scratch
+        if scratch.device_id is None:
+            scratch.device_id = self._allocate(MAX_DEVICE_ID_LEN)
+        check(self.library.CM_Get_Device_IDW(dev_inst, scratch.device_id, MAX_DEVICE_ID_LEN, 0), "CM_Get_Device_IDW")
+        return scratch.device_id.value
+
+    def get_property(self, dev_inst: int, property_key: DEVPROPKEY) -> str:
+        """
+        读取字符串属性。缓冲区按该属性记录过的最大大小准备，通常一次调用完成；
+        返回 CR_BUFFER_SMALL 时按系统给出的大小扩大缓冲区再读一次。属性不存在时抛出 NoSuchValueError。
+        """
+        scratch = self._scratch
+        cache_key = bytes(property_key)
+        size = self._property_sizes.get(cache_key, DEFAULT_PROPERTY_BYTES)
+        while True:
+            buffer = self._buffer(scratch, size)
+            scratch.size.value = ctypes.sizeof(buffer)
+            ret = self.library.CM_Get_DevNode_PropertyW(dev_inst, property_key, scratch.prop_type, buffer, scratch.size, 0)
+            if ret != CR_BUFFER_SMALL or scratch.size.value <= ctypes.sizeof(buffer):
+                break
+            size = scratch.size.value
+            self._property_sizes[cache_key] = max(size, self._property_sizes.get(cache_key, 0))
+        check(ret, "CM_Get_DevNode_PropertyW")
+        return buffer.value
+
+    def get_device_id_list(self, filter_string: str, flags: int) -> list:
+        """CM_Get_Device_ID_List 返回的实例 ID 列表；两次调用之间列表变长时重试"""
+        scratch = self._scratch
+        for _ in range(3):
+            check(self.library.CM_Get_Device_ID_List_SizeW(scratch.size, filter_string, flags), "CM_Get_Device_ID_List_SizeW")
+            size = scratch.size.value
+            buffer = self._buffer(scratch, size * ctypes.sizeof(ctypes.c_wchar))
+            ret = self.library.CM_Get_Device_ID_ListW(filter_string, buffer, size, flags)
+            if ret == CR_BUFFER_SMALL:
+                continue
+            check(ret, "CM_Get_Device_ID_ListW")
+            # 返回值是以 \0 分隔、\0\0 结尾的 MULTI_SZ 字符串
+            return [s for s in buffer[:size].split("\0") if s]
+        raise BufferTooSmallError(CR_BUFFER_SMALL, "CM_Get_Device_ID_ListW")
+
+    def disable_devnode(self, dev_inst: int, flags: int = 0):
+        check(self.library.CM_Disable_DevNode(dev_inst, flags), "CM_Disable_DevNode")
+
+    def enable_devnode(self, dev_inst: int, flags: int = 0):
+        check(self.library.CM_Enable_DevNode(dev_inst, flags), "CM_Enable_DevNode")
+
+    def _buffer(self, scratch: _Scratch, size: int):
+        """当前线程的共用缓冲区，至少 size 字节"""
+        if scratch.buffer is None or ctypes.sizeof(scratch.buffer) < size:
+            scratch.buffer = self._allocate(-(-size // ctypes.sizeof(ctypes.c_wchar)))
+        return scratch.buffer
+
+    @staticmethod
+    def _allocate(chars: int):
+        instrumentation.count("alloc.cfgmgr")
+        return ctypes.create_unicode_buffer(chars)
@@ -0,0 +1,363 @@
+"""
+命令行 / 批处理入口 (登录脚本等无界面场景)。
+只依赖 devices 模块，不会加载 Tk / CustomTkinter。
+
+    python main.py list [--json]
+    python main.py get <pnp_id> [--json]
+    python main.py ghosts [--json]
+    python main.py set <pnp_id|名称通配符> [mac|windows] [--hscroll on|off] [--no-restart] [--dry-run]
+    python main.py apply-file <profile.json> [--no-restart] [--dry-run]
+    python main.py agent [--simulate N | --stop]
+    python main.py export <plan.json> [--online]
+    python main.py import <plan.json> [--reg <file.reg>] [--no-restart] [--dry-run]
+
+配置文件格式见 profiles.py，export / import (离线批量预置) 见 provisioning.py。
+常驻代理 (agent.py) 在运行时，list / get / set 通过它执行，不需要管理员权限也不会重新扫描；
+--no-agent 强制在本进程中执行。
+任一子命令前加 --profile <文件> 可输出扫描 / 重启的耗时和调用计数
+(.prom 为 Prometheus 文本格式，其他扩展名为 JSON lines，见 instrumentation.py)。
+"""
+import argparse
+import json
+import sys
+
+import instrumentation
+from agent import AgentClient, AgentError, run_agent
+from devices import (
+    ENUM_ROOT,
+    PARAM_HSCROLL,
+    PARAM_WHEEL,
+    RESTART_EACH_CHILD,
+    RESTART_SHARED_PARENT,
+    WIN32_BACKEND,
+    DeviceRecord,
+    MouseEnumerator,
+    RegistryHelper,
+    RestartPlanner,
+    apply_to_devices,
+    filetime_to_iso,
+    is_admin,
+    parse_vid_pid,
+    read_parameters,
+)
+from profiles import (
+    ACTION_CHANGE,
+    HSCROLL_STATES,
+    MODES,
+    Profile,
+    describe_change,
+    explain_plan,
+    find_targets,
+    hscroll_name,
+    mode_name,
+)
+from provisioning import dump_plan, export_plan, import_plan, write_reg
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_NO_MATCH = 2
+
+# 代理在运行时可以通过它执行的子命令
+AGENT_COMMANDS = ("list", "get", "set")
+
+def param_path(pnp_id: str) -> str:
+    return f"{ENUM_ROOT}\\{pnp_id}\\Device Parameters"
+
+def print_error(message: str):
+    print(f"Error: {message}", file=sys.stderr)
+
+def cmd_list(args) -> int:
+    if args.agent:
+        devices = [DeviceRecord.from_dict(entry) for entry in args.agent.list()]
+    else:
+        devices = RegistryHelper.scan_mice()
+    entries = []
+    for dev in devices:
+        # 扫描时已经一次读出了 Device Parameters，不再逐个查询
+        entries.append(dict(dev.to_dict(), mode=mode_name(dev.params.get(PARAM_WHEEL)),
+                            hscroll=hscroll_name(dev.params.get(PARAM_HSCROLL, 0))))
+
+    if args.json:
+        print(json.dumps(entries, ensure_ascii=False, indent=2))
+    else:
+        for entry in entries:
+            print(f"{entry['mode']:<8} hscroll={entry['hscroll']:<4} {entry['name']}\n         {entry['pnp_id']}")
+    return EXIT_OK
+
+def cmd_get(args) -> int:
+    if args.agent:
+        params = args.agent.get(args.pnp_id)
+    else:
+        params = read_parameters(WIN32_BACKEND, param_path(args.pnp_id))
+    if params is None or PARAM_WHEEL not in params:
+        print_error(f"设备 {args.pnp_id} 没有 FlipFlopWheel 参数")
+        return EXIT_NO_MATCH
+
+    mode = mode_name(params[PARAM_WHEEL])
+    hscroll = hscroll_name(params.get(PARAM_HSCROLL, 0))
+    if args.json:
+        print(json.dumps(dict({"pnp_id": args.pnp_id, "mode": mode, "hscroll": hscroll}, **params)))
+    else:
+        print(f"{mode} hscroll={hscroll}")
+    return EXIT_OK
+
+def cmd_ghosts(args) -> int:
+    """离线报告：列出注册表中已不在线、但仍带有 FlipFlopWheel 的幽灵实例"""
+    report = MouseEnumerator().ghost_report()
+    for entry in report["entries"]:
+        entry["last_write"] = filetime_to_iso(entry["last_write"]) if entry["last_write"] is not None else None
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return EXIT_OK
+
+    entries = report["entries"]
+    print(f"共遍历 {report['instances']} 个实例，{report['absent']} 个不在线，其中 {len(entries)} 个带有 FlipFlopWheel")
+    # 按型号汇总：同一型号插过多个端口 / 多次配对会留下大量实例
+    models = {}
+    for entry in entries:
+        vid_pid = parse_vid_pid(entry["pnp_id"])
+        # 蓝牙设备的 VID 带有来源前缀 (如 0002046D)，与 USB 写法统一为低 16 位
+        model = (f"VID_{int(vid_pid[0], 16) & 0xFFFF:04X} PID_{int(vid_pid[1], 16) & 0xFFFF:04X}"
+                 if vid_pid else entry["pnp_id"].split("\\")[1])
+        models.setdefault(model, []).append(entry)
+    for model, group in sorted(models.items(), key=lambda item: len(item[1]), reverse=True):
+        latest = max((entry["last_write"] or "" for entry in group), default="")
+        print(f"{len(group):>6}  {model:<40}  最近写入 {latest or '?'}")
+    return EXIT_OK
+
+def apply_changes(changes, args) -> int:
+    """changes: [(device, {参数名: 值})]；按取值分组写入，最后统一规划并发重启"""
+    if not changes:
+        print_error("没有匹配的在线设备")
+        return EXIT_NO_MATCH
+
+    planner = RestartPlanner(mode=args.restart_mode)
+    if args.dry_run:
+        for dev, values in changes:
+            current = read_parameters(WIN32_BACKEND, dev.reg_path)
+            print(f"{describe_change(current, values)}  {dev.name}  ({dev.pnp_id})")
+        if not args.no_restart:
+            print(RestartPlanner.explain(planner.plan([dev.pnp_id for dev, _ in changes])))
+        return EXIT_OK
+
+    if not is_admin():
+        print_error("修改设置需要管理员权限，请在提升后的命令行中运行")
+        return EXIT_FAILED
+
+    results = []
+    groups = {}
+    for dev, values in changes:
+        groups.setdefault(frozenset(values.items()), []).append(dev)
+    for values, devices in groups.items():
+        results.extend(apply_to_devices(devices, dict(values), restart=False))
+
+    if not args.no_restart:
+        outcomes = planner.execute(planner.plan([r["pnp_id"] for r in results if r["written"]]))
+        for r in results:
+            r["restart"] = outcomes.get(r["pnp_id"])
+    return report_results(results, args)
+
+def report_results(results, args) -> int:
+    """打印 apply_to_devices() 形式的结果并返回退出码"""
+    exit_code = EXIT_OK
+    for r in results:
+        if not r["written"]:
+            status = "写入失败"
+        elif args.no_restart:
+            status = "已写入 (未重启)"
+        elif r["restart"] and r["restart"]["ok"]:
+            status = "已生效"
+        else:
+            status = "已写入，重启失败"
+        if status not in ("已生效", "已写入 (未重启)"):
+            exit_code = EXIT_FAILED
+        print(f"{status}  {r['name']}  ({r['pnp_id']})")
+    return exit_code
+
+def cmd_set(args) -> int:
+    values = {}
+    if args.mode is not None:
+        values[PARAM_WHEEL] = MODES[args.mode]
+    if args.hscroll is not None:
+        values[PARAM_HSCROLL] = HSCROLL_STATES[args.hscroll]
+    if not values:
+        print_error("请至少指定 mac|windows 或 --hscroll on|off")
+        return EXIT_FAILED
+
+    if args.agent and not args.dry_run:
+        results = args.agent.set(args.target, values, restart=not args.no_restart, restart_mode=args.restart_mode)
+        if not results:
+            print_error("没有匹配的在线设备")
+            return EXIT_NO_MATCH
+        return report_results(results, args)
+
+    targets = find_targets(RegistryHelper.scan_mice(), args.target)
+    return apply_changes([(dev, values) for dev in targets], args)
+
+def cmd_apply_file(args) -> int:
+    try:
+        profile = Profile.load(args.profile)
+    except (OSError, ValueError) as e:
+        print_error(f"无法读取配置文件 {args.profile}: {e}")
+        return EXIT_FAILED
+
+    # 只修改取值与配置不一致的设备，无变化时不会重启任何设备
+    entries = profile.plan(RegistryHelper.scan_mice())
+    changes = [(entry["device"], entry["wanted"]) for entry in entries if entry["action"] == ACTION_CHANGE]
+    if args.dry_run:
+        print(explain_plan(entries))
+        if changes and not args.no_restart:
+            planner = RestartPlanner(mode=args.restart_mode)
+            print(RestartPlanner.explain(planner.plan([dev.pnp_id for dev, _ in changes])))
+        return EXIT_OK
+    if not changes:
+        print(f"{len(entries)} 个受管设备均已符合配置，无需修改")
+        return EXIT_OK
+    return apply_changes(changes, args)
+
+def cmd_export(args) -> int:
+    enumerator = MouseEnumerator()
+    # 默认包括不在线的实例，镜像中的设备大多不会插在制作镜像的机器上
+    devices = enumerator.scan() if args.online else list(enumerator.iter_registered())
+    plan = export_plan(devices)
+    try:
+        dump_plan(plan, args.plan)
+    except OSError as e:
+        print_error(f"无法写入 {args.plan}: {e}")
+        return EXIT_FAILED
+    print(f"已导出 {len(devices)} 个实例的设置 ({len(plan['rules'])} 条规则) 到 {args.plan}")
+    return EXIT_OK
+
+def cmd_import(args) -> int:
+    try:
+        profile = Profile.load(args.plan)
+    except (OSError, ValueError) as e:
+        print_error(f"无法读取计划文件 {args.plan}: {e}")
+        return EXIT_FAILED
+    if not args.dry_run and not is_admin():
+        print_error("修改设置需要管理员权限，请在提升后的命令行中运行")
+        return EXIT_FAILED
+
+    result = import_plan(profile, restart=not args.no_restart, restart_mode=args.restart_mode, dry_run=args.dry_run)
+    changes = result["changes"]
+    if args.reg:
+        try:
+            write_reg(changes, args.reg)
+        except OSError as e:
+            print_error(f"无法写入 {args.reg}: {e}")
+            return EXIT_FAILED
+        print(f"已写入等价的注册表文件 {args.reg}")
+
+    print(f"共 {result['instances']} 个实例，{len(changes)} 个需要修改")
+    if args.dry_run:
+        for dev, values in changes:
+            print(f"  {describe_change(dev.params, values)}  {dev.pnp_id}")
+        return EXIT_OK
+
+    for pnp_id in result["failed"]:
+        print(f"写入失败  {pnp_id}")
+    failed_restarts = [pnp_id for pnp_id, outcome in result["restarts"].items() if not outcome["ok"]]
+    for pnp_id in failed_restarts:
+        print(f"已写入，重启失败  {pnp_id}")
+    if args.no_restart:
+        print(f"已写入 {len(result['written'])} 个实例 (未重启)")
+    else:
+        print(f"已写入 {len(result['written'])} 个实例，其中 {len(result['online'])} 个在线，"
+              f"已重启 {len(result['online']) - len(failed_restarts)} 个")
+    return EXIT_FAILED if result["failed"] or failed_restarts else EXIT_OK
+
+def cmd_agent(args) -> int:
+    if args.stop:
+        client = AgentClient.connect()
+        if client is None:
+            print_error("代理没有在运行")
+            return EXIT_NO_MATCH
+        with client:
+            client.shutdown()
+        return EXIT_OK
+    if args.simulate is None and not is_admin():
+        print_error("代理需要管理员权限，请在提升后的命令行中运行")
+        return EXIT_FAILED
+    return run_agent(simulate=args.simulate)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="Mouse Wheel Manager 命令行模式")
+    parser.add_argument("--profile", metavar="FILE", help="记录耗时和调用计数并写入文件 (.prom 或 JSON lines)，不经过代理")
+    parser.add_argument("--no-agent", action="store_true", help="不使用常驻代理，在本进程中扫描和修改")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="列出在线的可配置鼠标")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("get", help="读取某个设备的滚轮方向")
+    p.add_argument("pnp_id")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser("ghosts", help="列出不在线但仍带有 FlipFlopWheel 的幽灵实例 (扫描慢的原因)")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出完整列表")
+    p.set_defaults(func=cmd_ghosts)
+
+    def add_apply_options(p):
+        p.add_argument("--no-restart", action="store_true", help="只写注册表，不重启设备")
+        p.add_argument("--dry-run", action="store_true", help="只显示将要进行的修改和重启计划")
+        p.add_argument("--restart-mode", choices=(RESTART_SHARED_PARENT, RESTART_EACH_CHILD),
+                       default=RESTART_SHARED_PARENT, help="共享父节点的设备是否合并重启")
+
+    p = sub.add_parser("set", help="修改设备的滚轮方向 / 水平滚动反转")
+    p.add_argument("target", help="PNP ID 或设备名称通配符 (如 \"*Magic*\")")
+    p.add_argument("mode", nargs="?", choices=tuple(MODES))
+    p.add_argument("--hscroll", choices=tuple(HSCROLL_STATES), help="是否反转水平滚动 (FlipFlopHScroll)")
+    add_apply_options(p)
+    p.set_defaults(func=cmd_set)
+
+    p = sub.add_parser("apply-file", help="按配置文件批量修改")
+    p.add_argument("profile")
+    add_apply_options(p)
+    p.set_defaults(func=cmd_apply_file)
+
+    p = sub.add_parser("export", help="导出各实例的滚轮设置为批量预置计划")
+    p.add_argument("plan", help="输出的计划文件 (JSON)")
+    p.add_argument("--online", action="store_true", help="只导出在线设备 (默认包括注册表中所有实例)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="把批量预置计划写入所有匹配的实例 (包括不在线的)")
+    p.add_argument("plan", help="计划文件 (与配置文件格式相同)")
+    p.add_argument("--reg", metavar="FILE", help="同时输出等价的 .reg 文件")
+    add_apply_options(p)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("agent", help="启动常驻后台代理 (之后的 list / get / set 无需提升权限)")
+    group = p.add_mutually_exclusive_group()
+    group.add_argument("--simulate", type=int, metavar="N", help="在 N 个实例的模拟树上运行 (用于测试)")
+    group.add_argument("--stop", action="store_true", help="停止正在运行的代理")
+    p.set_defaults(func=cmd_agent)
+
+    return parser
+
+def run(argv) -> int:
+    args = build_parser().parse_args(argv)
+    args.agent = None
+    if args.command in AGENT_COMMANDS and not args.no_agent and not args.profile:
+        args.agent = AgentClient.connect()
+    if args.agent:
+        with args.agent:
+            try:
+                return args.func(args)
+            except AgentError as e:
+                print_error(f"代理: {e}")
+                return EXIT_FAILED
+    if not args.profile:
+        return args.func(args)
+
+    recorder = instrumentation.enable()
+    try:
+        return args.func(args)
+    finally:
+        instrumentation.disable()
+        try:
+            recorder.write(args.profile)
+        except OSError as e:
+            print_error(f"无法写入性能记录 {args.profile}: {e}")
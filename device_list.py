@@ -0,0 +1,229 @@
+"""
+左侧设备列表的两种渲染方式。不直接导入 CustomTkinter：控件模块 (widgets) 由调用方传入，
+gui.py 传入 customtkinter，benchmark.py 传入只计数的假控件，从而可以在无界面环境下统计控件创建次数。
+
+KeyedDeviceList   : 每个设备一行，按 PNP ID 对比新旧列表，只为新增 / 移除的设备创建 / 销毁控件；
+                    文字或勾选状态没有变化的行不会被 configure，切换选中项只修改两个按钮。
+VirtualDeviceList : 只创建可见区域所需的行并循环复用，滚动时把行重新绑定到其他设备，
+                    控件数量与设备数量无关，适合列出上百个 HID 集合的机器。
+
+两者接口相同：sync(devices, checked_ids) / select(pnp_id) / set_checked(checked_ids)，
+用户操作通过 on_select(pnp_id) / on_check(pnp_id, checked) 回调通知 App。
+PNP ID 一律不区分大小写 (插拔通知产生的记录为大写，扫描结果保留注册表中的写法)。
+"""
+
+ROW_HEIGHT = 60
+ROW_PADDING = 4
+
+def row_text(dev) -> str:
+    icon = "🍎" if "Apple" in dev.name else "🖱️"
+    return f"{icon}  {dev.name}\n      {dev.id_display}"
+
+class _DeviceListBase:
+    def __init__(self, widgets, theme: dict, on_select, on_check):
+        self.widgets = widgets
+        self.theme = theme
+        self.on_select = on_select
+        self.on_check = on_check
+        self.selected = None   # 选中设备的 PNP_ID(大写)
+        self.created = 0       # 累计创建的控件数量
+        self.configured = 0    # 累计 configure / select / deselect 调用次数
+        self.empty_label = None
+
+    def _make_row(self, parent) -> dict:
+        """创建一行 (容器 + 复选框 + 按钮)，row["key"] 为当前绑定的设备"""
+        row = {"key": None, "bound": None}
+        row["frame"] = self.widgets.CTkFrame(parent, fg_color="transparent", height=ROW_HEIGHT)
+        row["check"] = self.widgets.CTkCheckBox(
+            row["frame"], text="", width=24, checkbox_width=18, checkbox_height=18,
+            command=lambda: self.on_check(row["pnp_id"], bool(row["check"].get()))
+        )
+        row["check"].pack(side="left", padx=(2, 0))
+        row["button"] = self.widgets.CTkButton(
+            row["frame"],
+            text="",
+            font=("Segoe UI", 13),
+            anchor="w",
+            height=ROW_HEIGHT,
+            fg_color="transparent",
+            text_color=self.theme["text_main"],
+            hover_color=self.theme["list_hover"],
+            corner_radius=6,
+            command=lambda: self.on_select(row["pnp_id"])
+        )
+        row["button"].pack(side="left", fill="x", expand=True)
+        self.created += 3
+        return row
+
+    def _bind_row(self, row: dict, dev, checked: bool):
+        """把行绑定到设备 (DeviceRecord)；只 configure 真正变化的部分"""
+        key = dev.pnp_id.upper()
+        text, selected = row_text(dev), key == self.selected
+        old_text, old_checked, old_selected = row["bound"] or (None, None, None)
+        row["key"], row["pnp_id"] = key, dev.pnp_id
+
+        if text != old_text:
+            row["button"].configure(text=text)
+            self.configured += 1
+        if checked != old_checked:
+            row["check"].select() if checked else row["check"].deselect()
+            self.configured += 1
+        if selected != old_selected:
+            self._paint(row, selected)
+        row["bound"] = (text, checked, selected)
+
+    def _paint(self, row: dict, selected: bool):
+        if selected:
+            row["button"].configure(fg_color=self.theme["list_selected"], text_color=self.theme["accent"])
+        else:
+            row["button"].configure(fg_color="transparent", text_color=self.theme["text_main"])
+        self.configured += 1
+        if row["bound"]:
+            row["bound"] = row["bound"][:2] + (selected,)
+
+    def _show_empty(self, parent, empty: bool):
+        if empty and self.empty_label is None:
+            self.empty_label = self.widgets.CTkLabel(parent, text="未检测到在线设备\n请检查连接",
+                                                     text_color=self.theme["text_sub"])
+            self.created += 1
+            self.empty_label.pack(pady=20)
+        elif not empty and self.empty_label is not None:
+            self.empty_label.destroy()
+            self.empty_label = None
+
+class KeyedDeviceList(_DeviceListBase):
+    def __init__(self, parent, widgets, theme: dict, on_select, on_check):
+        super().__init__(widgets, theme, on_select, on_check)
+        self.frame = widgets.CTkScrollableFrame(parent, label_text="", fg_color="transparent")
+        self.created += 1
+        self.rows = {}   # PNP_ID(大写) -> row
+        self.order = []  # 当前的显示顺序
+
+    def sync(self, devices, checked_ids):
+        keys = [dev.pnp_id.upper() for dev in devices]
+        checked = {pnp_id.upper() for pnp_id in checked_ids}
+        wanted = set(keys)
+        for key in [key for key in self.rows if key not in wanted]:
+            self.rows.pop(key)["frame"].destroy()
+
+        for dev, key in zip(devices, keys):
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = self._make_row(self.frame)
+            self._bind_row(row, dev, key in checked)
+
+        # 只重新排列从第一个位置变化的行开始的部分 (追加设备时只 pack 新行)
+        old_order = [key for key in self.order if key in wanted]
+        start = next((i for i, (a, b) in enumerate(zip(old_order, keys)) if a != b), min(len(old_order), len(keys)))
+        for key in keys[start:]:
+            self.rows[key]["frame"].pack_forget()
+        for key in keys[start:]:
+            self.rows[key]["frame"].pack(fill="x", pady=ROW_PADDING // 2, padx=5)
+        self.order = keys
+        self._show_empty(self.frame, not keys)
+
+    def select(self, pnp_id):
+        key = pnp_id.upper() if pnp_id else None
+        if key == self.selected:
+            return
+        for old_or_new, selected in ((self.selected, False), (key, True)):
+            row = self.rows.get(old_or_new)
+            if row is not None:
+                self._paint(row, selected)
+        self.selected = key
+
+    def set_checked(self, checked_ids):
+        checked_upper = {pnp_id.upper() for pnp_id in checked_ids}
+        for key, row in self.rows.items():
+            checked = key in checked_upper
+            if row["bound"] and row["bound"][1] != checked:
+                row["check"].select() if checked else row["check"].deselect()
+                row["bound"] = (row["bound"][0], checked, row["bound"][2])
+                self.configured += 1
+
+class VirtualDeviceList(_DeviceListBase):
+    def __init__(self, parent, widgets, theme: dict, on_select, on_check, visible_rows: int = 8):
+        super().__init__(widgets, theme, on_select, on_check)
+        self.frame = widgets.CTkFrame(parent, fg_color="transparent")
+        self.body = widgets.CTkFrame(self.frame, fg_color="transparent")
+        self.scrollbar = widgets.CTkScrollbar(self.frame, command=self._on_scroll)
+        self.created += 3
+        self.scrollbar.pack(side="right", fill="y")
+        self.body.pack(side="left", fill="both", expand=True)
+        self.body.bind("<Configure>", self._on_resize)
+        self.body.bind("<MouseWheel>", self._on_wheel)
+
+        self.devices = []
+        self.checked = set()  # PNP_ID(大写)
+        self.first = 0        # 第一行对应的设备下标
+        self.pool = []
+        self._resize_pool(visible_rows)
+
+    def sync(self, devices, checked_ids):
+        self.devices = list(devices)
+        self.checked = {pnp_id.upper() for pnp_id in checked_ids}
+        self._render()
+
+    def select(self, pnp_id):
+        self.selected = pnp_id.upper() if pnp_id else None
+        # 选中项只可能在可见行中被重新着色；其他行会在滚动到时按新状态绑定
+        for row in self.pool:
+            if row["key"] is not None and (row["key"] == self.selected) != row["bound"][2]:
+                self._paint(row, row["key"] == self.selected)
+
+    def set_checked(self, checked_ids):
+        self.checked = {pnp_id.upper() for pnp_id in checked_ids}
+        self._render()
+
+    def _render(self):
+        self.first = max(0, min(self.first, len(self.devices) - len(self.pool)))
+        for i, row in enumerate(self.pool):
+            index = self.first + i
+            if index < len(self.devices):
+                dev = self.devices[index]
+                self._bind_row(row, dev, dev.pnp_id.upper() in self.checked)
+                if not row["visible"]:
+                    row["frame"].pack(fill="x", pady=ROW_PADDING // 2, padx=5)
+                    row["visible"] = True
+            elif row["visible"]:
+                row["frame"].pack_forget()
+                row["visible"] = False
+                row["key"] = None
+        self._show_empty(self.body, not self.devices)
+
+        total = max(len(self.devices), 1)
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + len(self.pool)) / total))
+
+    def _resize_pool(self, count: int):
+        count = max(1, count)
+        while len(self.pool) < count:
+            row = self._make_row(self.body)
+            row["visible"] = False
+            for widget in (row["frame"], row["button"]):
+                widget.bind("<MouseWheel>", self._on_wheel)
+            self.pool.append(row)
+        while len(self.pool) > count:
+            self.pool.pop()["frame"].destroy()
+
+    def _scroll_to(self, first: int):
+        first = max(0, min(first, len(self.devices) - len(self.pool)))
+        if first != self.first:
+            self.first = first
+            self._render()
+
+    def _on_scroll(self, action, amount, unit=None):
+        """CTkScrollbar 回调：("moveto", 比例) 或 ("scroll", 步数, "units" | "pages")"""
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.devices)))
+        elif action == "scroll":
+            step = len(self.pool) if unit == "pages" else 1
+            self._scroll_to(self.first + int(amount) * step)
+
+    def _on_wheel(self, event):
+        self._scroll_to(self.first - int(event.delta / 120))
+
+    def _on_resize(self, event):
+        rows = event.height // (ROW_HEIGHT + ROW_PADDING) + 1
+        if rows != len(self.pool):
+            self._resize_pool(rows)
+            self._render()
@@ -0,0 +1,1627 @@
+import sys
+import os
+import re
+import json
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+from datetime import datetime, timedelta
+import ctypes
+from ctypes import wintypes
+try:
+    import winreg
+except ImportError:
+    # 非 Windows (CI / 基准测试)：只能使用 simulator.py 中的模拟后端
+    winreg = None
+
+import instrumentation
+from cfgmgr import (
+    CM_GETIDLIST_FILTER_CLASS,
+    CM_GETIDLIST_FILTER_PRESENT,
+    CR_SUCCESS,
+    DEVPKEY_FriendlyName,
+    DEVPROPKEY,
+    DN_STARTED,
+    GUID,
+    CfgMgr32,
+    ConfigRetError,
+)
+from instrumentation import counted
+
+# =========================================================================
+# 1. 底层 CfgMgr32 定义
+# =========================================================================
+
+# 非 Windows 上没有 windll：Win32Backend 不可用 (CFGMGR32 为 None)
+windll = getattr(ctypes, "windll", None)
+cfgmgr32 = windll.cfgmgr32 if windll else None
+# 带原型的绑定 (cfgmgr.py)；插拔通知仍直接使用 cfgmgr32
+CFGMGR32 = CfgMgr32(cfgmgr32) if cfgmgr32 else None
+
+# 鼠标设备的专属 GUID
+MOUSE_CLASS_GUID = "{4D36E96F-E325-11CE-BFC1-08002BE10318}"
+
+# =========================================================================
+# 2. 注册表与设备助手类
+# =========================================================================
+
+class RegistryHelper:
+    # === CfgMgr32 辅助函数 START ===
+    # 保留原来的静态接口，实际调用转给 WIN32_BACKEND (失败时返回 0 / "" / None，不抛异常)
+    @staticmethod
+    def get_devnode_status(pnp_id: str):
+        """检查设备是否连接，并返回 dev_inst 句柄"""
+        return WIN32_BACKEND.get_devnode_status(pnp_id)
+
+    @staticmethod
+    def locate_devnode(pnp_id: str) -> int:
+        return WIN32_BACKEND.locate_devnode(pnp_id)
+
+    @staticmethod
+    def get_status_flags(dev_inst: int) -> int:
+        """返回 devnode 的 DN_* 状态位，查询失败时返回 0"""
+        return WIN32_BACKEND.get_status_flags(dev_inst)
+
+    @staticmethod
+    def disable_devnode(dev_inst: int) -> int:
+        """禁用设备 (相当于在设备管理器右键禁用)，返回 CONFIGRET"""
+        return WIN32_BACKEND.disable_devnode(dev_inst)
+
+    @staticmethod
+    def enable_devnode(dev_inst: int) -> int:
+        """启用设备 (驱动重新初始化，读取注册表)，返回 CONFIGRET"""
+        return WIN32_BACKEND.enable_devnode(dev_inst)
+
+    @staticmethod
+    def restart_device(pnp_id: str) -> dict:
+        """
+        【新增核心功能】软件重启设备：禁用 -> 确认已停止 -> 启用 -> 确认已启动。
+        这会强制驱动重新读取注册表配置，无需物理插拔。
+        返回 DeviceRestarter.restart() 的结果字典。
+        """
+        return DeviceRestarter().restart(pnp_id)
+
+    @staticmethod
+    def get_property(dev_inst: int, property_key: DEVPROPKEY) -> str:
+        return WIN32_BACKEND.get_property(dev_inst, property_key)
+
+    @staticmethod
+    def get_parent_handle(child_inst: int) -> int:
+        return WIN32_BACKEND.get_parent(child_inst)
+
+    @staticmethod
+    def get_device_id_from_handle(dev_inst: int) -> str:
+        return WIN32_BACKEND.get_device_id(dev_inst)
+
+    @staticmethod
+    def get_class_device_ids(class_guid: str):
+        """一次性获取某个 ClassGUID 下所有在线设备的实例 ID，失败时返回 None"""
+        return WIN32_BACKEND.get_class_device_ids(class_guid)
+
+    @staticmethod
+    def find_real_name_via_parent(dev_inst: int, current_pnp_id: str, default_desc: str) -> str:
+        """核心逻辑：向上查找父节点以获取真实硬件名称"""
+        return resolve_real_name(WIN32_BACKEND, dev_inst, current_pnp_id, default_desc)
+    # === CfgMgr32 辅助函数 END ===
+
+    @staticmethod
+    def get_registry_value_safe(key, value_name):
+        try:
+            value, _ = winreg.QueryValueEx(key, value_name)
+            return value
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def scan_mice():
+        """扫描 HID 和 Bluetooth 总线下的鼠标设备"""
+        return MouseEnumerator().scan()
+
+    @staticmethod
+    def iter_mice():
+        """流式版本的 scan_mice：每确认一个设备就 yield 一次 (未排序)"""
+        return MouseEnumerator().iter_scan()
+
+    @staticmethod
+    def get_state(reg_path):
+        try:
+            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, reg_path, 0, winreg.KEY_READ)
+            val, _ = winreg.QueryValueEx(key, "FlipFlopWheel")
+            winreg.CloseKey(key)
+            return val
+        except: return 0
+
+    @staticmethod
+    def set_state(reg_path, value):
+        try:
+            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, reg_path, 0, winreg.KEY_WRITE)
+            winreg.SetValueEx(key, "FlipFlopWheel", 0, winreg.REG_DWORD, value)
+            winreg.CloseKey(key)
+            return True
+        except: return False
+
+# =========================================================================
+# 3. 设备访问后端与枚举引擎
+# =========================================================================
+
+ENUM_ROOT = "SYSTEM\\CurrentControlSet\\Enum"
+# 扫描 HID 和 BTH (覆盖 USB 接收器和 纯蓝牙鼠标)
+MOUSE_BUS_LIST = ("HID", "BTH", "BTHENUM")
+
+# Device Parameters 下与滚轮相关的 REG_DWORD 参数 (不存在时驱动按 0 处理)
+PARAM_WHEEL = "FlipFlopWheel"      # 垂直滚轮反转 (1 = Mac 自然滚动)
+PARAM_HSCROLL = "FlipFlopHScroll"  # 水平滚轮反转
+WHEEL_PARAMETERS = (PARAM_WHEEL, PARAM_HSCROLL)
+
+class Win32Backend:
+    """
+    真实的 CfgMgr32 + 注册表访问后端。
+    枚举引擎只通过这几个方法访问系统，测试时可以换成内存中的假实现。
+    cfgmgr 为 cfgmgr.CfgMgr32 绑定 (默认 CFGMGR32)；绑定抛出的 ConfigRetError 在这里转换成
+    各方法约定的失败返回值 (0 / "" / None / CONFIGRET)。
+    """
+
+    def __init__(self, cfgmgr=None):
+        self.cfgmgr = cfgmgr or CFGMGR32
+
+    # --- CfgMgr32 ---
+    @counted("cfgmgr")
+    def get_class_device_ids(self, class_guid: str):
+        try:
+            return self.cfgmgr.get_device_id_list(class_guid, CM_GETIDLIST_FILTER_CLASS | CM_GETIDLIST_FILTER_PRESENT)
+        except ConfigRetError:
+            return None
+
+    @counted("cfgmgr")
+    def get_devnode_status(self, pnp_id: str):
+        try:
+            dev_inst = self.cfgmgr.locate_devnode(pnp_id)
+        except ConfigRetError:
+            return False, 0
+        try:
+            status, _ = self.cfgmgr.get_status(dev_inst)
+        except ConfigRetError:
+            status = 0
+        return bool(status & DN_STARTED), dev_inst
+
+    @counted("cfgmgr")
+    def get_property(self, dev_inst: int, property_key) -> str:
+        try:
+            return self.cfgmgr.get_property(dev_inst, property_key)
+        except ConfigRetError:
+            return ""
+
+    @counted("cfgmgr")
+    def get_parent(self, dev_inst: int) -> int:
+        try:
+            return self.cfgmgr.get_parent(dev_inst)
+        except ConfigRetError:
+            return 0
+
+    @counted("cfgmgr")
+    def locate_devnode(self, pnp_id: str) -> int:
+        try:
+            return self.cfgmgr.locate_devnode(pnp_id)
+        except ConfigRetError:
+            return 0
+
+    @counted("cfgmgr")
+    def get_status_flags(self, dev_inst: int) -> int:
+        try:
+            return self.cfgmgr.get_status(dev_inst)[0]
+        except ConfigRetError:
+            return 0
+
+    @counted("cfgmgr")
+    def disable_devnode(self, dev_inst: int) -> int:
+        try:
+            self.cfgmgr.disable_devnode(dev_inst)
+        except ConfigRetError as e:
+            return e.code
+        return CR_SUCCESS
+
+    @counted("cfgmgr")
+    def enable_devnode(self, dev_inst: int) -> int:
+        try:
+            self.cfgmgr.enable_devnode(dev_inst)
+        except ConfigRetError as e:
+            return e.code
+        return CR_SUCCESS
+
+    @counted("cfgmgr")
+    def get_device_id(self, dev_inst: int) -> str:
+        try:
+            return self.cfgmgr.get_device_id(dev_inst)
+        except ConfigRetError:
+            return ""
+
+    # --- 注册表 (HKLM 下的相对路径) ---
+    @counted("registry")
+    def enum_subkeys(self, path: str) -> list:
+        """列出子键名称，键不存在时抛出 FileNotFoundError"""
+        names = []
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path) as key:
+            i = 0
+            while True:
+                try:
+                    names.append(winreg.EnumKey(key, i))
+                    i += 1
+                except OSError:
+                    break
+        return names
+
+    @counted("registry")
+    def enum_subkey_info(self, path: str) -> list:
+        """
+        列出 [(子键名称, 最后写入时间)]，最后写入时间由 RegEnumKeyExW 顺带返回，不需要逐个打开子键；
+        键不存在时抛出 FileNotFoundError
+        """
+        items = []
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path) as key:
+            name = ctypes.create_unicode_buffer(256)  # 注册表键名最长 255 个字符
+            last_write = wintypes.FILETIME()
+            i = 0
+            while True:
+                size = wintypes.DWORD(len(name))
+                ret = advapi32.RegEnumKeyExW(key.handle, i, name, ctypes.byref(size), None, None, None, ctypes.byref(last_write))
+                if ret != ERROR_SUCCESS:
+                    break
+                items.append((name.value, (last_write.dwHighDateTime << 32) | last_write.dwLowDateTime))
+                i += 1
+        return items
+
+    @counted("registry")
+    def query_key_info(self, path: str):
+        """返回 (子键数量, 最后写入时间)，键不存在时抛出 FileNotFoundError"""
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path) as key:
+            subkey_count, _, last_write = winreg.QueryInfoKey(key)
+        return subkey_count, last_write
+
+    @counted("registry")
+    def write_values(self, path: str, values: dict) -> bool:
+        """打开一次键写入多个 REG_DWORD；取值为 None 表示删除该值"""
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path, 0, winreg.KEY_WRITE) as key:
+                for name, value in values.items():
+                    if value is None:
+                        try:
+                            winreg.DeleteValue(key, name)
+                        except FileNotFoundError:
+                            pass
+                    else:
+                        winreg.SetValueEx(key, name, 0, winreg.REG_DWORD, value)
+            return True
+        except OSError:
+            return False
+
+    @counted("registry")
+    def read_all_values(self, path: str) -> dict:
+        """打开一次键，用 EnumValue 一次性读出所有值；键不存在时返回 None"""
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path) as key:
+                _, value_count, _ = winreg.QueryInfoKey(key)
+                values = {}
+                for i in range(value_count):
+                    name, value, _ = winreg.EnumValue(key, i)
+                    values[name] = value
+                return values
+        except OSError:
+            return None
+
+    @counted("registry")
+    def query_values(self, path: str, names) -> dict:
+        """打开一次键读取多个值，缺失的值为 None；键不存在时返回 None"""
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path) as key:
+                return {name: RegistryHelper.get_registry_value_safe(key, name) for name in names}
+        except OSError:
+            return None
+
+WIN32_BACKEND = Win32Backend()
+
+class DevnodeSnapshot:
+    """
+    单次扫描内的 devnode 索引：父节点链接和属性值每个 devnode 只向 CfgMgr 查询一次，
+    同一接收器下的多个 HID 集合向上查找名称时直接命中缓存。
+    两次扫描之间必须调用 invalidate()，其余后端方法原样透传。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._parents = {}     # dev_inst -> parent dev_inst
+        self._properties = {}  # (dev_inst, 属性键) -> 值
+
+    def invalidate(self):
+        self._parents.clear()
+        self._properties.clear()
+
+    def get_parent(self, dev_inst: int) -> int:
+        if dev_inst not in self._parents:
+            self._parents[dev_inst] = self.backend.get_parent(dev_inst)
+        return self._parents[dev_inst]
+
+    def get_property(self, dev_inst: int, property_key) -> str:
+        # DEVPROPKEY 是 ctypes 结构体，按字节内容作为缓存键
+        cache_key = (dev_inst, bytes(property_key))
+        if cache_key not in self._properties:
+            self._properties[cache_key] = self.backend.get_property(dev_inst, property_key)
+        return self._properties[cache_key]
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+def resolve_real_name(backend, dev_inst: int, current_pnp_id: str, default_desc: str) -> str:
+    """向上查找父节点以获取真实硬件名称 (如 "MX Master 3S")"""
+    # 1. 尝试直接获取 FriendlyName
+    friendly = backend.get_property(dev_inst, DEVPKEY_FriendlyName)
+
+    # 如果是 HID/BTH 设备，尝试往上找"爸爸"
+    if "HID" in current_pnp_id.upper() or "BTH" in current_pnp_id.upper():
+        curr_inst = dev_inst
+        for _ in range(3): # 最多往上找3层
+            parent_inst = backend.get_parent(curr_inst)
+            if parent_inst == 0: break
+
+            parent_friendly = backend.get_property(parent_inst, DEVPKEY_FriendlyName)
+
+            # 如果父节点有友好名称，且不是通用的"枚举器"
+            if parent_friendly and ("ENUMERATOR" not in parent_friendly.upper()):
+                return parent_friendly
+
+            curr_inst = parent_inst
+
+    if friendly:
+        return friendly
+    return default_desc
+
+_VID_PID_RE = re.compile(r"VID[_&]([0-9A-F]+).*?PID[_&]([0-9A-F]+)", re.IGNORECASE)
+
+def parse_vid_pid(pnp_id: str):
+    """从设备 ID 中解析 (VID, PID)，USB 与蓝牙两种写法都支持；解析失败返回 None"""
+    match = _VID_PID_RE.search(pnp_id)
+    if not match:
+        return None
+    return match.group(1).upper(), match.group(2).upper()
+
+@functools.lru_cache(maxsize=None)
+def _parse_device_id(device_id: str):
+    """同一个 device-ID (型号) 只解析一次：返回 intern 后的 (device_id, VID, PID)，没有 VID/PID 时为 None"""
+    vid_pid = parse_vid_pid(device_id)
+    if vid_pid is None:
+        return sys.intern(device_id), None, None
+    return sys.intern(device_id), sys.intern(vid_pid[0]), sys.intern(vid_pid[1])
+
+@functools.lru_cache(maxsize=None)
+def _enum_prefix(bus: str) -> str:
+    """SYSTEM\\CurrentControlSet\\Enum\\<bus>，同一个 bus 的所有设备共享这一个字符串"""
+    return sys.intern(f"{ENUM_ROOT}\\{bus}")
+
+class DeviceRecord:
+    """
+    一个可修改滚轮方向的在线鼠标 (扫描结果)。
+    PNP ID 拆成 bus / device_id / instance 三段保存，bus 与 device_id 经 intern 在同型号的实例间共享，
+    VID / PID 每个型号只解析一次；pnp_id、reg_path、id_display 是按需拼出的属性，不占用记录本身的内存。
+    记录创建后只读 (DeviceIndex 以 PNP ID 为键)：属性不能重新赋值，params 在创建时复制一份，
+    只是扫描时的快照，实时取值见 StateCache。名称或参数变化时创建新记录并用 DeviceIndex.add() 替换。
+    """
+    __slots__ = ("bus", "device_id", "instance", "vid", "pid", "name", "params")
+
+    def __init__(self, bus: str, device_id: str, instance: str, name: str, params: dict = None):
+        init = object.__setattr__  # __setattr__ 禁止赋值，只有构造时绕过
+        init(self, "bus", sys.intern(bus))
+        device_id, vid, pid = _parse_device_id(device_id)
+        init(self, "device_id", device_id)
+        init(self, "vid", vid)
+        init(self, "pid", pid)
+        init(self, "instance", instance)
+        init(self, "name", sys.intern(name))
+        init(self, "params", dict(params) if params else {})
+
+    def __setattr__(self, attr, value):
+        raise AttributeError(f"DeviceRecord 是只读的，不能修改 {attr}")
+
+    def __delattr__(self, attr):
+        raise AttributeError(f"DeviceRecord 是只读的，不能删除 {attr}")
+
+    @classmethod
+    def from_pnp_id(cls, pnp_id: str, name: str, params: dict = None):
+        bus, device_id, instance = pnp_id.split("\\", 2)
+        return cls(bus, device_id, instance, name, params)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """从 to_dict() 的结果 (例如设备缓存文件) 恢复，格式不对时抛出 ValueError"""
+        try:
+            return cls.from_pnp_id(data["pnp_id"], data["name"], data.get("params"))
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            raise ValueError(f"无效的设备记录: {data!r}") from e
+
+    @property
+    def pnp_id(self) -> str:
+        return f"{self.bus}\\{self.device_id}\\{self.instance}"
+
+    @property
+    def reg_path(self) -> str:
+        """Device Parameters 键的路径，修改滚轮参数时使用"""
+        return f"{_enum_prefix(self.bus)}\\{self.device_id}\\{self.instance}\\Device Parameters"
+
+    @property
+    def id_display(self) -> str:
+        """简单的 ID 显示：有 VID/PID 时为 "VID_xxxx PID_xxxx"，否则为 device-ID"""
+        return f"VID_{self.vid} PID_{self.pid}" if self.vid else self.device_id
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "id_display": self.id_display, "reg_path": self.reg_path,
+                "pnp_id": self.pnp_id, "params": dict(self.params)}
+
+    def __repr__(self):
+        return f"DeviceRecord({self.pnp_id!r}, {self.name!r})"
+
+class DeviceIndex:
+    """
+    按 PNP ID (不区分大小写) 索引的有序设备集合。
+    插拔事件、CLI 和配置文件按 PNP ID 查找设备都是 O(1)，迭代顺序即加入顺序。
+    """
+
+    def __init__(self, devices=()):
+        self._devices = {dev.pnp_id.upper(): dev for dev in devices}
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __iter__(self):
+        return iter(self._devices.values())
+
+    def __contains__(self, pnp_id: str):
+        return pnp_id.upper() in self._devices
+
+    def get(self, pnp_id: str, default=None):
+        return self._devices.get(pnp_id.upper(), default)
+
+    def add(self, device: DeviceRecord):
+        """加入设备；已有同一 PNP ID 的设备时原位替换 (顺序不变)"""
+        self._devices[device.pnp_id.upper()] = device
+
+    def discard(self, pnp_id: str):
+        """移除并返回设备，不存在时返回 None"""
+        return self._devices.pop(pnp_id.upper(), None)
+
+def read_parameters(backend, reg_path: str):
+    """
+    一次枚举读出 Device Parameters 键，返回其中已知滚轮参数的 {名称: int}
+    (不存在的参数不出现在结果中)；键不存在时返回 None。
+    """
+    values = backend.read_all_values(reg_path)
+    if values is None:
+        return None
+    return {name: int(values[name]) for name in WHEEL_PARAMETERS if isinstance(values.get(name), int)}
+
+def filetime_to_iso(filetime: int) -> str:
+    """注册表最后写入时间 (1601-01-01 起的 100ns 计数，UTC) 转成 ISO 时间字符串"""
+    return (datetime(1601, 1, 1) + timedelta(microseconds=filetime // 10)).isoformat(timespec="seconds")
+
+def _cancelled(cancel) -> bool:
+    return cancel is not None and cancel.is_set()
+
+class GhostIndex:
+    """
+    记录上次确认不在线的实例：{PNP_ID(大写): 实例键最后写入时间}。
+    遍历注册表时实例键的最后写入时间随枚举一起返回，与记录相同就直接跳过，
+    不再为它调用 CM_Locate_DevNodeW；实例键被改写 (重新插入 / 重新安装) 后才会重新确认。
+    运行期间重新插入但实例键没有变化的设备由热插拔通知 (HotplugMonitor) 发现。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.skipped = 0  # 累计跳过的次数
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_ghost(self, pnp_id: str, last_write) -> bool:
+        if last_write is None or self._entries.get(pnp_id.upper()) != last_write:
+            return False
+        self.skipped += 1
+        return True
+
+    def add(self, pnp_id: str, last_write):
+        if last_write is not None:
+            self._entries[pnp_id.upper()] = last_write
+
+    def discard(self, pnp_id: str):
+        self._entries.pop(pnp_id.upper(), None)
+
+    def clear(self):
+        self._entries.clear()
+
+class MouseEnumerator:
+    """
+    鼠标设备枚举引擎。
+
+    scan()      : 通过 CM_Get_Device_ID_List 一次性拿到在线的鼠标类设备，
+                  只对这些设备访问注册表 (幽灵设备完全不会被触碰)。
+    scan_walk() : 旧的逐实例遍历方式，批量接口不可用时作为回退；
+                  已确认不在线且实例键没有变化的幽灵实例由 GhostIndex 跳过。
+    ghosts 可以传入另一个枚举器的 GhostIndex，使 probe() 确认在线的设备也从那边的记录中移除。
+    """
+
+    def __init__(self, backend=None, ghosts: GhostIndex = None):
+        self.backend = backend or WIN32_BACKEND
+        # 名称解析用的 devnode 快照，每次扫描开始时清空
+        self.snapshot = DevnodeSnapshot(self.backend)
+        self.ghosts = ghosts if ghosts is not None else GhostIndex()
+
+    def scan(self):
+        with instrumentation.span("scan"):
+            return self.sort_devices(list(self.iter_scan()))
+
+    def iter_scan(self, cancel=None):
+        """
+        流式扫描：每确认一个设备就立即 yield (未排序)，调用方可随时停止迭代。
+        cancel (threading.Event) 被设置后在下一个注册表键 / 实例处结束，不必等到下一个设备。
+        """
+        self.snapshot.invalidate()
+        with instrumentation.span("scan.enumerate"):
+            pnp_ids = self.backend.get_class_device_ids(MOUSE_CLASS_GUID)
+        if pnp_ids is None:
+            yield from self._iter_collect(self._walk_instances(cancel), cancel)
+            return
+
+        on_bus = (pnp_id for pnp_id in pnp_ids if pnp_id.split("\\", 1)[0].upper() in MOUSE_BUS_LIST)
+        # 列表已按 ClassGUID 过滤，无需再读注册表确认
+        yield from self._iter_collect(((pnp_id, False, None) for pnp_id in on_bus), cancel)
+
+    def scan_walk(self, cancel=None):
+        """遍历 Enum\\<bus> 下的每个实例 (包括所有历史幽灵设备)"""
+        self.snapshot.invalidate()
+        with instrumentation.span("scan"):
+            return self.sort_devices(list(self._iter_collect(self._walk_instances(cancel), cancel)))
+
+    @staticmethod
+    def sort_devices(devices):
+        # 排序：名字长的（通常是具体型号）排前面，"HID-compliant mouse" 排后面
+        devices.sort(key=lambda x: len(x.name), reverse=True)
+        return devices
+
+    def _walk_instances(self, cancel=None):
+        for bus in MOUSE_BUS_LIST:
+            base_path = f"{ENUM_ROOT}\\{bus}"
+            try:
+                with instrumentation.span("scan.enumerate"):
+                    device_id_names = self.backend.enum_subkeys(base_path)
+            except OSError:
+                continue
+            for device_id_key_name in device_id_names:
+                if _cancelled(cancel):
+                    return
+                try:
+                    with instrumentation.span("scan.enumerate"):
+                        instances = self.backend.enum_subkey_info(f"{base_path}\\{device_id_key_name}")
+                except OSError:
+                    continue
+                for instance_name, last_write in instances:
+                    yield f"{bus}\\{device_id_key_name}\\{instance_name}", True, last_write
+
+    def _iter_collect(self, candidates, cancel=None):
+        seen_ids = set()
+        for pnp_id, check_class, last_write in candidates:
+            if _cancelled(cancel):
+                return
+            if pnp_id.upper() in seen_ids or self.ghosts.is_ghost(pnp_id, last_write):
+                continue
+            device = self.probe(pnp_id, check_class, last_write)
+            if device:
+                seen_ids.add(pnp_id.upper())
+                yield device
+
+    def probe(self, pnp_id: str, check_class: bool = True, last_write=None):
+        """
+        确认单个实例是在线的、可修改滚轮方向的鼠标，并返回 UI 所需的数据。
+        last_write 为遍历时得到的实例键最后写入时间，不在线时记入 GhostIndex。
+        """
+        # 1. 检查连接状态 (底层 API)
+        with instrumentation.span("scan.devnode_status"):
+            is_connected, dev_inst = self.backend.get_devnode_status(pnp_id)
+        if not is_connected:
+            self.ghosts.add(pnp_id, last_write)
+            return None
+        self.ghosts.discard(pnp_id)
+
+        with instrumentation.span("scan.class_filter"):
+            record = self.read_instance(pnp_id, check_class)
+        if record is None:
+            return None
+        with instrumentation.span("scan.resolve_name"):
+            return self.build_device(pnp_id, dev_inst, record)
+
+    def iter_registered(self):
+        """
+        遍历注册表中所有可修改滚轮方向的鼠标实例，不检查在线状态 (包括幽灵实例)，
+        yield DeviceRecord；名称为注册表中的基础名称，不沿父节点解析。用于离线批量预置。
+        """
+        for pnp_id, _, _ in self._walk_instances():
+            record = self.read_instance(pnp_id)
+            if record is not None:
+                yield DeviceRecord.from_pnp_id(pnp_id, record["base_name"] or "", record["params"])
+
+    def ghost_report(self) -> dict:
+        """
+        离线报告：遍历注册表中的全部实例 (不使用 GhostIndex)，找出不在线但仍带有 FlipFlopWheel 的实例。
+        返回 {"instances": 遍历的实例数, "absent": 不在线的实例数,
+              "entries": [{"pnp_id", "last_write", "reg_path", "params"}, ...]}
+        """
+        report = {"instances": 0, "absent": 0, "entries": []}
+        for pnp_id, _, last_write in self._walk_instances():
+            report["instances"] += 1
+            if self.backend.get_devnode_status(pnp_id)[0]:
+                continue
+            report["absent"] += 1
+            reg_path = f"{ENUM_ROOT}\\{pnp_id}\\Device Parameters"
+            params = read_parameters(self.backend, reg_path)
+            if params and PARAM_WHEEL in params:
+                report["entries"].append({"pnp_id": pnp_id, "last_write": last_write, "reg_path": reg_path, "params": params})
+        return report
+
+    def read_instance(self, pnp_id: str, check_class: bool = True):
+        """读取实例的注册表信息，不是可修改滚轮方向的鼠标时返回 None"""
+        base_name = self.read_base_name(pnp_id, check_class)
+        if base_name is None:
+            return None
+        return self.read_wheel_record(pnp_id, base_name)
+
+    def read_base_name(self, pnp_id: str, check_class: bool = True):
+        """读取实例键，返回基础名称；实例键不存在或不是鼠标类时返回 None"""
+        # 2. 读取实例键 (ClassGUID 与名称一次读完)
+        info = self.backend.query_values(f"{ENUM_ROOT}\\{pnp_id}", ("ClassGUID", "DeviceDesc", "FriendlyName"))
+        if info is None:
+            return None
+
+        # 严格过滤：只保留鼠标 ClassGUID
+        if check_class:
+            class_guid = info["ClassGUID"]
+            if not class_guid or class_guid.upper() != MOUSE_CLASS_GUID:
+                return None
+
+        # 4. 获取基础名称
+        base_name = info["FriendlyName"] if info["FriendlyName"] else info["DeviceDesc"]
+        if base_name and ";" in base_name:
+            base_name = base_name.split(";")[-1]
+        return base_name or ""
+
+    def read_wheel_record(self, pnp_id: str, base_name: str):
+        """读取 Device Parameters，没有 FlipFlopWheel 时返回 None"""
+        # 3. 一次读出 Device Parameters，检查是否有 FlipFlopWheel
+        # 只有有这个参数的鼠标，我们才能修改滚轮方向
+        params = read_parameters(self.backend, f"{ENUM_ROOT}\\{pnp_id}\\Device Parameters")
+        if params is None or PARAM_WHEEL not in params:
+            # 虽然是鼠标且在线，但没有滚轮反转参数，跳过
+            return None
+        return {"base_name": base_name, "params": params}
+
+    def build_device(self, pnp_id: str, dev_inst: int, record: dict):
+        """根据注册表记录解析真实名称并生成 UI 数据，虚拟设备返回 None"""
+        # 5. 【核心】向上查找获取真实名称 (如 "MX Master 3S")
+        real_name = resolve_real_name(self.snapshot, dev_inst, pnp_id, record["base_name"])
+
+        # 6. 过滤虚拟设备
+        if "Terminal Server" in real_name or "Remote Desktop" in real_name:
+            return None
+
+        # 7. 准备 UI 数据
+        return DeviceRecord.from_pnp_id(pnp_id, real_name, record["params"])
+
+class IncrementalScanner(MouseEnumerator):
+    """
+    增量扫描：记录每个 bus / device-ID 键的 (子键数量, 最后写入时间)，
+    刷新时只重新进入发生变化的子树，其余子树直接复用上次的结果。
+    在线状态由一次 CM_Get_Device_ID_List 调用确认；改写 Device Parameters 中的值不会改变上级键，
+    因此对在线的鼠标类实例再比较一次该键的最后写入时间。没有任何变化时，
+    一次刷新只需要 O(bus 键数量 + 在线设备数量) 次注册表查询，与幽灵实例的数量无关。
+    """
+
+    def __init__(self, backend=None):
+        super().__init__(backend)
+        self._bus_cache = {}  # bus -> (key_info, {device_id: (key_info, [(instance, last_write), ...])})
+        # PNP_ID(大写) -> (基础名称, Device Parameters 最后写入时间, 注册表记录)
+        # 基础名称为 None 表示不是鼠标类实例；记录为 None 表示没有 FlipFlopWheel
+        self._records = {}
+        self._devices = {}    # PNP_ID(大写) -> 上次生成的设备数据，None 表示被过滤
+
+    def invalidate(self):
+        """丢弃所有缓存，下一次 scan() 等同于完整扫描"""
+        self._bus_cache.clear()
+        self._records.clear()
+        self._devices.clear()
+        self.ghosts.clear()
+
+    def iter_scan(self, cancel=None):
+        self.snapshot.invalidate()
+        with instrumentation.span("scan.enumerate"):
+            present = self.backend.get_class_device_ids(MOUSE_CLASS_GUID)
+            self._refresh_tree(deep=present is None, cancel=cancel)
+
+        if present is None:
+            # 没有批量接口：遍历缓存的实例，只对候选鼠标逐个确认在线状态
+            for pnp_id, last_write in self._cached_instances():
+                if _cancelled(cancel):
+                    return
+                if self.ghosts.is_ghost(pnp_id, last_write):
+                    continue
+                device = self._device_for(pnp_id, check_class=True, known_present=False, last_write=last_write)
+                if device:
+                    yield device
+        else:
+            for pnp_id in present:
+                if _cancelled(cancel):
+                    return
+                if pnp_id.split("\\", 1)[0].upper() not in MOUSE_BUS_LIST:
+                    continue
+                # 未变化子树中新出现的实例也会在这里被直接读取
+                device = self._device_for(pnp_id, check_class=False, known_present=True)
+                if device:
+                    yield device
+
+    def _device_for(self, pnp_id: str, check_class: bool, known_present: bool, last_write=None):
+        key = pnp_id.upper()
+        entry = self._records.get(key)
+        fresh = entry is None
+        if fresh:
+            with instrumentation.span("scan.class_filter"):
+                entry = self._records[key] = self._read_entry(pnp_id, check_class)
+        base_name, stamp, record = entry
+        if base_name is None:
+            return None
+
+        dev_inst = 0
+        if not known_present:
+            with instrumentation.span("scan.devnode_status"):
+                is_connected, dev_inst = self.backend.get_devnode_status(pnp_id)
+            if not is_connected:
+                # 离线设备下次上线时需要重新解析名称
+                self._devices.pop(key, None)
+                self.ghosts.add(pnp_id, last_write)
+                return None
+            self.ghosts.discard(pnp_id)
+
+        if not fresh:
+            # 在 regedit 中新建 FlipFlopWheel 或被其他工具改值时，只有 Device Parameters 键本身的最后写入时间会变化
+            with instrumentation.span("scan.class_filter"):
+                current = self._params_stamp(pnp_id)
+                if current != stamp:
+                    record = self.read_wheel_record(pnp_id, base_name)
+                    self._records[key] = (base_name, current, record)
+                    self._devices.pop(key, None)
+        if record is None:
+            return None
+        if key in self._devices:
+            return self._devices[key]
+
+        if not dev_inst:
+            with instrumentation.span("scan.devnode_status"):
+                is_connected, dev_inst = self.backend.get_devnode_status(pnp_id)
+            if not is_connected:
+                return None
+        with instrumentation.span("scan.resolve_name"):
+            self._devices[key] = self.build_device(pnp_id, dev_inst, record)
+        return self._devices[key]
+
+    def _read_entry(self, pnp_id: str, check_class: bool):
+        base_name = self.read_base_name(pnp_id, check_class)
+        if base_name is None:
+            return None, None, None
+        return base_name, self._params_stamp(pnp_id), self.read_wheel_record(pnp_id, base_name)
+
+    def _params_stamp(self, pnp_id: str):
+        """Device Parameters 键的最后写入时间，键不存在时为 None"""
+        try:
+            return self.backend.query_key_info(f"{ENUM_ROOT}\\{pnp_id}\\Device Parameters")[1]
+        except OSError:
+            return None
+
+    def _cached_instances(self):
+        for bus, (_, device_ids) in self._bus_cache.items():
+            for device_id_key_name, (_, instances) in device_ids.items():
+                for instance_name, last_write in instances:
+                    yield f"{bus}\\{device_id_key_name}\\{instance_name}", last_write
+
+    def _forget(self, pnp_id: str):
+        key = pnp_id.upper()
+        self._records.pop(key, None)
+        self._devices.pop(key, None)
+        self.ghosts.discard(pnp_id)
+
+    def _refresh_tree(self, deep: bool = False, cancel=None):
+        """
+        deep=True (没有批量接口时) 不再按 bus / device-ID 键的最后写入时间跳过，
+        而是重新枚举每个 device-ID 键的实例及其最后写入时间：改写实例键不会改变上级键，
+        这样才能发现被重新写入的幽灵实例。每个 device-ID 键一次枚举，远少于逐个确认在线状态。
+        被 cancel 中断时，正在处理的 bus 保留旧的键信息，下一次扫描会重新进入它。
+        """
+        for bus in MOUSE_BUS_LIST:
+            base_path = f"{ENUM_ROOT}\\{bus}"
+            cached = self._bus_cache.get(bus)
+            old_ids = cached[1] if cached else {}
+            try:
+                bus_info = self.backend.query_key_info(base_path)
+                if cached and cached[0] == bus_info and not deep:
+                    continue
+                device_id_names = self.backend.enum_subkeys(base_path)
+            except OSError:
+                device_id_names = []
+                bus_info = None
+
+            new_ids = {}
+            for device_id_key_name in device_id_names:
+                if _cancelled(cancel):
+                    return
+                device_id_path = f"{base_path}\\{device_id_key_name}"
+                old = old_ids.get(device_id_key_name)
+                try:
+                    device_id_info = None if deep else self.backend.query_key_info(device_id_path)
+                    if old and device_id_info is not None and old[0] == device_id_info:
+                        new_ids[device_id_key_name] = old
+                        continue
+                    instances = self.backend.enum_subkey_info(device_id_path)
+                except OSError:
+                    continue
+                new_ids[device_id_key_name] = (device_id_info, instances)
+                # 子树发生变化：只丢弃新增 / 删除 / 被改写的实例的旧记录，按需重新读取
+                for instance_name, _ in set(old[1] if old else ()) ^ set(instances):
+                    self._forget(f"{bus}\\{device_id_key_name}\\{instance_name}")
+
+            for device_id_key_name in old_ids.keys() - new_ids.keys():
+                for instance_name, _ in old_ids[device_id_key_name][1]:
+                    self._forget(f"{bus}\\{device_id_key_name}\\{instance_name}")
+
+            if bus_info is None:
+                self._bus_cache.pop(bus, None)
+            else:
+                self._bus_cache[bus] = (bus_info, new_ids)
+
+class DeviceCache:
+    """
+    持久化的设备列表缓存 (用户目录下的带版本号 JSON 文件)。
+    启动时先用它渲染列表，再在后台做一次廉价的在线检查并剔除过期条目。
+    """
+    VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path or self.default_path()
+
+    @staticmethod
+    def default_path() -> str:
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "MouseWheelManager", "device_cache.json")
+
+    def load(self) -> list:
+        """读取缓存，文件不存在、损坏或版本不匹配时返回空列表"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return []
+        devices = []
+        for entry in data.get("devices", []):
+            try:
+                devices.append(DeviceRecord.from_dict(entry))
+            except ValueError:
+                continue
+        return devices
+
+    def save(self, devices) -> bool:
+        """原子写入：先写临时文件再替换，避免中途退出留下半个文件"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "devices": [dev.to_dict() for dev in devices]}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            print(f"Error: 无法写入设备缓存 {self.path}: {e}")
+            return False
+
+    @staticmethod
+    def validate(devices, backend=None) -> list:
+        """廉价的在线检查：返回缓存中仍然在线的设备 (不解析名称、不读注册表)"""
+        backend = backend or WIN32_BACKEND
+        present = backend.get_class_device_ids(MOUSE_CLASS_GUID)
+        if present is not None:
+            present_ids = {pnp_id.upper() for pnp_id in present}
+            return [dev for dev in devices if dev.pnp_id.upper() in present_ids]
+        return [dev for dev in devices if backend.get_devnode_status(dev.pnp_id)[0]]
+
+# =========================================================================
+# 4. 设备插拔通知
+# =========================================================================
+
+# GUID_DEVINTERFACE_MOUSE：鼠标设备接口类
+GUID_DEVINTERFACE_MOUSE = GUID(0x378de44c, 0x56ef, 0x11d1, (ctypes.c_ubyte * 8)(0xbc, 0x8c, 0x00, 0xa0, 0xc9, 0x14, 0x05, 0xdd))
+CM_NOTIFY_FILTER_TYPE_DEVICEINTERFACE = 0
+CM_NOTIFY_ACTION_DEVICEINTERFACEARRIVAL = 0
+CM_NOTIFY_ACTION_DEVICEINTERFACEREMOVAL = 1
+
+DEVICE_ARRIVAL = "arrival"
+DEVICE_REMOVAL = "removal"
+
+class _CM_NOTIFY_FILTER_UNION(ctypes.Union):
+    _fields_ = [("ClassGuid", GUID), ("InstanceId", ctypes.c_wchar * 200)]
+
+class CM_NOTIFY_FILTER(ctypes.Structure):
+    _fields_ = [("cbSize", wintypes.DWORD), ("Flags", wintypes.DWORD),
+                ("FilterType", wintypes.DWORD), ("Reserved", wintypes.DWORD),
+                ("u", _CM_NOTIFY_FILTER_UNION)]
+
+# 回调使用 stdcall；非 Windows 上退回 CFUNCTYPE 仅为了让模块可以导入
+_FUNCTYPE = getattr(ctypes, "WINFUNCTYPE", ctypes.CFUNCTYPE)
+CM_NOTIFY_CALLBACK = _FUNCTYPE(wintypes.DWORD, ctypes.c_void_p, ctypes.c_void_p,
+                               wintypes.DWORD, ctypes.c_void_p, wintypes.DWORD)
+
+def interface_path_to_instance_id(symbolic_link: str) -> str:
+    """把接口符号链接 (\\\\?\\HID#VID_xxxx&PID_xxxx#7&...#{接口GUID}) 转换成设备实例 ID"""
+    path = symbolic_link
+    if path.startswith("\\\\?\\"):
+        path = path[4:]
+    path = path.rsplit("#", 1)[0]  # 去掉末尾的接口类 GUID
+    return path.replace("#", "\\").upper()
+
+class DeviceEventSource:
+    """
+    设备插拔事件源接口。
+    start(callback) 之后，每个事件以 callback(action, pnp_id) 的形式报告，
+    action 为 DEVICE_ARRIVAL / DEVICE_REMOVAL；callback 可能在任意线程上被调用。
+    测试时可以换成按脚本回放事件的假实现。
+    """
+
+    def start(self, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+class Win32DeviceEventSource(DeviceEventSource):
+    """通过 CM_Register_Notification 订阅鼠标设备接口的到达/移除通知"""
+
+    def __init__(self):
+        self._handle = None
+        self._callback = None  # 必须保持引用，否则回调会被回收
+
+    def start(self, callback) -> bool:
+        def on_notify(h_notify, context, action, event_data, event_data_size):
+            if action in (CM_NOTIFY_ACTION_DEVICEINTERFACEARRIVAL, CM_NOTIFY_ACTION_DEVICEINTERFACEREMOVAL):
+                # CM_NOTIFY_EVENT_DATA: FilterType, Reserved, ClassGuid 之后紧跟 SymbolicLink
+                link = ctypes.wstring_at(event_data + 8 + ctypes.sizeof(GUID))
+                kind = DEVICE_ARRIVAL if action == CM_NOTIFY_ACTION_DEVICEINTERFACEARRIVAL else DEVICE_REMOVAL
+                callback(kind, interface_path_to_instance_id(link))
+            return 0
+
+        notify_filter = CM_NOTIFY_FILTER()
+        notify_filter.cbSize = ctypes.sizeof(CM_NOTIFY_FILTER)
+        notify_filter.FilterType = CM_NOTIFY_FILTER_TYPE_DEVICEINTERFACE
+        notify_filter.u.ClassGuid = GUID_DEVINTERFACE_MOUSE
+
+        self._callback = CM_NOTIFY_CALLBACK(on_notify)
+        handle = ctypes.c_void_p()
+        try:
+            ret = cfgmgr32.CM_Register_Notification(ctypes.byref(notify_filter), None, self._callback, ctypes.byref(handle))
+        except AttributeError:
+            # Windows 8 之前没有该 API，只能手动刷新
+            ret = -1
+        if ret != CR_SUCCESS:
+            print(f"Error: 注册设备通知失败，错误代码: {ret}")
+            self._callback = None
+            return False
+        self._handle = handle
+        return True
+
+    def stop(self):
+        if self._handle:
+            cfgmgr32.CM_Unregister_Notification(self._handle)
+            self._handle = None
+        self._callback = None
+
+class HotplugMonitor:
+    """
+    把插拔事件合并成对设备列表的增量修改。
+    同一设备在 quiet 秒内的重复/抖动事件只保留最后一个，且只有最终状态
+    与当前已知状态不同时才会产生 ("added", device) 或 ("removed", pnp_id)。
+    """
+
+    def __init__(self, source: DeviceEventSource, enumerator=None, quiet: float = 0.5, clock=time.monotonic):
+        self.source = source
+        self.enumerator = enumerator or MouseEnumerator()
+        self.quiet = quiet
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pending = {}   # PNP_ID(大写) -> (action, 最后一次事件时间)
+        self._known = set()  # 当前列表中的 PNP_ID(大写)
+
+    def start(self, devices=()):
+        self.reset(devices)
+        return self.source.start(self._on_event)
+
+    def stop(self):
+        self.source.stop()
+
+    def reset(self, devices):
+        """完整扫描之后用新的设备列表同步已知状态"""
+        with self._lock:
+            self._known = {dev.pnp_id.upper() for dev in devices}
+
+    def _on_event(self, action: str, pnp_id: str):
+        with self._lock:
+            self._pending[pnp_id.upper()] = (action, self.clock())
+
+    def poll(self) -> list:
+        """取出已经稳定下来的事件，返回增量列表 (在 UI 线程上调用)"""
+        now = self.clock()
+        with self._lock:
+            settled = [(pnp_id, action) for pnp_id, (action, stamp) in self._pending.items()
+                       if now - stamp >= self.quiet]
+            for pnp_id, _ in settled:
+                del self._pending[pnp_id]
+
+        deltas = []
+        if settled:
+            self.enumerator.snapshot.invalidate()
+        for pnp_id, action in settled:
+            if action == DEVICE_REMOVAL:
+                if pnp_id in self._known:
+                    self._known.discard(pnp_id)
+                    deltas.append(("removed", pnp_id))
+            elif pnp_id not in self._known and pnp_id.split("\\", 1)[0] in MOUSE_BUS_LIST:
+                device = self.enumerator.probe(pnp_id)
+                if device:
+                    self._known.add(pnp_id)
+                    deltas.append(("added", device))
+        return deltas
+
+# =========================================================================
+# 5. 设备重启状态机
+# =========================================================================
+
+# 等待设备停止 / 重新启动的默认超时 (秒)
+RESTART_DISABLE_TIMEOUT = 3.0
+RESTART_ENABLE_TIMEOUT = 5.0
+
+class DeviceRestarter:
+    """
+    禁用 -> 轮询确认已停止 -> 启用 -> 轮询确认 DN_STARTED。
+    轮询间隔从 initial_delay 开始翻倍，最大 max_delay，取代原来固定的 sleep(1.0)。
+    clock / sleep 可以替换，便于用模拟的 devnode 测试。
+    """
+
+    def __init__(self, backend=None, disable_timeout=RESTART_DISABLE_TIMEOUT, enable_timeout=RESTART_ENABLE_TIMEOUT,
+                 initial_delay=0.005, max_delay=0.1, clock=time.monotonic, sleep=time.sleep):
+        self.backend = backend or WIN32_BACKEND
+        self.disable_timeout = disable_timeout
+        self.enable_timeout = enable_timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+
+    def restart(self, pnp_id: str) -> dict:
+        """
+        返回结果字典：
+        ok              是否已确认设备重新启动
+        stage           结束时所处的阶段 (locate / disable / wait_disabled / enable / wait_started / done)
+        disable_latency 从发出禁用到确认停止的耗时 (秒)，未确认时为 None
+        enable_latency  从发出启用到确认 DN_STARTED 的耗时 (秒)，未确认时为 None
+        error           失败原因
+        """
+        with instrumentation.span("restart"):
+            result = self._restart(pnp_id)
+        instrumentation.observe("restart.disable", result["disable_latency"])
+        instrumentation.observe("restart.enable", result["enable_latency"])
+        return result
+
+    def _restart(self, pnp_id: str) -> dict:
+        result = {"pnp_id": pnp_id, "ok": False, "stage": "locate",
+                  "disable_latency": None, "enable_latency": None, "error": None}
+
+        # 1. 重新获取句柄 (确保句柄是最新的)
+        dev_inst = self.backend.locate_devnode(pnp_id)
+        if not dev_inst:
+            return self._fail(result, f"无法定位设备 {pnp_id}")
+
+        # 2. 禁用设备，并等待它真正停止
+        result["stage"] = "disable"
+        ret = self.backend.disable_devnode(dev_inst)
+        if ret != CR_SUCCESS:
+            return self._fail(result, f"禁用设备失败，错误代码: {ret}")
+
+        result["stage"] = "wait_disabled"
+        result["disable_latency"] = self._wait(dev_inst, lambda flags: not flags & DN_STARTED, self.disable_timeout)
+        disable_error = None
+        if result["disable_latency"] is None:
+            # 即使没等到停止也必须继续启用，否则设备会一直处于禁用状态
+            disable_error = "等待设备停止超时"
+
+        # 3. 启用设备，并等待 DN_STARTED
+        result["stage"] = "enable"
+        ret = self.backend.enable_devnode(dev_inst)
+        if ret != CR_SUCCESS:
+            return self._fail(result, f"启用设备失败，错误代码: {ret}")
+
+        result["stage"] = "wait_started"
+        result["enable_latency"] = self._wait(dev_inst, lambda flags: flags & DN_STARTED, self.enable_timeout)
+        if result["enable_latency"] is None:
+            return self._fail(result, "等待设备重新启动超时")
+        if disable_error:
+            return self._fail(result, disable_error)
+
+        result["stage"] = "done"
+        result["ok"] = True
+        return result
+
+    def wait_started(self, pnp_id: str, timeout: float = None):
+        """等待某个设备 (例如父节点重启后重新枚举出来的子设备) 出现并进入 DN_STARTED"""
+        timeout = self.enable_timeout if timeout is None else timeout
+        start = self.clock()
+        delay = self.initial_delay
+        while True:
+            if self.backend.get_devnode_status(pnp_id)[0]:
+                return self.clock() - start
+            if self.clock() - start >= timeout:
+                return None
+            self.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+
+    def _wait(self, dev_inst: int, condition, timeout: float):
+        """轮询 CM_Get_DevNode_Status 直到 condition 成立，返回耗时；超时返回 None"""
+        start = self.clock()
+        delay = self.initial_delay
+        while True:
+            if condition(self.backend.get_status_flags(dev_inst)):
+                return self.clock() - start
+            if self.clock() - start >= timeout:
+                return None
+            self.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+
+    @staticmethod
+    def _fail(result: dict, error: str) -> dict:
+        print(f"Error: {error}")
+        result["error"] = error
+        return result
+
+# 批量应用时同时重启的设备数量上限
+MAX_PARALLEL_RESTARTS = 4
+
+RESTART_EACH_CHILD = "child"
+RESTART_SHARED_PARENT = "parent"
+
+class RestartPlanner:
+    """
+    为一组待生效的设备挑选最少的 devnode 进行重启。
+
+    RESTART_EACH_CHILD    : 每个设备各自重启一次。
+    RESTART_SHARED_PARENT : 同一个父节点下有多个待重启的子设备时 (例如一个接收器
+                            暴露出的多个 HID 集合)，只重启父节点一次。只有当父节点与
+                            子设备的 VID/PID 相同 (属于同一个物理设备) 时才会合并，
+                            避免把蓝牙适配器、USB Hub 之类的共享节点整个重启。
+    """
+
+    def __init__(self, backend=None, mode: str = RESTART_SHARED_PARENT):
+        if mode not in (RESTART_EACH_CHILD, RESTART_SHARED_PARENT):
+            raise ValueError(f"未知的重启模式: {mode}")
+        self.backend = backend or WIN32_BACKEND
+        self.mode = mode
+
+    def plan(self, pnp_ids) -> list:
+        """返回重启步骤列表：{"target": 要重启的设备 ID, "covers": [受益的设备 ID], "reason": 说明}"""
+        pending = list(dict.fromkeys(pnp_ids))
+        if self.mode == RESTART_EACH_CHILD:
+            return [{"target": pnp_id, "covers": [pnp_id], "reason": "逐个重启"} for pnp_id in pending]
+
+        # 按"重启哪个节点"分组：可合并的设备归到父节点，其余归到自己
+        # (待重启的设备本身也可能是另一个待重启设备的父节点)
+        groups = {}  # 目标 ID(大写) -> (目标 ID, [受益的设备 ID])
+        for pnp_id in pending:
+            target = self._shared_parent(pnp_id) or pnp_id
+            groups.setdefault(target.upper(), (target, []))[1].append(pnp_id)
+
+        steps = []
+        for target, children in groups.values():
+            if len(children) > 1:
+                steps.append({"target": target, "covers": children,
+                              "reason": f"{len(children)} 个设备共享同一父节点，只重启一次"})
+            else:
+                steps.extend({"target": pnp_id, "covers": [pnp_id], "reason": "单独重启"} for pnp_id in children)
+        return steps
+
+    def _shared_parent(self, pnp_id: str) -> str:
+        """返回可以代替该设备重启的父节点 ID，没有时返回空字符串"""
+        dev_inst = self.backend.locate_devnode(pnp_id)
+        if not dev_inst:
+            return ""
+        parent_inst = self.backend.get_parent(dev_inst)
+        if not parent_inst:
+            return ""
+        parent_id = self.backend.get_device_id(parent_inst)
+        hardware = parse_vid_pid(pnp_id)
+        if not parent_id or hardware is None or parse_vid_pid(parent_id) != hardware:
+            return ""
+        return parent_id
+
+    @staticmethod
+    def explain(steps) -> str:
+        """dry-run：把重启计划格式化成可读文本"""
+        lines = [f"共 {len(steps)} 次重启："]
+        for i, step in enumerate(steps, 1):
+            lines.append(f"{i}. 重启 {step['target']}  ({step['reason']})")
+            if step["covers"] != [step["target"]]:
+                lines.extend(f"     -> {pnp_id}" for pnp_id in step["covers"])
+        return "\n".join(lines)
+
+    def execute(self, steps, max_workers: int = MAX_PARALLEL_RESTARTS, restarter=None) -> dict:
+        """并发执行重启计划，返回 {设备 ID: 对应步骤的重启结果}"""
+        restarter = restarter or DeviceRestarter(self.backend)
+
+        def run(step):
+            outcome = restarter.restart(step["target"])
+            if outcome["ok"] and step["covers"] != [step["target"]]:
+                # 重启的是父节点：等待所有子设备重新枚举并启动
+                for pnp_id in step["covers"]:
+                    if restarter.wait_started(pnp_id) is None:
+                        outcome = dict(outcome, ok=False, error=f"子设备未能重新启动: {pnp_id}")
+                        break
+            return outcome
+
+        results = {}
+        if not steps:
+            return results
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(steps)))) as pool:
+            for step, outcome in zip(steps, pool.map(run, steps)):
+                for pnp_id in step["covers"]:
+                    results[pnp_id] = outcome
+        return results
+
+def apply_to_devices(devices, values: dict, backend=None, max_workers: int = MAX_PARALLEL_RESTARTS, restart: bool = True,
+                     restart_mode: str = RESTART_SHARED_PARENT, restarter=None) -> list:
+    """
+    批量修改滚轮参数 (values 如 {PARAM_WHEEL: 1})：先为所有目标写入，再用线程池并发重启，
+    总停机时间接近一次重启，而不是 N 次串行重启。
+    restart_mode 决定共享父节点的设备是否合并为一次父节点重启 (见 RestartPlanner)，
+    restarter 传给 RestartPlanner.execute() (默认 DeviceRestarter(backend))。
+    返回每个设备的结果：{"pnp_id", "name", "written", "restart"}，
+    restart 为 DeviceRestarter.restart() 的结果 (未重启时为 None)。
+    """
+    backend = backend or WIN32_BACKEND
+    results = [{
+        "pnp_id": dev.pnp_id,
+        "name": dev.name,
+        "written": backend.write_values(dev.reg_path, values),
+        "restart": None,
+    } for dev in devices]
+
+    to_restart = [r["pnp_id"] for r in results if r["written"]]
+    if restart and to_restart:
+        planner = RestartPlanner(backend, restart_mode)
+        outcomes = planner.execute(planner.plan(to_restart), max_workers, restarter)
+        for r in results:
+            r["restart"] = outcomes.get(r["pnp_id"])
+    return results
+
+# 连续点击时，最后一次点击后等待多久才真正写入并重启 (秒)
+APPLY_DEBOUNCE = 0.4
+
+def commit_change(device: DeviceRecord, values: dict, backend=None, restarter=None) -> dict:
+    """
+    单个设备的修改事务 (values 如 {PARAM_WHEEL: 1, PARAM_HSCROLL: 0})：
+    快照旧值 -> 一次写入所有变化的参数 -> 重启 -> 回读校验。
+    重启失败或回读不一致时把注册表恢复为旧值；如果设备已经被重启过，
+    会再重启一次让驱动重新加载旧值。
+    返回 {"pnp_id", "name", "values", "previous", "ok", "unchanged", "restart", "rolled_back", "error"}
+    """
+    backend = backend or WIN32_BACKEND
+    restarter = restarter or DeviceRestarter(backend)
+    result = {"pnp_id": device.pnp_id, "name": device.name, "values": dict(values), "previous": None,
+              "ok": False, "unchanged": False, "restart": None, "rolled_back": False, "error": None}
+
+    # 1. 快照
+    previous = read_parameters(backend, device.reg_path) or {}
+    result["previous"] = previous
+    changed = {name: value for name, value in values.items() if previous.get(name, 0) != value}
+    if not changed:
+        # 连续点击后最终值与原值相同：什么都不用做
+        result["ok"] = result["unchanged"] = True
+        return result
+
+    # 2. 写入 (一次打开键)
+    if not backend.write_values(device.reg_path, changed):
+        result["error"] = "无法写入注册表，请确保以管理员权限运行。"
+        return result
+
+    # 3. 重启 + 回读校验
+    restart = restarter.restart(device.pnp_id)
+    result["restart"] = restart
+    if restart["ok"]:
+        current = read_parameters(backend, device.reg_path) or {}
+        if all(current.get(name) == value for name, value in changed.items()):
+            result["ok"] = True
+            return result
+        result["error"] = "重启后回读的取值与写入的不一致"
+    else:
+        result["error"] = restart["error"]
+
+    # 4. 回滚 (原来不存在的参数会被删除)
+    if backend.write_values(device.reg_path, {name: previous.get(name) for name in changed}):
+        result["rolled_back"] = True
+        if restart["stage"] not in ("locate", "disable"):
+            restarter.restart(device.pnp_id)
+    return result
+
+class ApplyCoordinator:
+    """
+    合并同一设备上的连续修改：quiet 秒内多次 submit() 按参数合并，每个参数只保留最后一个值，
+    然后在后台线程中通过 commit_change() 以事务方式提交 (只重启一次)。
+    提交过程中又有新的修改时，等本次提交结束后再处理。
+    每个事务的结果通过 on_result(result) 回调报告 (在后台线程上调用)。
+    """
+
+    def __init__(self, backend=None, quiet: float = APPLY_DEBOUNCE, on_result=None, restarter=None):
+        self.backend = backend or WIN32_BACKEND
+        self.quiet = quiet
+        self.on_result = on_result
+        self.restarter = restarter
+        self._lock = threading.Lock()
+        self._pending = {}  # PNP_ID(大写) -> (device, {参数名: 值})
+        self._timers = {}
+        self._busy = set()
+
+    def submit(self, device: DeviceRecord, values: dict):
+        key = device.pnp_id.upper()
+        with self._lock:
+            pending = self._pending[key][1] if key in self._pending else {}
+            self._pending[key] = (device, dict(pending, **values))
+            self._schedule(key)
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            return bool(self._pending or self._busy)
+
+    def is_pending(self, pnp_id: str) -> bool:
+        """该设备是否还有等待提交或正在提交的修改"""
+        key = pnp_id.upper()
+        with self._lock:
+            return key in self._pending or key in self._busy
+
+    def flush(self):
+        """立即提交所有待处理的修改 (例如退出前)，在调用线程上同步执行"""
+        with self._lock:
+            keys = list(self._pending)
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+        for key in keys:
+            self._commit(key)
+
+    def _schedule(self, key: str):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        timer = threading.Timer(self.quiet, self._commit, args=(key,))
+        timer.daemon = True
+        self._timers[key] = timer
+        timer.start()
+
+    def _commit(self, key: str):
+        with self._lock:
+            self._timers.pop(key, None)
+            if key in self._busy or key not in self._pending:
+                return
+            device, values = self._pending.pop(key)
+            self._busy.add(key)
+
+        try:
+            result = commit_change(device, values, self.backend, self.restarter)
+        except Exception as e:
+            result = {"pnp_id": device.pnp_id, "name": device.name, "values": values, "previous": None,
+                      "ok": False, "unchanged": False, "restart": None, "rolled_back": False, "error": str(e)}
+        finally:
+            with self._lock:
+                self._busy.discard(key)
+                if key in self._pending:
+                    # 提交期间又有新的修改
+                    self._schedule(key)
+
+        if self.on_result:
+            self.on_result(result)
+
+# =========================================================================
+# 6. 设备状态缓存与注册表变更通知
+# =========================================================================
+
+advapi32 = windll.advapi32 if windll else None
+kernel32 = windll.kernel32 if windll else None
+
+ERROR_SUCCESS = 0
+REG_NOTIFY_CHANGE_LAST_SET = 0x00000004
+WAIT_OBJECT_0 = 0x00000000
+INFINITE = 0xFFFFFFFF
+MAXIMUM_WAIT_OBJECTS = 64
+
+try:
+    kernel32.CreateEventW.argtypes = [ctypes.c_void_p, wintypes.BOOL, wintypes.BOOL, wintypes.LPCWSTR]
+    kernel32.CreateEventW.restype = wintypes.HANDLE
+    kernel32.SetEvent.argtypes = [wintypes.HANDLE]
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    kernel32.WaitForMultipleObjects.argtypes = [wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE), wintypes.BOOL, wintypes.DWORD]
+    kernel32.WaitForMultipleObjects.restype = wintypes.DWORD
+    advapi32.RegNotifyChangeKeyValue.argtypes = [wintypes.HANDLE, wintypes.BOOL, wintypes.DWORD, wintypes.HANDLE, wintypes.BOOL]
+    advapi32.RegNotifyChangeKeyValue.restype = wintypes.LONG
+    advapi32.RegEnumKeyExW.argtypes = [wintypes.HANDLE, wintypes.DWORD, wintypes.LPWSTR, ctypes.POINTER(wintypes.DWORD),
+                                       ctypes.c_void_p, wintypes.LPWSTR, ctypes.POINTER(wintypes.DWORD),
+                                       ctypes.POINTER(wintypes.FILETIME)]
+    advapi32.RegEnumKeyExW.restype = wintypes.LONG
+except AttributeError:
+    pass
+
+class RegistryWatcher:
+    """
+    注册表变更通知接口。
+    watch(paths, callback) 设置要监视的键 (HKLM 下的相对路径)，返回实际被监视的路径集合；
+    之后任一键的值发生变化时，在后台线程上调用 callback(path)。
+    failed 为 True 表示通知已经失效，此时不能再信任任何缓存。
+    测试时可以换成手动触发通知的假实现。
+    """
+    failed = False
+
+    def watch(self, paths, callback) -> set:
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+class Win32RegistryWatcher(RegistryWatcher):
+    """用一个后台线程对每个键调用 RegNotifyChangeKeyValue，并用 WaitForMultipleObjects 等待"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._paths = []
+        self._callback = None
+        self._stopped = False
+        self._thread = None
+        self._wake = kernel32.CreateEventW(None, False, False, None)
+
+    def watch(self, paths, callback) -> set:
+        # 第 0 个等待句柄留给唤醒事件，所以最多监视 63 个键
+        if self.failed:
+            return set()
+        paths = list(dict.fromkeys(paths))[:MAXIMUM_WAIT_OBJECTS - 1]
+        with self._lock:
+            changed = paths != self._paths
+            self._paths = paths
+            self._callback = callback
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            elif changed:
+                kernel32.SetEvent(self._wake)
+        return set(paths)
+
+    def stop(self):
+        self._stopped = True
+        kernel32.SetEvent(self._wake)
+
+    def _run(self):
+        # 通知注册必须在一直存活的线程上完成，因此打开键、注册、等待都在本线程里进行
+        while not self._stopped:
+            with self._lock:
+                paths = list(self._paths)
+                callback = self._callback
+
+            watched = []
+            for path in paths:
+                try:
+                    key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path, 0, winreg.KEY_NOTIFY)
+                except OSError:
+                    continue
+                event = kernel32.CreateEventW(None, False, False, None)
+                advapi32.RegNotifyChangeKeyValue(key.handle, False, REG_NOTIFY_CHANGE_LAST_SET, event, True)
+                watched.append((path, key, event))
+
+            handles = (wintypes.HANDLE * (len(watched) + 1))(self._wake, *[event for _, _, event in watched])
+            try:
+                while not self._stopped:
+                    index = kernel32.WaitForMultipleObjects(len(handles), handles, False, INFINITE) - WAIT_OBJECT_0
+                    if index == 0:
+                        # 被唤醒 (监视列表变化 / 停止)：重新建立监视
+                        break
+                    if index > len(watched):
+                        # 等待失败：放弃监视，并让所有缓存失效 (之后 watch() 不再返回任何路径)
+                        print(f"Error: 注册表变更通知失败，错误代码: {ctypes.GetLastError()}")
+                        self._stopped = self.failed = True
+                        for path, _, _ in watched:
+                            callback(path)
+                        break
+                    path, key, event = watched[index - 1]
+                    # 通知是一次性的，先重新注册再回调
+                    advapi32.RegNotifyChangeKeyValue(key.handle, False, REG_NOTIFY_CHANGE_LAST_SET, event, True)
+                    callback(path)
+            finally:
+                for _, key, event in watched:
+                    key.Close()
+                    kernel32.CloseHandle(event)
+
+class StateCache:
+    """
+    各设备 Device Parameters 中滚轮参数的缓存 (一次读出整个键)。
+    只有被 watcher 监视的键才会被缓存；键发生变化时缓存失效并调用 on_change(reg_path)
+    (在 watcher 的后台线程上)。hits / misses 记录命中情况。
+    每次失效都会增加对应键的代数；未命中时只有读取期间代数没有变化才写入缓存，
+    避免把通知到达之前读出的旧值存进去。
+    """
+
+    def __init__(self, backend=None, watcher: RegistryWatcher = None, on_change=None):
+        self.backend = backend or WIN32_BACKEND
+        self.watcher = watcher
+        self.on_change = on_change
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._values = {}      # reg_path(大写) -> {参数名: 值}
+        self._watched = set()  # reg_path(大写)
+        self._generations = {} # reg_path(大写) -> 失效次数
+        self._epoch = 0        # 整体失效次数
+
+    def watch(self, reg_paths):
+        """设置需要监视 (从而可以缓存) 的设备参数键"""
+        if self.watcher is None:
+            return
+        watched = self.watcher.watch(list(reg_paths), self._on_registry_change)
+        with self._lock:
+            self._watched = {path.upper() for path in watched}
+            self._values = {path: value for path, value in self._values.items() if path in self._watched}
+
+    def get_params(self, reg_path: str) -> dict:
+        """返回 {参数名: 值}，不存在的参数不出现在结果中"""
+        key = reg_path.upper()
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                return dict(self._values[key])
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(key, 0))
+
+        params = read_parameters(self.backend, reg_path) or {}
+        with self._lock:
+            unchanged = generation == (self._epoch, self._generations.get(key, 0))
+            if unchanged and key in self._watched and not self.watcher.failed:
+                self._values[key] = params
+        return dict(params)
+
+    def get(self, reg_path: str, name: str = PARAM_WHEEL) -> int:
+        return self.get_params(reg_path).get(name, 0)
+
+    def invalidate(self, reg_path: str = None):
+        with self._lock:
+            if reg_path is None:
+                self._values.clear()
+                self._epoch += 1
+            else:
+                key = reg_path.upper()
+                self._values.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached": len(self._values), "watched": len(self._watched)}
+
+    def _on_registry_change(self, reg_path: str):
+        self.invalidate(reg_path)
+        if self.on_change:
+            self.on_change(reg_path)
+
+def is_admin():
+    try: return windll.shell32.IsUserAnAdmin()
+    except: return False
+
+def run_as_admin():
+    executable = sys.executable.replace("python.exe", "pythonw.exe")
+    windll.shell32.ShellExecuteW(None, "runas", executable, " ".join(sys.argv), None, 0)
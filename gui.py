@@ -0,0 +1,671 @@
+import queue
+import threading
+import time
+import customtkinter as ctk
+from tkinter import messagebox
+
+from device_list import KeyedDeviceList, VirtualDeviceList
+from devices import (
+    MouseEnumerator,
+    IncrementalScanner,
+    DeviceCache,
+    DeviceIndex,
+    HotplugMonitor,
+    Win32DeviceEventSource,
+    ApplyCoordinator,
+    StateCache,
+    Win32RegistryWatcher,
+    PARAM_WHEEL,
+    PARAM_HSCROLL,
+    apply_to_devices,
+)
+
+# =========================================================================
+# UI 部分
+# =========================================================================
+
+# 定义设计系统颜色和字体
+THEME = {
+    "bg_left": ("#F3F4F6", "#1F2937"),      # 侧边栏背景
+    "bg_right": ("#FFFFFF", "#111827"),     # 主区域背景
+    "accent": "#3B82F6",                    # 强调色 (蓝)
+    "accent_hover": "#2563EB",
+    "text_main": ("#111827", "#F9FAFB"),    # 主文本
+    "text_sub": ("#6B7280", "#9CA3AF"),     # 副文本
+    "card_bg": ("#F9FAFB", "#374151"),      # 卡片背景
+    "success": "#10B981",                   # 成功/Win模式
+    "warning": "#F59E0B",                   # 警告/Mac模式
+    "list_hover": ("#E5E7EB", "#374151"),   # 列表悬停
+    "list_selected": ("#DBEAFE", "#1E3A8A") # 列表选中
+}
+
+FONT_MAIN = ("Segoe UI", 14)
+FONT_BOLD = ("Segoe UI", 14, "bold")
+FONT_TITLE = ("Segoe UI", 24, "bold")
+FONT_SUB = ("Segoe UI", 12)
+
+# 后台扫描结果的轮询间隔 (毫秒)
+SCAN_POLL_MS = 30
+# 插拔事件的轮询间隔 (毫秒)
+HOTPLUG_POLL_MS = 200
+# 修改结果的轮询间隔 (毫秒)
+APPLY_POLL_MS = 100
+# 注册表变更通知的轮询间隔 (毫秒)
+STATE_POLL_MS = 200
+# 设备数量超过该值时改用只渲染可见行的列表 (见 device_list.py)
+VIRTUAL_LIST_THRESHOLD = 40
+
+class App(ctk.CTk):
+    def __init__(self):
+        super().__init__()
+        self.title("Mouse Wheel Manager")
+        self.geometry("800x550")
+        
+        ctk.set_appearance_mode("System")
+        ctk.set_default_color_theme("blue")
+
+        self.devices = DeviceIndex()  # 按 PNP ID 索引，迭代顺序即列表顺序
+        self.scanner = IncrementalScanner()
+        self.device_cache = DeviceCache()
+        self.selected_device = None
+        self.device_list = None
+        self.checked_ids = set()  # PNP_ID(大写)：插拔通知产生的记录与扫描结果的 PNP ID 大小写可能不同
+        self._scan_cancel = None
+        self._scan_lock = threading.Lock()
+        self._scan_count = 0
+        self._apply_results = queue.Queue()
+        self._apply_polling = False
+        self._optimistic = {}  # PNP_ID(大写) -> 已点击但尚未提交完成的参数
+        self.apply_coordinator = ApplyCoordinator(on_result=self._apply_results.put)
+        self._batch_thread = None
+        self._closing = False
+        # 滚轮参数缓存：其他工具修改注册表时由后台监视线程通知刷新
+        self._state_changes = queue.Queue()
+        self.state_cache = StateCache(watcher=Win32RegistryWatcher(), on_change=self._state_changes.put)
+
+        self.setup_layout()
+
+        # 订阅插拔通知，设备连接/断开时增量更新列表。
+        # 监视器用自己的枚举器 (扫描在后台线程上进行)，但共享扫描器的 GhostIndex，
+        # 重新插入的设备才不会在下一次遍历时被当成幽灵实例跳过
+        self.hotplug = HotplugMonitor(Win32DeviceEventSource(), MouseEnumerator(ghosts=self.scanner.ghosts))
+        if self.hotplug.start():
+            self.after(HOTPLUG_POLL_MS, self._poll_hotplug)
+
+        self.after(STATE_POLL_MS, self._poll_state_changes)
+        # 关闭窗口时先把尚未提交的修改写完，避免丢失或让设备停在禁用状态
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 先用上次的缓存立即渲染列表，再到后台校验并完整扫描
+        cached = self.device_cache.load()
+        if cached:
+            self.devices = DeviceIndex(cached)
+            self.render_list()
+            self.start_cache_check()
+        else:
+            self.refresh_list()
+
+    def setup_layout(self):
+        self.grid_columnconfigure(1, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        # === 左侧边栏 ===
+        self.left_frame = ctk.CTkFrame(self, width=280, corner_radius=0, fg_color=THEME["bg_left"])
+        self.left_frame.grid(row=0, column=0, sticky="nsew")
+        self.left_frame.grid_rowconfigure(3, weight=1)
+
+        self.brand_label = ctk.CTkLabel(
+            self.left_frame, 
+            text="🖱️ 鼠标配置", 
+            font=("Segoe UI", 20, "bold"),
+            text_color=THEME["text_main"]
+        )
+        self.brand_label.grid(row=0, column=0, padx=20, pady=(30, 20), sticky="w")
+
+        self.btn_refresh = ctk.CTkButton(
+            self.left_frame, 
+            text="🔄  刷新列表", 
+            font=FONT_BOLD,
+            height=40,
+            fg_color=THEME["accent"],
+            hover_color=THEME["accent_hover"],
+            corner_radius=8,
+            command=self.refresh_list
+        )
+        self.btn_refresh.grid(row=1, column=0, padx=20, pady=(0, 20), sticky="ew")
+
+        self.lbl_list_header = ctk.CTkLabel(
+            self.left_frame, text="在线设备", font=FONT_SUB, text_color=THEME["text_sub"], anchor="w"
+        )
+        self.lbl_list_header.grid(row=2, column=0, padx=20, pady=(0,5), sticky="nw")
+
+        # 丢弃增量扫描缓存的完整扫描，只在怀疑缓存不可信时手动使用
+        self.btn_full_rescan = ctk.CTkButton(
+            self.left_frame,
+            text="完整扫描",
+            font=FONT_SUB,
+            width=64,
+            height=22,
+            fg_color="transparent",
+            hover_color=THEME["list_hover"],
+            text_color=THEME["text_sub"],
+            command=lambda: self.refresh_list(invalidate=True)
+        )
+        self.btn_full_rescan.grid(row=2, column=0, padx=20, pady=(0,5), sticky="ne")
+
+        self._ensure_list_mode()
+
+        # 批量应用：勾选多个设备后一次性修改并并发重启
+        self.batch_frame = ctk.CTkFrame(self.left_frame, fg_color="transparent")
+        self.batch_frame.grid(row=4, column=0, padx=20, pady=(0, 20), sticky="ew")
+
+        self.chk_all = ctk.CTkCheckBox(
+            self.batch_frame, text="全选", font=FONT_SUB, text_color=THEME["text_sub"],
+            checkbox_width=18, checkbox_height=18, command=self.toggle_check_all
+        )
+        self.chk_all.pack(anchor="w", pady=(0, 8))
+
+        self.btn_batch_mac = ctk.CTkButton(
+            self.batch_frame,
+            text="🍎 勾选项设为 Mac",
+            font=FONT_SUB,
+            height=32,
+            fg_color=THEME["warning"],
+            corner_radius=8,
+            command=lambda: self.apply_batch(1)
+        )
+        self.btn_batch_mac.pack(fill="x", pady=(0, 5))
+
+        self.btn_batch_win = ctk.CTkButton(
+            self.batch_frame,
+            text="🪟 勾选项设为 Windows",
+            font=FONT_SUB,
+            height=32,
+            fg_color=THEME["success"],
+            corner_radius=8,
+            command=lambda: self.apply_batch(0)
+        )
+        self.btn_batch_win.pack(fill="x")
+
+        # === 右侧主内容区 ===
+        self.right_frame = ctk.CTkFrame(self, corner_radius=0, fg_color=THEME["bg_right"])
+        self.right_frame.grid(row=0, column=1, sticky="nsew")
+        
+        self.empty_state = ctk.CTkFrame(self.right_frame, fg_color="transparent")
+        self.empty_state.place(relx=0.5, rely=0.5, anchor="center")
+        ctk.CTkLabel(self.empty_state, text="👈", font=("Segoe UI", 48)).pack()
+        ctk.CTkLabel(self.empty_state, text="请在左侧选择一个设备\n以开始配置", font=FONT_MAIN, text_color=THEME["text_sub"]).pack(pady=10)
+
+        self.content_area = ctk.CTkFrame(self.right_frame, fg_color="transparent")
+        
+        self.info_frame = ctk.CTkFrame(self.content_area, fg_color=THEME["card_bg"], corner_radius=12)
+        self.info_frame.pack(fill="x", pady=(40, 20), padx=40)
+        
+        self.lbl_name = ctk.CTkLabel(self.info_frame, text="Device Name", font=FONT_TITLE, text_color=THEME["text_main"], anchor="w")
+        self.lbl_name.pack(padx=20, pady=(20, 5), fill="x")
+        
+        self.lbl_id = ctk.CTkLabel(self.info_frame, text="VID:PID", font=("Consolas", 12), text_color=THEME["text_sub"], anchor="w")
+        self.lbl_id.pack(padx=20, pady=(0, 20), fill="x")
+
+        self.status_container = ctk.CTkFrame(self.content_area, fg_color="transparent")
+        self.status_container.pack(fill="x", padx=40, pady=10)
+        
+        ctk.CTkLabel(self.status_container, text="当前滚轮行为", font=FONT_BOLD, text_color=THEME["text_main"]).pack(anchor="w", pady=(0,10))
+        
+        self.status_indicator = ctk.CTkButton(
+            self.status_container,
+            text="--",
+            font=("Segoe UI", 16, "bold"),
+            height=60,
+            corner_radius=10,
+            fg_color=THEME["list_hover"],
+            text_color_disabled=THEME["text_main"],
+            state="disabled"
+        )
+        self.status_indicator.pack(fill="x")
+
+        self.action_container = ctk.CTkFrame(self.content_area, fg_color="transparent")
+        self.action_container.pack(fill="x", padx=40, pady=30)
+        
+        ctk.CTkLabel(self.action_container, text="修改设置", font=FONT_BOLD, text_color=THEME["text_main"]).pack(anchor="w", pady=(0,10))
+
+        self.btn_mac = ctk.CTkButton(
+            self.action_container, 
+            text="🍎 Mac 模式\n(自然滚动/反转)", 
+            font=FONT_MAIN,
+            height=80,
+            fg_color=THEME["bg_left"],
+            border_width=2,
+            border_color=THEME["bg_left"],
+            text_color=THEME["text_main"],
+            hover_color=THEME["list_hover"],
+            corner_radius=10,
+            command=lambda: self.apply_setting({PARAM_WHEEL: 1})
+        )
+        self.btn_mac.pack(fill="x", pady=5)
+
+        self.btn_win = ctk.CTkButton(
+            self.action_container, 
+            text="🪟 Windows 模式\n(传统滚动/默认)", 
+            font=FONT_MAIN,
+            height=80,
+            fg_color=THEME["bg_left"],
+            border_width=2,
+            border_color=THEME["bg_left"],
+            text_color=THEME["text_main"],
+            hover_color=THEME["list_hover"],
+            corner_radius=10,
+            command=lambda: self.apply_setting({PARAM_WHEEL: 0})
+        )
+        self.btn_win.pack(fill="x", pady=5)
+
+        self.switch_hscroll = ctk.CTkSwitch(
+            self.action_container,
+            text="同时反转水平滚动 (FlipFlopHScroll)",
+            font=FONT_MAIN,
+            text_color=THEME["text_main"],
+            progress_color=THEME["accent"],
+            command=lambda: self.apply_setting({PARAM_HSCROLL: int(self.switch_hscroll.get())})
+        )
+        self.switch_hscroll.pack(anchor="w", pady=(10, 0))
+
+        # 提示文案修改
+        self.lbl_hint = ctk.CTkLabel(
+            self.content_area, 
+            text="ℹ️ 修改设置后，鼠标会短暂暂停响应以自动重启设备", 
+            font=("Segoe UI", 11), 
+            text_color=THEME["text_sub"]
+        )
+        self.lbl_hint.pack(side="bottom", pady=20)
+
+    def refresh_list(self, invalidate: bool = False):
+        """
+        启动后台流式扫描；扫描过程中再次点击会取消当前扫描并重新开始。
+        默认为增量扫描 (只重新进入发生变化的子树)；invalidate=True ("完整扫描") 时先丢弃
+        IncrementalScanner 的全部缓存和 GhostIndex，等同于一次冷扫描。
+        """
+        self.cancel_scan()
+        self._scan_count += 1
+        cancel = threading.Event()
+        results = queue.Queue()
+        self._scan_cancel = cancel
+        self._scan_seen = set()
+        self.set_scanning(True)
+
+        def worker():
+            try:
+                # 等待上一次被取消的扫描退出，避免并发访问 scanner
+                with self._scan_lock:
+                    if invalidate:
+                        self.scanner.invalidate()
+                    # 取消在扫描器内部逐个键检查，被取消的扫描会尽快释放 _scan_lock
+                    for dev in self.scanner.iter_scan(cancel):
+                        if cancel.is_set():
+                            return
+                        results.put(("device", dev))
+                    if not cancel.is_set():
+                        results.put(("done", None))
+            except Exception as e:
+                print(f"Error: 后台扫描失败: {e}")
+                results.put(("failed", None))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.after(SCAN_POLL_MS, lambda: self._poll_scan(results, cancel))
+
+    def cancel_scan(self):
+        if self._scan_cancel:
+            self._scan_cancel.set()
+            self._scan_cancel = None
+
+    def set_scanning(self, scanning: bool):
+        if scanning:
+            self.lbl_list_header.configure(text="在线设备  ·  扫描中…")
+            self.btn_refresh.configure(text="⏳  扫描中 (点击重新扫描)")
+        else:
+            self.lbl_list_header.configure(text="在线设备")
+            self.btn_refresh.configure(text="🔄  刷新列表")
+
+    def _poll_scan(self, results, cancel):
+        """Tk 线程：把后台扫描确认的设备逐个加入列表"""
+        if cancel.is_set():
+            return
+        try:
+            while True:
+                kind, dev = results.get_nowait()
+                if kind == "device":
+                    self._add_scanned_device(dev)
+                elif kind == "done":
+                    self._finish_scan()
+                    return
+                else:
+                    self._scan_cancel = None
+                    self.set_scanning(False)
+                    return
+        except queue.Empty:
+            pass
+        self.after(SCAN_POLL_MS, lambda: self._poll_scan(results, cancel))
+
+    def _add_scanned_device(self, dev):
+        self._scan_seen.add(dev.pnp_id.upper())
+        self.devices.add(dev)
+        # 只会为新设备创建一行；已有的行没有变化时不会被改动
+        self.sync_list()
+
+    def _finish_scan(self):
+        """扫描完成：移除本次未再出现的设备，排序后重新渲染并写入缓存"""
+        self._scan_cancel = None
+        self.devices = DeviceIndex(MouseEnumerator.sort_devices(
+            [dev for dev in self.devices if dev.pnp_id.upper() in self._scan_seen]
+        ))
+        self.device_cache.save(self.devices)
+        self.hotplug.reset(self.devices)
+        self.set_scanning(False)
+        self.render_list()
+
+    def _poll_hotplug(self):
+        deltas = self.hotplug.poll()
+        if deltas:
+            self.apply_hotplug(deltas)
+        self.after(HOTPLUG_POLL_MS, self._poll_hotplug)
+
+    def apply_hotplug(self, deltas):
+        """把插拔增量应用到 self.devices 和按钮列表，无需完整扫描"""
+        removed = {pnp_id.upper() for kind, pnp_id in deltas if kind == "removed"}
+        for kind, dev in deltas:
+            if kind == "added" and dev.pnp_id not in self.devices:
+                self.devices.add(dev)
+                if self._scan_cancel:
+                    self._scan_seen.add(dev.pnp_id.upper())
+        if removed:
+            for pnp_id in removed:
+                self.devices.discard(pnp_id)
+            if self.selected_device and self.selected_device.pnp_id.upper() in removed:
+                # 当前选中的设备被拔出：回到空白提示
+                self.selected_device = None
+                self.content_area.pack_forget()
+                self.empty_state.place(relx=0.5, rely=0.5, anchor="center")
+
+        self.devices = DeviceIndex(MouseEnumerator.sort_devices(list(self.devices)))
+        self.device_cache.save(self.devices)
+        self.render_list()
+
+    def start_cache_check(self):
+        """后台线程先剔除已离线的缓存设备，然后再开始完整的流式扫描"""
+        results = queue.Queue()
+        cached = list(self.devices)
+        scan_count = self._scan_count
+
+        def worker():
+            try:
+                results.put(DeviceCache.validate(cached))
+            except Exception as e:
+                print(f"Error: 缓存校验失败: {e}")
+                results.put(None)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.set_scanning(True)
+        self.after(SCAN_POLL_MS, lambda: self._poll_cache_check(results, scan_count))
+
+    def _poll_cache_check(self, results, scan_count):
+        try:
+            devices = results.get_nowait()
+        except queue.Empty:
+            self.after(SCAN_POLL_MS, lambda: self._poll_cache_check(results, scan_count))
+            return
+        # 校验期间用户已经手动刷新，则以那次扫描为准
+        if scan_count != self._scan_count:
+            return
+        if devices is not None:
+            self.devices = DeviceIndex(devices)
+            self.render_list()
+        self.refresh_list()
+
+    def _poll_state_changes(self):
+        """外部工具修改了某个设备的 FlipFlopWheel：如果正好是当前设备则自动刷新界面"""
+        changed = set()
+        try:
+            while True:
+                changed.add(self._state_changes.get_nowait().upper())
+        except queue.Empty:
+            pass
+
+        # 自己还有待提交的修改时不刷新，避免覆盖刚点击的乐观显示
+        if (self.selected_device and self.selected_device.reg_path.upper() in changed
+                and not self.apply_coordinator.has_pending()):
+            self.update_status_ui()
+        self.after(STATE_POLL_MS, self._poll_state_changes)
+
+    def render_list(self):
+        self.state_cache.watch(dev.reg_path for dev in self.devices)
+        self.sync_list()
+
+    def sync_list(self):
+        """按 PNP ID 把 self.devices 同步到左侧列表，只创建 / 销毁增删的行"""
+        self._ensure_list_mode()
+        self.device_list.sync(self.devices, self.checked_ids)
+
+        # 列表更新后保持当前选中项 (设备数据可能已被新的扫描结果替换)
+        selected = self.devices.get(self.selected_device.pnp_id) if self.selected_device else None
+        if selected is not None:
+            self.selected_device = selected
+        self.device_list.select(selected.pnp_id if selected else None)
+
+    def _ensure_list_mode(self):
+        """设备数量超过 VIRTUAL_LIST_THRESHOLD 时切换为循环复用行的列表，反之切回普通列表"""
+        virtual = len(self.devices) > VIRTUAL_LIST_THRESHOLD
+        if self.device_list is not None and isinstance(self.device_list, VirtualDeviceList) == virtual:
+            return
+        if self.device_list is not None:
+            self.device_list.frame.destroy()
+        list_class = VirtualDeviceList if virtual else KeyedDeviceList
+        self.device_list = list_class(self.left_frame, ctk, THEME, self.select_device, self.toggle_checked)
+        self.device_list.frame.grid(row=3, column=0, padx=10, pady=(0, 10), sticky="nsew")
+
+    def toggle_checked(self, pnp_id, checked):
+        if checked:
+            self.checked_ids.add(pnp_id.upper())
+        else:
+            self.checked_ids.discard(pnp_id.upper())
+            self.chk_all.deselect()
+
+    def toggle_check_all(self):
+        if self.chk_all.get():
+            self.checked_ids = {dev.pnp_id.upper() for dev in self.devices}
+        else:
+            self.checked_ids.clear()
+        self.device_list.set_checked(self.checked_ids)
+
+    def select_device(self, pnp_id):
+        device = self.devices.get(pnp_id)
+        if device is None:
+            return
+        self.selected_device = device
+        # 只重新着色旧的和新的选中行
+        self.device_list.select(pnp_id)
+
+        self.empty_state.place_forget()
+        self.content_area.pack(fill="both", expand=True)
+
+        self.lbl_name.configure(text=self.selected_device.name)
+        self.lbl_id.configure(text=self.selected_device.pnp_id)
+        
+        self.update_status_ui()
+
+    def update_status_ui(self):
+        params = self.state_cache.get_params(self.selected_device.reg_path)
+        # 尚未提交完成的修改先按目标值显示
+        params.update(self._optimistic.get(self.selected_device.pnp_id.upper(), {}))
+        val = params.get(PARAM_WHEEL, 0)
+        if params.get(PARAM_HSCROLL, 0):
+            self.switch_hscroll.select()
+        else:
+            self.switch_hscroll.deselect()
+        hide_border_color = THEME["bg_left"]
+
+        if val == 1:
+            # === 场景：Mac 模式激活 ===
+            self.status_indicator.configure(
+                text="已启用：Mac 自然滚动", 
+                fg_color=THEME["warning"], 
+                text_color="#FFFFFF"
+            )
+            self.btn_mac.configure(
+                border_color=THEME["warning"], 
+                fg_color=THEME["bg_left"], 
+                text_color=THEME["warning"]
+            )
+            self.btn_win.configure(
+                border_color=hide_border_color, 
+                fg_color=THEME["bg_left"], 
+                text_color=THEME["text_sub"]
+            )
+        else:
+            # === 场景：Windows 模式激活 ===
+            self.status_indicator.configure(
+                text="已启用：Windows 默认滚动", 
+                fg_color=THEME["success"], 
+                text_color="#FFFFFF"
+            )
+            self.btn_mac.configure(
+                border_color=hide_border_color, 
+                fg_color=THEME["bg_left"], 
+                text_color=THEME["text_sub"]
+            )
+            self.btn_win.configure(
+                border_color=THEME["success"], 
+                fg_color=THEME["bg_left"], 
+                text_color=THEME["success"]
+            )
+
+    def apply_setting(self, values):
+        """界面立即切换；真正的写入和重启由 ApplyCoordinator 合并连续点击后在后台完成"""
+        self._optimistic.setdefault(self.selected_device.pnp_id.upper(), {}).update(values)
+        self.update_status_ui()
+        # 更改鼠标光标为“忙碌”状态，提示用户正在处理
+        self.configure(cursor="watch")
+        self.apply_coordinator.submit(self.selected_device, values)
+        if not self._apply_polling:
+            self._apply_polling = True
+            self.after(APPLY_POLL_MS, self._poll_apply)
+
+    def _poll_apply(self):
+        try:
+            while True:
+                self.show_apply_result(self._apply_results.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self.apply_coordinator.has_pending() or not self._apply_results.empty():
+            self.after(APPLY_POLL_MS, self._poll_apply)
+        else:
+            self._apply_polling = False
+            self.configure(cursor="") # 恢复鼠标光标
+
+    def show_apply_result(self, result):
+        # 提交期间又点击过时，乐观值比本次结果新，要保留到最后一次提交完成
+        pnp_id = result['pnp_id'].upper()
+        if (self._optimistic.get(pnp_id) == result["values"]
+                or not self.apply_coordinator.is_pending(pnp_id)):
+            self._optimistic.pop(pnp_id, None)
+        if self.selected_device and self.selected_device.pnp_id.upper() == pnp_id:
+            # 不等注册表通知到达，直接丢弃缓存重新读取
+            self.state_cache.invalidate(self.selected_device.reg_path)
+            self.update_status_ui()
+
+        if result["unchanged"]:
+            return
+        if result["ok"]:
+            # 成功：无需插拔
+            restart = result["restart"]
+            downtime_ms = (restart["disable_latency"] + restart["enable_latency"]) * 1000
+            messagebox.showinfo(
+                "设置已生效", 
+                "✅ 配置已更新并自动重载！\n\n设备已在后台自动重启（Disable -> Enable），新设置已立即生效。"
+                f"\n(重启耗时约 {downtime_ms:.0f} ms)"
+            )
+        elif result["restart"] is None:
+            messagebox.showerror("错误", result["error"])
+        elif result["rolled_back"]:
+            # 失败（极少情况，例如设备正忙）：已恢复原来的设置
+            messagebox.showwarning(
+                "设置未生效",
+                f"⚠️ 自动重启设备失败：{result['error']}\n\n已恢复为原来的设置，请稍后重试或手动拔插鼠标接收器。"
+            )
+        else:
+            messagebox.showwarning(
+                "设置已保存", 
+                "✅ 配置已写入注册表。\n\n⚠️ 自动重启设备失败，请手动拔插鼠标接收器以生效。"
+            )
+
+    def apply_batch(self, val):
+        """对所有勾选的设备写入设置，并在后台线程中并发重启"""
+        targets = [dev for dev in self.devices if dev.pnp_id.upper() in self.checked_ids]
+        if not targets:
+            messagebox.showinfo("批量应用", "请先在左侧勾选要修改的设备。")
+            return
+
+        self.btn_batch_mac.configure(state="disabled")
+        self.btn_batch_win.configure(state="disabled")
+        self.configure(cursor="watch")
+        results = queue.Queue()
+        started = time.monotonic()
+
+        def worker():
+            try:
+                results.put(apply_to_devices(targets, {PARAM_WHEEL: val}))
+            except Exception as e:
+                print(f"Error: 批量应用失败: {e}")
+                results.put([])
+
+        self._batch_thread = threading.Thread(target=worker, daemon=True)
+        self._batch_thread.start()
+        self.after(SCAN_POLL_MS, lambda: self._poll_batch(results, started))
+
+    def _poll_batch(self, results, started):
+        try:
+            outcome = results.get_nowait()
+        except queue.Empty:
+            self.after(SCAN_POLL_MS, lambda: self._poll_batch(results, started))
+            return
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.configure(cursor="")
+        self.btn_batch_mac.configure(state="normal")
+        self.btn_batch_win.configure(state="normal")
+        self.state_cache.invalidate()
+        if self.selected_device:
+            self.update_status_ui()
+
+        not_written = [r['name'] for r in outcome if not r['written']]
+        not_restarted = [r['name'] for r in outcome if r['written'] and not (r['restart'] and r['restart']['ok'])]
+        if not outcome:
+            messagebox.showerror("错误", "批量应用失败，请确保以管理员权限运行。")
+        elif not not_written and not not_restarted:
+            messagebox.showinfo(
+                "设置已生效",
+                f"✅ 已更新 {len(outcome)} 个设备并自动重载 (总耗时约 {elapsed_ms:.0f} ms)。"
+            )
+        else:
+            lines = []
+            if not_written:
+                lines.append("❌ 无法写入注册表：\n" + "\n".join(not_written))
+            if not_restarted:
+                lines.append("⚠️ 已写入但自动重启失败，请手动拔插：\n" + "\n".join(not_restarted))
+            messagebox.showwarning("部分设备未生效", "\n\n".join(lines))
+
+    def on_close(self):
+        """立即提交防抖中的修改，等后台事务和批量应用都结束后再销毁窗口"""
+        if self._closing:
+            return
+        self._closing = True
+        self.configure(cursor="watch")
+        self.apply_coordinator.flush()
+        self._poll_close()
+
+    def _poll_close(self):
+        batch_running = self._batch_thread is not None and self._batch_thread.is_alive()
+        if self.apply_coordinator.has_pending() or batch_running:
+            self.after(APPLY_POLL_MS, self._poll_close)
+            return
+        self.hotplug.stop()
+        self.destroy()
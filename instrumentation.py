@@ -0,0 +1,154 @@
+"""
+轻量级性能埋点：span 计时 + 调用计数，可导出为 JSON lines 或 Prometheus 文本格式。
+
+默认关闭：未调用 enable() 时 span() 返回共享的空上下文，count() / observe() 直接返回，
+开销只有一次全局变量判断。命令行通过 --profile <文件> 开启：
+
+    python main.py --profile scan.jsonl list
+    python main.py --profile restart.prom set "*MX Master*" mac
+
+span 名称约定：
+    scan                 一次完整扫描 (MouseEnumerator.scan)
+    scan.enumerate       CM_Get_Device_ID_List / 注册表 Enum 子键枚举
+    scan.devnode_status  CM_Locate_DevNode + CM_Get_DevNode_Status
+    scan.class_filter    读取实例键 (ClassGUID / 名称) 和 Device Parameters
+    scan.resolve_name    沿父节点解析真实名称
+    restart              一次设备重启 (DeviceRestarter.restart)
+    restart.disable      从发出禁用到确认停止
+    restart.enable       从发出启用到确认 DN_STARTED
+计数器名称为 "<cfgmgr|registry>.<后端方法名>"，统计 Win32Backend 的每次调用；
+alloc.cfgmgr 为 cfgmgr.py 绑定层新分配 (或扩大) 的缓冲区个数。
+"""
+import functools
+import json
+import threading
+import time
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder, name: str):
+        self.recorder = recorder
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = self.recorder.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.observe(self.name, self.recorder.clock() - self.start)
+        return False
+
+class Recorder:
+    """按名称汇总耗时 (次数 / 总和 / 最大值) 和调用计数，可在多个线程中同时使用"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.timings = {}   # span 名称 -> [次数, 总耗时(秒), 最大耗时(秒)]
+        self.counters = {}  # 计数器名称 -> 次数
+
+    def span(self, name: str):
+        return _Span(self, name)
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                self.timings[name] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> list:
+        """返回 [{"type": "span", ...}, {"type": "counter", ...}]，按名称排序"""
+        with self._lock:
+            spans = [{"type": "span", "name": name, "count": count, "total": total, "max": peak}
+                     for name, (count, total, peak) in sorted(self.timings.items())]
+            counters = [{"type": "counter", "name": name, "value": value}
+                        for name, value in sorted(self.counters.items())]
+        return spans + counters
+
+    def to_json_lines(self) -> str:
+        return "".join(json.dumps(entry) + "\n" for entry in self.report())
+
+    def to_prometheus(self) -> str:
+        entries = self.report()
+        spans = [e for e in entries if e["type"] == "span"]
+        counters = [e for e in entries if e["type"] == "counter"]
+        lines = ["# TYPE mousewheel_span_seconds summary"]
+        for e in spans:
+            lines.append(f'mousewheel_span_seconds_sum{{span="{e["name"]}"}} {e["total"]:.6f}')
+            lines.append(f'mousewheel_span_seconds_count{{span="{e["name"]}"}} {e["count"]}')
+        lines.append("# TYPE mousewheel_span_seconds_max gauge")
+        for e in spans:
+            lines.append(f'mousewheel_span_seconds_max{{span="{e["name"]}"}} {e["max"]:.6f}')
+        lines.append("# TYPE mousewheel_calls_total counter")
+        for e in counters:
+            lines.append(f'mousewheel_calls_total{{call="{e["name"]}"}} {e["value"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """扩展名为 .prom 时写 Prometheus 文本格式，否则写 JSON lines"""
+        text = self.to_prometheus() if path.lower().endswith(".prom") else self.to_json_lines()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+_recorder = None
+
+def enable(recorder: Recorder = None) -> Recorder:
+    global _recorder
+    _recorder = recorder or Recorder()
+    return _recorder
+
+def disable():
+    """关闭埋点，返回之前的 Recorder (没有时为 None)"""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+def current():
+    return _recorder
+
+def span(name: str):
+    recorder = _recorder
+    return _NULL_SPAN if recorder is None else recorder.span(name)
+
+def observe(name: str, seconds: float):
+    recorder = _recorder
+    if recorder is not None and seconds is not None:
+        recorder.observe(name, seconds)
+
+def count(name: str, n: int = 1):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.count(name, n)
+
+def counted(category: str):
+    """装饰后端方法：每次调用计入 "<category>.<方法名>" 计数器"""
+    def decorator(func):
+        name = f"{category}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is not None:
+                recorder.count(name)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,234 @@
+"""
+声明式配置：按名称 / VID / PID / 总线匹配设备并指定滚轮方向 (mode) 和水平滚动反转 (hscroll)，
+与当前 FlipFlopWheel / FlipFlopHScroll 对比后只修改 (并重启) 真正不一致的设备。
+
+配置文件格式 (JSON)：
+    {
+        "version": 1,
+        "default": "windows",                      # 可选：没有规则命中时的取值
+        "rules": [
+            {"match": {"name": "*Magic*"}, "mode": "mac", "hscroll": "on"},
+            {"match": {"vid": "05AC"}, "mode": "mac"},
+            {"match": {"bus": "BTHENUM", "pid": "0269"}, "hscroll": "off"},
+            {"match": "HID\\VID_046D&PID_C52B&MI_01&COL01\\7&...", "mode": "windows"}
+        ]
+    }
+
+match 中的各字段必须同时满足；name / pnp_id 支持通配符，不区分大小写。
+vid / pid 也可以写成带 * / ? 的 4 位十六进制通配符 (如 {"vid": "046D", "pid": "C5*"})。
+match 直接写成字符串时等同于命令行的 <pnp_id|名称通配符>。
+每条规则至少指定 mode / hscroll 之一，default 只作用于 mode。
+规则按顺序匹配，每个参数以最后一条设置了它的命中规则为准。
+"""
+import fnmatch
+import json
+import re
+
+from devices import PARAM_HSCROLL, PARAM_WHEEL, WIN32_BACKEND, DeviceIndex, DeviceRecord, read_parameters
+
+PROFILE_VERSION = 1
+
+# FlipFlopWheel 的取值
+MODES = {"mac": 1, "windows": 0}
+# FlipFlopHScroll 的取值
+HSCROLL_STATES = {"on": 1, "off": 0}
+
+MATCH_FIELDS = ("name", "pnp_id", "vid", "pid", "bus")
+
+ACTION_CHANGE = "change"
+ACTION_KEEP = "keep"
+
+def mode_name(value) -> str:
+    return "mac" if value == 1 else "windows"
+
+def hscroll_name(value) -> str:
+    return "on" if value == 1 else "off"
+
+# 参数名 -> (显示名, 取值格式化)
+PARAM_LABELS = {
+    PARAM_WHEEL: ("mode", mode_name),
+    PARAM_HSCROLL: ("hscroll", hscroll_name),
+}
+
+def describe_change(current, wanted: dict) -> str:
+    """如 "mode: windows -> mac, hscroll: off"；current 为 None 表示无法读取，缺失的参数按 0 处理"""
+    parts = []
+    for name, value in wanted.items():
+        label, fmt = PARAM_LABELS[name]
+        if current is None:
+            parts.append(f"{label}: ? -> {fmt(value)}")
+        elif current.get(name, 0) != value:
+            parts.append(f"{label}: {fmt(current.get(name, 0))} -> {fmt(value)}")
+        else:
+            parts.append(f"{label}: {fmt(value)}")
+    return ", ".join(parts)
+
+def _hex_id(value: str) -> int:
+    # 蓝牙设备的 VID 带有来源前缀 (如 0002046D)，只比较低 16 位
+    return int(value, 16) & 0xFFFF
+
+_HEX_PATTERN_RE = re.compile(r"[0-9A-Fa-f*?]+")
+
+def _is_wildcard(value: str) -> bool:
+    return any(char in value for char in "*?[")
+
+def _hex_id_matches(actual: str, pattern: str) -> bool:
+    """pattern 为十六进制 ID，或与 4 位写法比较的通配符 (如 "C5*")"""
+    if _is_wildcard(pattern):
+        return fnmatch.fnmatchcase(f"{_hex_id(actual):04X}", pattern.upper())
+    return _hex_id(actual) == _hex_id(pattern)
+
+class ProfileRule:
+    def __init__(self, match, mode: str = None, hscroll: str = None):
+        if mode is None and hscroll is None:
+            raise ValueError("规则至少需要指定 mode 或 hscroll")
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"无效的 mode: {mode}")
+        if hscroll is not None and hscroll not in HSCROLL_STATES:
+            raise ValueError(f"无效的 hscroll: {hscroll}")
+        if isinstance(match, str):
+            self.match = match
+        elif isinstance(match, dict) and match and set(match) <= set(MATCH_FIELDS):
+            self.match = {key: str(value) for key, value in match.items()}
+            for key in ("vid", "pid"):
+                if key not in self.match:
+                    continue
+                # 提前校验十六进制格式
+                if _is_wildcard(self.match[key]):
+                    if not _HEX_PATTERN_RE.fullmatch(self.match[key]):
+                        raise ValueError(f"无效的 {key}: {self.match[key]}")
+                else:
+                    _hex_id(self.match[key])
+        else:
+            raise ValueError(f"无效的 match: {match}")
+        self.mode = mode
+        self.hscroll = hscroll
+        self.values = {}
+        if mode is not None:
+            self.values[PARAM_WHEEL] = MODES[mode]
+        if hscroll is not None:
+            self.values[PARAM_HSCROLL] = HSCROLL_STATES[hscroll]
+
+    def matches(self, device: DeviceRecord) -> bool:
+        if isinstance(self.match, str):
+            return (device.pnp_id.upper() == self.match.upper()
+                    or fnmatch.fnmatch(device.name.lower(), self.match.lower()))
+
+        if "name" in self.match and not fnmatch.fnmatch(device.name.lower(), self.match["name"].lower()):
+            return False
+        if "pnp_id" in self.match and not fnmatch.fnmatch(device.pnp_id.upper(), self.match["pnp_id"].upper()):
+            return False
+        if "bus" in self.match and device.bus.upper() != self.match["bus"].upper():
+            return False
+        if "vid" in self.match or "pid" in self.match:
+            # VID / PID 在创建记录时已经解析
+            if device.vid is None:
+                return False
+            if "vid" in self.match and not _hex_id_matches(device.vid, self.match["vid"]):
+                return False
+            if "pid" in self.match and not _hex_id_matches(device.pid, self.match["pid"]):
+                return False
+        return True
+
+    def exact_pnp_id(self):
+        """只按一个不含通配符的 pnp_id 匹配时返回该 ID，否则返回 None"""
+        if isinstance(self.match, dict) and set(self.match) == {"pnp_id"} and not _is_wildcard(self.match["pnp_id"]):
+            return self.match["pnp_id"]
+        return None
+
+    def describe(self) -> str:
+        if isinstance(self.match, str):
+            return self.match
+        return " ".join(f"{key}={value}" for key, value in self.match.items())
+
+class Profile:
+    def __init__(self, rules, default: str = None):
+        if default is not None and default not in MODES:
+            raise ValueError(f"无效的 default: {default}")
+        self.rules = list(rules)
+        self.default = default
+        # 精确的 pnp_id 规则按 PNP ID 索引 (导出的批量计划中可能有上千条)，其余规则对每个设备逐条匹配
+        self._exact = {}
+        self._general = []
+        for position, rule in enumerate(self.rules):
+            pnp_id = rule.exact_pnp_id()
+            if pnp_id is None:
+                self._general.append((position, rule))
+            else:
+                self._exact.setdefault(pnp_id.upper(), []).append((position, rule))
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+            raise ValueError("缺少 rules 列表")
+        if data.get("version", PROFILE_VERSION) != PROFILE_VERSION:
+            raise ValueError(f"不支持的配置版本: {data.get('version')}")
+        rules = []
+        for rule in data["rules"]:
+            if not isinstance(rule, dict) or "match" not in rule:
+                raise ValueError(f"无效的规则: {rule}")
+            rules.append(ProfileRule(rule["match"], rule.get("mode"), rule.get("hscroll")))
+        return cls(rules, data.get("default"))
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def resolve(self, device: DeviceRecord):
+        """返回 ({参数名: 期望取值}, 命中的规则说明)，没有规则命中且没有 default 时返回 ({}, None)"""
+        wanted, described = {}, []
+        candidates = self._general
+        exact = self._exact.get(device.pnp_id.upper())
+        if exact:
+            candidates = sorted(self._general + exact, key=lambda item: item[0])
+        for _, rule in candidates:
+            if rule.matches(device):
+                wanted.update(rule.values)
+                described.append(rule.describe())
+        if PARAM_WHEEL not in wanted and self.default is not None:
+            wanted[PARAM_WHEEL] = MODES[self.default]
+            described.append("default")
+        return wanted, ("; ".join(described) or None)
+
+    def plan(self, devices, backend=None) -> list:
+        """
+        与当前注册表取值对比，返回每个受管设备的计划：
+        {"device", "current", "wanted", "rule", "action"}，current / wanted 为 {参数名: 值}，
+        action 为 ACTION_CHANGE / ACTION_KEEP。没有规则命中的设备不出现在计划中。
+        """
+        backend = backend or WIN32_BACKEND
+        entries = []
+        for device in devices:
+            wanted, rule = self.resolve(device)
+            if not wanted:
+                continue
+            # 一次读出整个 Device Parameters 键
+            current = read_parameters(backend, device.reg_path)
+            keep = current is not None and all(current.get(name, 0) == value for name, value in wanted.items())
+            entries.append({
+                "device": device,
+                "current": current,
+                "wanted": wanted,
+                "rule": rule,
+                "action": ACTION_KEEP if keep else ACTION_CHANGE,
+            })
+        return entries
+
+def explain_plan(entries) -> str:
+    changes = sum(1 for entry in entries if entry["action"] == ACTION_CHANGE)
+    lines = [f"{len(entries)} 个受管设备，{changes} 个需要修改："]
+    for entry in entries:
+        marker = "*" if entry["action"] == ACTION_CHANGE else " "
+        lines.append(f"{marker} {entry['device'].name}  ({entry['device'].pnp_id})\n"
+                     f"      {describe_change(entry['current'], entry['wanted'])}  [规则: {entry['rule']}]")
+    return "\n".join(lines)
+
+def find_targets(devices, pattern: str) -> list:
+    """命令行 / 代理的 <pnp_id|名称通配符>：先按 PNP ID 精确匹配 (不区分大小写)，没有命中时再按名称通配符匹配"""
+    index = devices if isinstance(devices, DeviceIndex) else DeviceIndex(devices)
+    exact = index.get(pattern)
+    if exact is not None:
+        return [exact]
+    rule = ProfileRule({"name": pattern}, "windows")
+    return [dev for dev in index if rule.matches(dev)]
@@ -0,0 +1,130 @@
+"""
+离线批量预置 (制作镜像 / 批量部署)：把各实例的滚轮设置导出为紧凑的版本化文件，
+再一次性写入注册表中所有匹配的实例 (包括当前不在线的)，最后只重启受影响的在线设备。
+
+    python main.py export wheel-plan.json [--online]
+    python main.py import wheel-plan.json [--reg wheel-plan.reg] [--dry-run] [--no-restart]
+
+文件格式与 profiles.py 的配置文件相同 (version / default / rules)。导出时每个 VID/PID 一条规则，
+取该型号多数实例的设置；与之不同的实例以 pnp_id 规则单独列在后面 (后面的规则优先)：
+
+    {"version": 1, "rules": [
+    {"match": {"vid": "046D", "pid": "C52B"}, "mode": "mac", "hscroll": "off"},
+    {"match": {"pnp_id": "HID\\VID_046D&PID_C52B&MI_01&COL01\\7&..."}, "mode": "windows", "hscroll": "off"}
+    ]}
+
+手写的计划可以用通配符一次覆盖一类设备，例如 {"match": {"vid": "046D", "pid": "C5*"}, "mode": "mac"}。
+导入时只写入取值确实需要变化的参数 (每个 Device Parameters 键打开一次)；
+--reg 输出与之等价的 .reg 文件，可在镜像中用 reg import 导入。
+"""
+import json
+from collections import Counter
+
+from devices import (
+    MOUSE_CLASS_GUID,
+    PARAM_HSCROLL,
+    PARAM_WHEEL,
+    RESTART_SHARED_PARENT,
+    WHEEL_PARAMETERS,
+    WIN32_BACKEND,
+    MouseEnumerator,
+    RestartPlanner,
+)
+from profiles import PROFILE_VERSION, hscroll_name, mode_name
+
+def _rule(match: dict, values: dict) -> dict:
+    return {"match": match, "mode": mode_name(values[PARAM_WHEEL]), "hscroll": hscroll_name(values[PARAM_HSCROLL])}
+
+def export_plan(devices) -> dict:
+    """
+    把设备 (DeviceRecord，params 为当前取值) 的设置压缩成配置文件格式：
+    每个 VID/PID 一条规则，与型号多数设置不同的实例和没有 VID/PID 的实例各一条 pnp_id 规则。
+    """
+    models = {}     # (VID, PID) -> [(设备, 取值)]
+    overrides = []
+    for dev in devices:
+        values = {name: dev.params.get(name, 0) for name in WHEEL_PARAMETERS}
+        if dev.vid is None:
+            overrides.append(_rule({"pnp_id": dev.pnp_id}, values))
+        else:
+            # 蓝牙设备的 VID 带有来源前缀 (如 0002046D)，与 USB 写法统一为低 16 位
+            model = (int(dev.vid, 16) & 0xFFFF, int(dev.pid, 16) & 0xFFFF)
+            models.setdefault(model, []).append((dev, values))
+
+    rules = []
+    for (vid, pid), members in sorted(models.items()):
+        common = Counter(tuple(sorted(values.items())) for _, values in members).most_common(1)[0][0]
+        rules.append(_rule({"vid": f"{vid:04X}", "pid": f"{pid:04X}"}, dict(common)))
+        overrides.extend(_rule({"pnp_id": dev.pnp_id}, values)
+                         for dev, values in members if tuple(sorted(values.items())) != common)
+    return {"version": PROFILE_VERSION, "rules": rules + overrides}
+
+def dump_plan(plan: dict, path: str):
+    """每条规则一行，便于 diff 和版本管理"""
+    fields = "".join(f"{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}, "
+                     for key, value in plan.items() if key != "rules")
+    rules = ",\n".join(json.dumps(rule, ensure_ascii=False) for rule in plan["rules"])
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'{{{fields}"rules": [\n{rules}\n]}}\n')
+
+def plan_import(profile, devices) -> list:
+    """返回 [(设备, {需要改变的参数名: 值})]，取值已经一致的实例不出现在结果中"""
+    changes = []
+    for dev in devices:
+        wanted, _ = profile.resolve(dev)
+        changed = {name: value for name, value in wanted.items() if dev.params.get(name, 0) != value}
+        if changed:
+            changes.append((dev, changed))
+    return changes
+
+def _reg_string(value: str) -> str:
+    """.reg 文件中带引号的字符串：反斜杠和双引号需要转义"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def format_reg(changes) -> str:
+    """与 changes 等价的 .reg 文件内容 (Windows Registry Editor 5.00，写入时用 UTF-16)"""
+    lines = ["Windows Registry Editor Version 5.00", ""]
+    for dev, values in changes:
+        lines.append(f"[HKEY_LOCAL_MACHINE\\{dev.reg_path}]")
+        lines.extend(f"{_reg_string(name)}=dword:{value & 0xFFFFFFFF:08x}" for name, value in values.items())
+        lines.append("")
+    return "\r\n".join(lines) + "\r\n"
+
+def write_reg(changes, path: str):
+    with open(path, "w", encoding="utf-16", newline="") as f:
+        f.write(format_reg(changes))
+
+def import_plan(profile, backend=None, restart: bool = True, restart_mode: str = RESTART_SHARED_PARENT,
+                dry_run: bool = False, restarter=None) -> dict:
+    """
+    遍历注册表中所有可修改的鼠标实例 (包括不在线的)，按 profile 写入需要变化的参数，
+    最后用一次 RestartPlanner 只重启其中在线的设备。dry_run 时只计算不写入。
+    返回 {"instances": 遍历到的实例数, "changes": [(设备, 取值)], "written": [PNP ID],
+          "failed": [PNP ID], "online": [PNP ID], "restarts": {PNP ID: 重启结果}}
+    """
+    backend = backend or WIN32_BACKEND
+    devices = list(MouseEnumerator(backend).iter_registered())
+    result = {"instances": len(devices), "changes": plan_import(profile, devices),
+              "written": [], "failed": [], "online": [], "restarts": {}}
+    if dry_run:
+        return result
+
+    for dev, values in result["changes"]:
+        if backend.write_values(dev.reg_path, values):
+            result["written"].append(dev.pnp_id)
+        else:
+            result["failed"].append(dev.pnp_id)
+    if not restart or not result["written"]:
+        return result
+
+    # 在线状态一次性取得；批量接口不可用时逐个确认 (只针对已写入的实例)
+    present = backend.get_class_device_ids(MOUSE_CLASS_GUID)
+    if present is not None:
+        present_ids = {pnp_id.upper() for pnp_id in present}
+        result["online"] = [pnp_id for pnp_id in result["written"] if pnp_id.upper() in present_ids]
+    else:
+        result["online"] = [pnp_id for pnp_id in result["written"] if backend.get_devnode_status(pnp_id)[0]]
+    if result["online"]:
+        planner = RestartPlanner(backend, restart_mode)
+        result["restarts"] = planner.execute(planner.plan(result["online"]), restarter=restarter)
+    return result
@@ -0,0 +1,461 @@
+"""
+内存中的注册表 / devnode 模拟器：实现与 Win32Backend 相同的接口，
+可以在非 Windows 环境 (CI、benchmark.py) 中驱动 MouseEnumerator / IncrementalScanner /
+DeviceRestarter / RestartPlanner。
+
+时间是虚拟的：每次后端调用按 latency 推进 now，sleep() 也只推进 now，
+因此同一棵树上的结果完全可复现。调用次数通过 instrumentation 的计数器统计。
+
+    sim = SimulatedBackend.generate(1000, receivers=2, bluetooth=1)
+    devices = MouseEnumerator(sim).scan()
+    DeviceRestarter(sim, clock=sim.clock, sleep=sim.sleep).restart(devices[0].pnp_id)
+
+SimulatedCfgMgr32 在同一棵树上提供 ctypes 兼容的假 cfgmgr32 库，用来驱动 cfgmgr.CfgMgr32 / Win32Backend：
+
+    backend = Win32Backend(CfgMgr32(SimulatedCfgMgr32(sim)))
+"""
+import ctypes
+import functools
+import random
+from ctypes import wintypes
+
+from cfgmgr import (
+    CR_BUFFER_SMALL,
+    CR_CALL_NOT_IMPLEMENTED,
+    CR_NO_SUCH_DEVNODE,
+    CR_NO_SUCH_VALUE,
+    CR_SUCCESS,
+    DEVPKEY_FriendlyName,
+    DEVPROPKEY,
+    DN_STARTED,
+)
+from devices import (
+    ENUM_ROOT,
+    MOUSE_BUS_LIST,
+    MOUSE_CLASS_GUID,
+    PARAM_WHEEL,
+)
+from instrumentation import counted
+
+DEVPROP_TYPE_STRING = 0x00000012
+
+KEYBOARD_CLASS_GUID = "{4D36E96B-E325-11CE-BFC1-08002BE10318}"
+HID_CLASS_GUID = "{745A17A0-74D3-11D0-B6FE-00A0C90F57DA}"
+USB_CLASS_GUID = "{36FC9E60-C465-11CF-8056-444553540000}"
+BLUETOOTH_CLASS_GUID = "{E0CBF06C-CD8B-4647-BB8A-263B43F0F974}"
+
+HID_SERVICE_UUID = "{00001124-0000-1000-8000-00805F9B34FB}"
+MOUSE_DESC = "@msmouse.inf,%hid.mousedevice%;HID-compliant mouse"
+
+# 每次调用的模拟耗时 (秒)：先按方法名查找，再按类别 (cfgmgr / registry)
+DEFAULT_LATENCY = {"cfgmgr": 0.00002, "registry": 0.00004}
+
+def _api(category):
+    """后端方法：计入 instrumentation 计数器，并按 latency 推进虚拟时钟"""
+    def decorator(func):
+        name = func.__name__
+        func = counted(category)(func)
+
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            self.now += self.latency.get(name, self.latency.get(category, 0.0))
+            return func(self, *args)
+        return wrapper
+    return decorator
+
+class _Key:
+    __slots__ = ("name", "values", "subkeys", "last_write")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.values = {}
+        self.subkeys = {}  # 名称(大写) -> _Key，保持插入顺序
+        self.last_write = 0
+
+class _Node:
+    __slots__ = ("pnp_id", "parent", "friendly_name", "class_guid", "disabled", "changed_at")
+
+    def __init__(self, pnp_id: str, parent: int, friendly_name: str, class_guid: str):
+        self.pnp_id = pnp_id
+        self.parent = parent
+        self.friendly_name = friendly_name
+        self.class_guid = class_guid
+        self.disabled = False
+        self.changed_at = float("-inf")
+
+class SimulatedBackend:
+    """
+    latency   : {方法名或类别: 秒}，默认 DEFAULT_LATENCY
+    off_delay : 禁用后多久设备真正停止 (虚拟秒)
+    on_delay  : 启用后多久进入 DN_STARTED；父节点重启时子节点随父节点一起停止 / 恢复
+    bulk_list : False 时 get_class_device_ids 返回 None，模拟没有批量接口的旧系统
+    """
+
+    def __init__(self, latency=None, off_delay: float = 0.05, on_delay: float = 0.3, bulk_list: bool = True):
+        self.latency = dict(DEFAULT_LATENCY if latency is None else latency)
+        self.off_delay = off_delay
+        self.on_delay = on_delay
+        self.bulk_list = bulk_list
+        self.now = 0.0
+        self._root = _Key("")
+        self._writes = 0
+        self._nodes = {}  # dev_inst -> _Node
+        self._by_id = {}  # PNP_ID(大写) -> dev_inst
+        self._unplugged = {}  # PNP_ID(大写) -> (dev_inst, _Node)，供 replug_device() 恢复
+
+    # =====================================================================
+    # 虚拟时钟 (传给 DeviceRestarter / HotplugMonitor 的 clock / sleep)
+    # =====================================================================
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+    # =====================================================================
+    # 构造模拟树
+    # =====================================================================
+
+    def add_instance(self, pnp_id: str, class_guid: str, desc: str = MOUSE_DESC, params=None, friendly_name: str = None):
+        """只写注册表实例键 (幽灵设备)；params 为 None 时不创建 Device Parameters"""
+        key = self._open(f"{ENUM_ROOT}\\{pnp_id}", create=True)
+        values = {"ClassGUID": class_guid, "DeviceDesc": desc}
+        if friendly_name:
+            values["FriendlyName"] = friendly_name
+        self._set(key, values)
+        if params is not None:
+            self._set(self._open(f"{ENUM_ROOT}\\{pnp_id}\\Device Parameters", create=True), params)
+
+    def add_device(self, pnp_id: str, class_guid: str, parent: int = 0, friendly_name: str = None,
+                   desc: str = MOUSE_DESC, params=None) -> int:
+        """注册表实例 + 在线的 devnode，返回 dev_inst"""
+        self.add_instance(pnp_id, class_guid, desc, params, friendly_name)
+        dev_inst = len(self._nodes) + 1
+        self._nodes[dev_inst] = _Node(pnp_id, parent, friendly_name, class_guid)
+        self._by_id[pnp_id.upper()] = dev_inst
+        return dev_inst
+
+    def remove_device(self, pnp_id: str):
+        """拔出设备：devnode 消失，注册表实例保留 (变成幽灵设备)"""
+        dev_inst = self._by_id.pop(pnp_id.upper(), 0)
+        node = self._nodes.pop(dev_inst, None)
+        if node is not None:
+            self._unplugged[pnp_id.upper()] = (dev_inst, node)
+
+    def replug_device(self, pnp_id: str) -> int:
+        """重新插入 remove_device() 拔出的设备：只恢复 devnode，注册表实例键 (及其最后写入时间) 不变"""
+        dev_inst, node = self._unplugged.pop(pnp_id.upper())
+        self._nodes[dev_inst] = node
+        self._by_id[pnp_id.upper()] = dev_inst
+        return dev_inst
+
+    @classmethod
+    def generate(cls, instances: int, receivers: int = 2, collections: int = 3, bluetooth: int = 1,
+                 buses=MOUSE_BUS_LIST, seed: int = 0, **kwargs):
+        """
+        生成一棵接近真实机器的树，buses 下共约 instances 个注册表实例：
+        receivers 个 USB 接收器 (每个拆成 collections 个 HID 集合，共享同一个接口父节点，只有 COL01 是鼠标)，
+        bluetooth 个蓝牙鼠标 (BTHENUM 父节点 + HID 子节点)，
+        其余是散布在 buses 下、已不在线的幽灵实例 (约七成是带 FlipFlopWheel 的鼠标)。
+        """
+        rng = random.Random(seed)
+        sim = cls(**kwargs)
+
+        def instance_suffix(level: int) -> str:
+            return f"{level}&{rng.getrandbits(32):08x}&0&{rng.getrandbits(16):04X}"
+
+        live = 0
+        if receivers:
+            hub = sim.add_device(f"USB\\ROOT_HUB30\\{instance_suffix(4)}", USB_CLASS_GUID,
+                                 friendly_name="USB Root Hub (USB 3.0)", desc="USB Root Hub (USB 3.0)")
+        for r in range(receivers):
+            pid = f"C5{0x2B + r:02X}"
+            receiver = sim.add_device(f"USB\\VID_046D&PID_{pid}\\{instance_suffix(5)}", USB_CLASS_GUID, hub,
+                                      friendly_name="Logitech USB Receiver", desc="USB Composite Device")
+            interface = sim.add_device(f"USB\\VID_046D&PID_{pid}&MI_01\\{instance_suffix(6)}", HID_CLASS_GUID,
+                                       receiver, desc="USB Input Device")
+            for c in range(collections):
+                class_guid = (MOUSE_CLASS_GUID, KEYBOARD_CLASS_GUID)[c] if c < 2 else HID_CLASS_GUID
+                sim.add_device(f"HID\\VID_046D&PID_{pid}&MI_01&COL{c + 1:02d}\\{instance_suffix(7)}", class_guid,
+                               interface, params={PARAM_WHEEL: 0} if class_guid == MOUSE_CLASS_GUID else {})
+                live += 1
+
+        if bluetooth:
+            adapter = sim.add_device(f"USB\\VID_8087&PID_0026\\{instance_suffix(5)}", BLUETOOTH_CLASS_GUID,
+                                     friendly_name="Intel(R) Wireless Bluetooth(R)")
+        for b in range(bluetooth):
+            pid = f"B0{0x23 + b:02X}"
+            mac = f"{rng.getrandbits(48):012X}"
+            parent = sim.add_device(f"BTHENUM\\{HID_SERVICE_UUID}_VID&0002046D_PID&{pid}\\8&{rng.getrandbits(32):08x}&0&{mac}_C00000000",
+                                    HID_CLASS_GUID, adapter, friendly_name=f"MX Master {3 + b}S")
+            sim.add_device(f"HID\\{HID_SERVICE_UUID}_VID&0002046D_PID&{pid}\\{instance_suffix(9)}",
+                           MOUSE_CLASS_GUID, parent, params={PARAM_WHEEL: 1})
+            live += 2
+
+        # 幽灵实例：同一型号插过不同端口会在同一个 device-ID 键下留下多个实例
+        ghosts = max(0, instances - live)
+        models = max(1, ghosts // 20)
+        for i in range(ghosts):
+            bus = buses[i % len(buses)]
+            model = rng.randrange(models)
+            vid, pid = f"{0x1000 + model % 0x100:04X}", f"{model:04X}"
+            if bus == "HID":
+                device_id = f"VID_{vid}&PID_{pid}&MI_00"
+            else:
+                device_id = f"{HID_SERVICE_UUID}_VID&0002{vid}_PID&{pid}"
+            if rng.random() < 0.7:
+                sim.add_instance(f"{bus}\\{device_id}\\{instance_suffix(8)}", MOUSE_CLASS_GUID, params={PARAM_WHEEL: 0})
+            else:
+                sim.add_instance(f"{bus}\\{device_id}\\{instance_suffix(8)}", HID_CLASS_GUID, "HID-compliant device", params={})
+        return sim
+
+    # =====================================================================
+    # CfgMgr32 (与 Win32Backend 同名同义)
+    # =====================================================================
+
+    @_api("cfgmgr")
+    def get_class_device_ids(self, class_guid: str):
+        if not self.bulk_list:
+            return None
+        return [node.pnp_id for node in self._nodes.values() if node.class_guid.upper() == class_guid.upper()]
+
+    @_api("cfgmgr")
+    def get_devnode_status(self, pnp_id: str):
+        dev_inst = self._by_id.get(pnp_id.upper(), 0)
+        if not dev_inst:
+            return False, 0
+        return self._started(dev_inst), dev_inst
+
+    @_api("cfgmgr")
+    def get_property(self, dev_inst: int, property_key) -> str:
+        node = self._nodes.get(dev_inst)
+        if node is None or bytes(property_key) != bytes(DEVPKEY_FriendlyName):
+            return ""
+        return node.friendly_name or ""
+
+    @_api("cfgmgr")
+    def get_parent(self, dev_inst: int) -> int:
+        node = self._nodes.get(dev_inst)
+        return node.parent if node else 0
+
+    @_api("cfgmgr")
+    def locate_devnode(self, pnp_id: str) -> int:
+        return self._by_id.get(pnp_id.upper(), 0)
+
+    @_api("cfgmgr")
+    def get_status_flags(self, dev_inst: int) -> int:
+        return DN_STARTED if self._started(dev_inst) else 0
+
+    @_api("cfgmgr")
+    def disable_devnode(self, dev_inst: int) -> int:
+        return self._transition(dev_inst, True)
+
+    @_api("cfgmgr")
+    def enable_devnode(self, dev_inst: int) -> int:
+        return self._transition(dev_inst, False)
+
+    @_api("cfgmgr")
+    def get_device_id(self, dev_inst: int) -> str:
+        node = self._nodes.get(dev_inst)
+        return node.pnp_id if node else ""
+
+    # =====================================================================
+    # 注册表 (HKLM 下的相对路径，不区分大小写)
+    # =====================================================================
+
+    @_api("registry")
+    def enum_subkeys(self, path: str) -> list:
+        return [key.name for key in self._open_or_raise(path).subkeys.values()]
+
+    @_api("registry")
+    def enum_subkey_info(self, path: str) -> list:
+        return [(key.name, key.last_write) for key in self._open_or_raise(path).subkeys.values()]
+
+    @_api("registry")
+    def query_key_info(self, path: str):
+        key = self._open_or_raise(path)
+        return len(key.subkeys), key.last_write
+
+    @_api("registry")
+    def write_values(self, path: str, values: dict) -> bool:
+        key = self._open(path)
+        if key is None:
+            return False
+        for name, value in values.items():
+            if value is None:
+                key.values.pop(name, None)
+            else:
+                key.values[name] = value
+        self._touch(key)
+        return True
+
+    @_api("registry")
+    def read_all_values(self, path: str) -> dict:
+        key = self._open(path)
+        return None if key is None else dict(key.values)
+
+    @_api("registry")
+    def query_values(self, path: str, names) -> dict:
+        key = self._open(path)
+        return None if key is None else {name: key.values.get(name) for name in names}
+
+    # =====================================================================
+    # 内部实现
+    # =====================================================================
+
+    def _open(self, path: str, create: bool = False):
+        key = self._root
+        for part in path.split("\\"):
+            child = key.subkeys.get(part.upper())
+            if child is None:
+                if not create:
+                    return None
+                child = key.subkeys[part.upper()] = _Key(part)
+                self._touch(key)
+            key = child
+        return key
+
+    def _open_or_raise(self, path: str):
+        key = self._open(path)
+        if key is None:
+            raise FileNotFoundError(path)
+        return key
+
+    def _set(self, key: _Key, values: dict):
+        key.values.update(values)
+        self._touch(key)
+
+    def _touch(self, key: _Key):
+        self._writes += 1
+        key.last_write = self._writes
+
+    def _transition(self, dev_inst: int, disabled: bool) -> int:
+        node = self._nodes.get(dev_inst)
+        if node is None:
+            return CR_NO_SUCH_DEVNODE
+        node.disabled = disabled
+        node.changed_at = self.now
+        return CR_SUCCESS
+
+    def _started(self, dev_inst: int) -> bool:
+        """自身及所有祖先都处于启动状态 (禁用在 off_delay 后生效，启用在 on_delay 后生效)"""
+        while dev_inst:
+            node = self._nodes[dev_inst]
+            if node.disabled:
+                if self.now >= node.changed_at + self.off_delay:
+                    return False
+            elif self.now < node.changed_at + self.on_delay:
+                return False
+            dev_inst = node.parent
+        return True
+
+class SimulatedCfgMgr32:
+    """
+    ctypes 兼容的假 cfgmgr32 库：每个 CM_* 函数都是 CFUNCTYPE 回调，可以交给 cfgmgr.CfgMgr32 绑定原型，
+    参数经过真实的 ctypes 转换后作用于 SimulatedBackend 的 devnode 树。用于在非 Windows 环境中
+    测量绑定层本身 (原生调用次数、缓冲区分配)。calls 按函数名统计调用次数，每次调用按 cfgmgr latency 推进虚拟时钟。
+    """
+
+    def __init__(self, sim: SimulatedBackend):
+        self.sim = sim
+        self.calls = {}
+        # 回调的 C 签名里指针一律按地址 (c_void_p) 接收，绑定层再用 PROTOTYPES 覆盖调用时的 argtypes
+        for name, argtypes in (
+            ("CM_Locate_DevNodeW", (ctypes.c_void_p, ctypes.c_wchar_p, wintypes.ULONG)),
+            ("CM_Get_DevNode_Status", (ctypes.c_void_p, ctypes.c_void_p, wintypes.DWORD, wintypes.ULONG)),
+            ("CM_Get_Parent", (ctypes.c_void_p, wintypes.DWORD, wintypes.ULONG)),
+            ("CM_Get_Device_IDW", (wintypes.DWORD, ctypes.c_void_p, wintypes.ULONG, wintypes.ULONG)),
+            ("CM_Get_Device_ID_List_SizeW", (ctypes.c_void_p, ctypes.c_wchar_p, wintypes.ULONG)),
+            ("CM_Get_Device_ID_ListW", (ctypes.c_wchar_p, ctypes.c_void_p, wintypes.ULONG, wintypes.ULONG)),
+            ("CM_Get_DevNode_PropertyW", (wintypes.DWORD, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                          ctypes.c_void_p, wintypes.ULONG)),
+            ("CM_Disable_DevNode", (wintypes.DWORD, wintypes.ULONG)),
+            ("CM_Enable_DevNode", (wintypes.DWORD, wintypes.ULONG)),
+        ):
+            setattr(self, name, ctypes.CFUNCTYPE(wintypes.DWORD, *argtypes)(self._wrap(name, getattr(self, "_" + name))))
+
+    def _wrap(self, name: str, func):
+        def call(*args):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.sim.now += self.sim.latency.get("cfgmgr", 0.0)
+            return func(*args)
+        return call
+
+    @staticmethod
+    def _put_ulong(address: int, value: int):
+        wintypes.ULONG.from_address(address).value = value
+
+    @staticmethod
+    def _put_string(address: int, chars: int, value: str):
+        (ctypes.c_wchar * chars).from_address(address).value = value
+
+    def _CM_Locate_DevNodeW(self, out, pnp_id, flags):
+        dev_inst = self.sim._by_id.get((pnp_id or "").upper(), 0)
+        if not dev_inst:
+            return CR_NO_SUCH_DEVNODE
+        self._put_ulong(out, dev_inst)
+        return CR_SUCCESS
+
+    def _CM_Get_DevNode_Status(self, status, problem, dev_inst, flags):
+        if dev_inst not in self.sim._nodes:
+            return CR_NO_SUCH_DEVNODE
+        self._put_ulong(status, DN_STARTED if self.sim._started(dev_inst) else 0)
+        self._put_ulong(problem, 0)
+        return CR_SUCCESS
+
+    def _CM_Get_Parent(self, out, dev_inst, flags):
+        node = self.sim._nodes.get(dev_inst)
+        if node is None or not node.parent:
+            return CR_NO_SUCH_DEVNODE
+        self._put_ulong(out, node.parent)
+        return CR_SUCCESS
+
+    def _CM_Get_Device_IDW(self, dev_inst, buffer, length, flags):
+        node = self.sim._nodes.get(dev_inst)
+        if node is None:
+            return CR_NO_SUCH_DEVNODE
+        if len(node.pnp_id) >= length:
+            return CR_BUFFER_SMALL
+        self._put_string(buffer, length, node.pnp_id)
+        return CR_SUCCESS
+
+    def _class_ids(self, class_guid: str) -> str:
+        ids = [node.pnp_id for node in self.sim._nodes.values() if node.class_guid.upper() == (class_guid or "").upper()]
+        return "".join(pnp_id + "\0" for pnp_id in ids) + "\0"
+
+    def _CM_Get_Device_ID_List_SizeW(self, out, class_guid, flags):
+        if not self.sim.bulk_list:
+            return CR_CALL_NOT_IMPLEMENTED
+        self._put_ulong(out, len(self._class_ids(class_guid)))
+        return CR_SUCCESS
+
+    def _CM_Get_Device_ID_ListW(self, class_guid, buffer, length, flags):
+        if not self.sim.bulk_list:
+            return CR_CALL_NOT_IMPLEMENTED
+        multi_sz = self._class_ids(class_guid)
+        if len(multi_sz) > length:
+            return CR_BUFFER_SMALL
+        ctypes.memmove(buffer, ctypes.create_unicode_buffer(multi_sz, len(multi_sz)), len(multi_sz) * ctypes.sizeof(ctypes.c_wchar))
+        return CR_SUCCESS
+
+    def _CM_Get_DevNode_PropertyW(self, dev_inst, property_key, prop_type, buffer, size, flags):
+        node = self.sim._nodes.get(dev_inst)
+        if node is None:
+            return CR_NO_SUCH_DEVNODE
+        if ctypes.string_at(property_key, ctypes.sizeof(DEVPROPKEY)) != bytes(DEVPKEY_FriendlyName) or not node.friendly_name:
+            return CR_NO_SUCH_VALUE
+        needed = (len(node.friendly_name) + 1) * ctypes.sizeof(ctypes.c_wchar)
+        available = wintypes.ULONG.from_address(size).value
+        self._put_ulong(size, needed)
+        if not buffer or available < needed:
+            return CR_BUFFER_SMALL
+        self._put_ulong(prop_type, DEVPROP_TYPE_STRING)
+        self._put_string(buffer, available // ctypes.sizeof(ctypes.c_wchar), node.friendly_name)
+        return CR_SUCCESS
+
+    def _CM_Disable_DevNode(self, dev_inst, flags):
+        return self.sim._transition(dev_inst, True)
+
+    def _CM_Enable_DevNode(self, dev_inst, flags):
+        return self.sim._transition(dev_inst, False)
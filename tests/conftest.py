@@ -0,0 +1,5 @@
+"""测试直接导入仓库根目录下的模块 (与 main.py 相同的布局)，全部基于 simulator.py，不需要 Windows"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,159 @@
+import json
+import queue
+import socket
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client
+
+import pytest
+
+from agent import Agent, AgentClient, AgentError, AgentServer
+from devices import DEVICE_ARRIVAL, MOUSE_CLASS_GUID, PARAM_WHEEL, DeviceEventSource, DeviceRestarter, read_parameters
+from simulator import SimulatedBackend
+
+NEW_MOUSE = "HID\\VID_05AC&PID_0269&MI_00\\7&1f2e3d4c&0&0000"
+
+class ScriptedEventSource(DeviceEventSource):
+    def start(self, callback):
+        self.emit = callback
+        return True
+
+@pytest.fixture
+def agent():
+    sim = SimulatedBackend.generate(100)
+    agent = Agent(sim, event_source=ScriptedEventSource(),
+                  restarter=DeviceRestarter(sim, clock=sim.clock, sleep=sim.sleep))
+    agent.hotplug.quiet = 0
+    agent.apply_coordinator.quiet = 0.05
+    agent.start()
+    return agent
+
+@pytest.fixture
+def server(agent):
+    server = AgentServer(agent)
+    server.start()
+    yield server
+    server.stop()
+
+def _client(server):
+    return AgentClient(server.address, server.authkey, timeout=5)
+
+def _raw(server):
+    """直接发送字节的连接，用于构造客户端不会发出的请求"""
+    return Client(server.address, family="AF_INET", authkey=server.authkey)
+
+def _subscribe(agent, client) -> queue.Queue:
+    """在后台线程上接收事件，等代理登记了订阅再返回"""
+    events = queue.Queue()
+    threading.Thread(target=lambda: [events.put(event) for event in client.subscribe()], daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not agent._subscribers:
+        assert time.monotonic() < deadline, "订阅超时"
+        time.sleep(0.01)
+    return events
+
+def _next_event(events, name):
+    while True:
+        event = events.get(timeout=5)
+        if event.get("event") == name:
+            return event
+
+def _parse(data: bytes) -> dict:
+    return json.loads(data.decode("utf-8"))
+
+def test_list_and_get(agent, server):
+    with _client(server) as client:
+        devices = client.list()
+        assert [dev["pnp_id"] for dev in devices] == [dev.pnp_id for dev in agent.devices]
+        assert devices[-1]["name"] == "MX Master 3S"
+        assert devices[-1]["params"] == {PARAM_WHEEL: 1}
+        assert client.get(devices[0]["pnp_id"].lower()) == {PARAM_WHEEL: 0}
+        assert client.ping()["devices"] == 3
+        with pytest.raises(AgentError, match="pnp_id"):
+            client.get("not-a-pnp-id")
+
+def test_set_waits_for_write_and_restart(agent, server):
+    target = next(iter(agent.devices))
+    with _client(server) as client:
+        results = client.set(target.pnp_id, {PARAM_WHEEL: 1})
+        assert len(results) == 1
+        assert results[0]["written"] and results[0]["restart"]["ok"]
+        assert read_parameters(agent.backend, target.reg_path) == {PARAM_WHEEL: 1}
+        assert client.get(target.pnp_id) == {PARAM_WHEEL: 1}
+        with pytest.raises(AgentError, match="values"):
+            client.set(target.pnp_id, {PARAM_WHEEL: 2})
+
+def test_set_without_wait_is_queued_and_reported_as_event(agent, server):
+    target = next(iter(agent.devices))
+    with _client(server) as listener, _client(server) as client:
+        events = _subscribe(agent, listener)
+        for value in (1, 0, 1):
+            assert client.set(target.pnp_id, {PARAM_WHEEL: value}, wait=False) == {"queued": [target.pnp_id]}
+
+        # 连续三次修改合并成一个事务
+        applied = _next_event(events, "applied")
+        assert [(r["pnp_id"], r["values"], r["ok"]) for r in applied["results"]] == [(target.pnp_id, {PARAM_WHEEL: 1}, True)]
+        assert client.get(target.pnp_id) == {PARAM_WHEEL: 1}
+
+def test_subscribers_receive_hotplug_events(agent, server):
+    with _client(server) as listener:
+        events = _subscribe(agent, listener)
+        agent.backend.add_device(NEW_MOUSE, MOUSE_CLASS_GUID, friendly_name="Magic Mouse", params={PARAM_WHEEL: 1})
+        agent.hotplug.source.emit(DEVICE_ARRIVAL, NEW_MOUSE)
+        agent.poll()
+
+        event = _next_event(events, "devices")
+        # 插拔通知中的 PNP ID 为大写
+        assert NEW_MOUSE.upper() in [dev["pnp_id"] for dev in event["devices"]]
+        assert NEW_MOUSE in agent.devices
+
+def test_hotplug_poll_holds_the_scanner_lock(agent):
+    held = []
+    poll = agent.hotplug.poll
+    agent.hotplug.poll = lambda: (held.append(agent._lock.locked()), poll())[1]
+    agent.poll()
+    assert held == [True]
+
+def test_malformed_requests_get_error_responses(server):
+    conn = _raw(server)
+    try:
+        conn.send_bytes(b"{not json")
+        assert conn.recv_bytes() == '{"id": null, "ok": false, "error": "无法解析的请求"}'.encode("utf-8")
+        for payload, error in ((b"[1, 2]", "JSON 对象"), (b'{"id": 7, "op": "format"}', "未知的操作")):
+            conn.send_bytes(payload)
+            response = _parse(conn.recv_bytes())
+            assert not response["ok"] and error in response["error"]
+        # 出错之后连接仍然可用
+        conn.send_bytes(b'{"id": 8, "op": "ping"}')
+        assert _parse(conn.recv_bytes())["ok"]
+    finally:
+        conn.close()
+
+def test_wrong_authkey_is_rejected(server):
+    with pytest.raises(AuthenticationError):
+        AgentClient(server.address, b"wrong key", timeout=5)
+    # 握手失败不影响之后的连接
+    with _client(server) as client:
+        assert client.ping()["devices"] == 3
+
+def test_connection_closed_before_handshake_does_not_stop_accepting(server):
+    for _ in range(3):
+        socket.create_connection(server.address).close()
+    with _client(server) as client:
+        assert client.ping()["devices"] == 3
+
+def test_silent_connection_does_not_block_other_clients(server):
+    # 连上之后什么都不发：握手在它自己的线程上等待，不占用接受连接的线程
+    silent = socket.create_connection(server.address)
+    try:
+        with _client(server) as client:
+            assert client.ping()["devices"] == 3
+    finally:
+        silent.close()
+
+def test_client_times_out_when_agent_never_handshakes():
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        started = time.monotonic()
+        with pytest.raises(AgentError, match="握手"):
+            AgentClient(listener.getsockname(), b"key", connect_timeout=0.2)
+        assert time.monotonic() - started < 2
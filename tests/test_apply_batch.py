@@ -0,0 +1,76 @@
+import threading
+import time
+
+from devices import RESTART_EACH_CHILD, MouseEnumerator, apply_to_devices, read_parameters
+from simulator import SimulatedBackend
+
+RESTART_SECONDS = 0.1
+
+class RecordingBackend:
+    """透传给模拟器，并按调用顺序记录写入"""
+
+    def __init__(self, sim, log):
+        self.sim = sim
+        self.log = log
+
+    def write_values(self, path, values):
+        self.log.append(("write", path, time.monotonic()))
+        return self.sim.write_values(path, values)
+
+    def __getattr__(self, name):
+        return getattr(self.sim, name)
+
+class RecordingRestarter:
+    """每次重启固定耗时 RESTART_SECONDS，记录开始 / 结束时间和同时进行的重启数"""
+
+    def __init__(self, log):
+        self.log = log
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def restart(self, pnp_id):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.log.append(("restart", pnp_id, time.monotonic()))
+        time.sleep(RESTART_SECONDS)
+        with self.lock:
+            self.active -= 1
+            self.log.append(("restarted", pnp_id, time.monotonic()))
+        return {"pnp_id": pnp_id, "ok": True, "stage": "done", "error": None,
+                "disable_latency": RESTART_SECONDS / 2, "enable_latency": RESTART_SECONDS / 2}
+
+    def wait_started(self, pnp_id, timeout=None):
+        return 0.0
+
+def _batch(devices_count, max_workers):
+    sim = SimulatedBackend.generate(100, receivers=devices_count - 1, bluetooth=1)
+    devices = MouseEnumerator(sim).scan()
+    assert len(devices) == devices_count
+    log = []
+    restarter = RecordingRestarter(log)
+    results = apply_to_devices(devices, {"FlipFlopWheel": 1}, RecordingBackend(sim, log), max_workers=max_workers,
+                               restart_mode=RESTART_EACH_CHILD, restarter=restarter)
+    return sim, devices, log, restarter, results
+
+def test_all_writes_happen_before_any_restart():
+    sim, devices, log, _, results = _batch(4, max_workers=4)
+    kinds = [kind for kind, _, _ in log]
+    assert kinds[:4] == ["write"] * 4
+    assert "write" not in kinds[4:]
+    assert all(r["written"] and r["restart"]["ok"] for r in results)
+    assert all(read_parameters(sim, dev.reg_path)["FlipFlopWheel"] == 1 for dev in devices)
+
+def test_parallel_restarts_stay_within_max_workers():
+    _, _, _, restarter, results = _batch(6, max_workers=2)
+    assert restarter.peak == 2
+    assert len(results) == 6
+
+def test_total_downtime_is_about_one_restart():
+    _, _, log, restarter, _ = _batch(4, max_workers=4)
+    starts = [stamp for kind, _, stamp in log if kind == "restart"]
+    ends = [stamp for kind, _, stamp in log if kind == "restarted"]
+    assert restarter.peak == 4
+    # 4 次重启并发执行：总停机时间接近一次重启，而不是 4 次
+    assert max(ends) - min(starts) < 2 * RESTART_SECONDS
@@ -0,0 +1,155 @@
+import threading
+
+from devices import PARAM_HSCROLL, PARAM_WHEEL, ApplyCoordinator, MouseEnumerator, commit_change, read_parameters
+from simulator import SimulatedBackend
+
+class CountingBackend:
+    """透传给模拟器，记录每次写入的取值"""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.writes = []
+
+    def write_values(self, path, values):
+        self.writes.append(dict(values))
+        return self.sim.write_values(path, values)
+
+    def __getattr__(self, name):
+        return getattr(self.sim, name)
+
+class ScriptedRestarter:
+    """按顺序返回预设的结果 (用完后一律成功)，on_restart(pnp_id) 可模拟重启期间的副作用"""
+
+    def __init__(self, outcomes=(), on_restart=None):
+        self.outcomes = list(outcomes)
+        self.on_restart = on_restart
+        self.calls = []
+
+    def restart(self, pnp_id):
+        self.calls.append(pnp_id)
+        if self.on_restart:
+            self.on_restart(pnp_id)
+        stage, error = self.outcomes.pop(0) if self.outcomes else ("done", None)
+        return {"pnp_id": pnp_id, "ok": error is None, "stage": stage, "error": error,
+                "disable_latency": 0.01, "enable_latency": 0.01}
+
+def _setup():
+    sim = SimulatedBackend.generate(100)
+    device = MouseEnumerator(sim).scan()[0]
+    sim.write_values(device.reg_path, {PARAM_WHEEL: 0, PARAM_HSCROLL: 0})
+    return sim, CountingBackend(sim), device
+
+def _coordinator(backend, restarter):
+    results, done = [], threading.Event()
+
+    def on_result(result):
+        results.append(result)
+        done.set()
+
+    return ApplyCoordinator(backend, quiet=0.05, on_result=on_result, restarter=restarter), results, done
+
+def test_burst_of_clicks_is_one_write_and_one_restart():
+    sim, backend, device = _setup()
+    restarter = ScriptedRestarter()
+    coordinator, results, done = _coordinator(backend, restarter)
+    for value in (1, 0, 1, 0, 1):
+        coordinator.submit(device, {PARAM_WHEEL: value})
+    coordinator.submit(device, {PARAM_HSCROLL: 1})
+    assert done.wait(5)
+
+    assert backend.writes == [{PARAM_WHEEL: 1, PARAM_HSCROLL: 1}]
+    assert restarter.calls == [device.pnp_id]
+    assert len(results) == 1 and results[0]["ok"]
+    assert not coordinator.has_pending()
+
+def test_submit_during_commit_is_committed_afterwards():
+    sim, backend, device = _setup()
+    results, pending, done = [], [], threading.Event()
+
+    def on_result(result):
+        pending.append(coordinator.is_pending(device.pnp_id))
+        results.append(result)
+        if len(results) == 2:
+            done.set()
+
+    def click_while_restarting(pnp_id):
+        if len(restarter.calls) == 1:
+            coordinator.submit(device, {PARAM_WHEEL: 0})
+
+    restarter = ScriptedRestarter(on_restart=click_while_restarting)
+    coordinator = ApplyCoordinator(backend, quiet=0.05, on_result=on_result, restarter=restarter)
+    coordinator.submit(device, {PARAM_WHEEL: 1})
+    assert done.wait(5)
+
+    # 第一个结果返回时第二次修改仍在排队，界面据此保留乐观值
+    assert pending == [True, False]
+    assert [result["values"] for result in results] == [{PARAM_WHEEL: 1}, {PARAM_WHEEL: 0}]
+    assert read_parameters(sim, device.reg_path)[PARAM_WHEEL] == 0
+
+def test_failed_enable_rolls_back_and_restarts_again():
+    sim, backend, device = _setup()
+    restarter = ScriptedRestarter([("enable", "启用超时")])
+    result = commit_change(device, {PARAM_WHEEL: 1}, backend, restarter)
+
+    assert not result["ok"] and result["rolled_back"]
+    assert result["error"] == "启用超时"
+    assert backend.writes == [{PARAM_WHEEL: 1}, {PARAM_WHEEL: 0}]
+    # 设备已经被禁用过，回滚后要再重启一次才会加载旧值
+    assert restarter.calls == [device.pnp_id, device.pnp_id]
+    assert read_parameters(sim, device.reg_path)[PARAM_WHEEL] == 0
+
+def test_failed_disable_rolls_back_without_restarting():
+    sim, backend, device = _setup()
+    restarter = ScriptedRestarter([("disable", "设备正忙")])
+    result = commit_change(device, {PARAM_WHEEL: 1}, backend, restarter)
+
+    assert result["rolled_back"]
+    assert restarter.calls == [device.pnp_id]
+    assert read_parameters(sim, device.reg_path)[PARAM_WHEEL] == 0
+
+def test_read_back_mismatch_rolls_back():
+    sim, backend, device = _setup()
+
+    def overwritten_by_other_tool(pnp_id):
+        # 重启期间有其他程序把值改回去
+        if len(restarter.calls) == 1:
+            sim.write_values(device.reg_path, {PARAM_WHEEL: 0})
+
+    restarter = ScriptedRestarter(on_restart=overwritten_by_other_tool)
+    result = commit_change(device, {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}, backend, restarter)
+
+    assert not result["ok"] and result["rolled_back"]
+    assert result["restart"]["ok"]
+    assert backend.writes[-1] == {PARAM_WHEEL: 0, PARAM_HSCROLL: 0}
+    assert len(restarter.calls) == 2
+    assert read_parameters(sim, device.reg_path) == {PARAM_WHEEL: 0, PARAM_HSCROLL: 0}
+
+def test_rollback_removes_parameters_that_did_not_exist():
+    sim, backend, device = _setup()
+    sim.write_values(device.reg_path, {PARAM_HSCROLL: None})
+    result = commit_change(device, {PARAM_HSCROLL: 1}, backend, ScriptedRestarter([("enable", "启用超时")]))
+
+    assert result["rolled_back"]
+    assert PARAM_HSCROLL not in read_parameters(sim, device.reg_path)
+
+def test_final_value_equal_to_current_does_nothing():
+    sim, backend, device = _setup()
+    restarter = ScriptedRestarter()
+    coordinator, results, done = _coordinator(backend, restarter)
+    coordinator.submit(device, {PARAM_WHEEL: 1})
+    coordinator.submit(device, {PARAM_WHEEL: 0})
+    assert done.wait(5)
+
+    assert results[0]["ok"] and results[0]["unchanged"]
+    assert backend.writes == [] and restarter.calls == []
+
+def test_flush_commits_synchronously():
+    sim, backend, device = _setup()
+    restarter = ScriptedRestarter()
+    coordinator = ApplyCoordinator(backend, quiet=60, restarter=restarter)
+    coordinator.submit(device, {PARAM_WHEEL: 1})
+    coordinator.flush()
+
+    assert not coordinator.has_pending()
+    assert restarter.calls == [device.pnp_id]
+    assert read_parameters(sim, device.reg_path)[PARAM_WHEEL] == 1
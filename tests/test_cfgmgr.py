@@ -0,0 +1,175 @@
+import threading
+
+import pytest
+
+import instrumentation
+from cfgmgr import (
+    CM_GETIDLIST_FILTER_CLASS,
+    CM_GETIDLIST_FILTER_PRESENT,
+    CR_ACCESS_DENIED,
+    CR_BUFFER_SMALL,
+    CR_FAILURE,
+    CR_INVALID_DEVNODE,
+    CR_NO_SUCH_DEVNODE,
+    CR_NO_SUCH_VALUE,
+    CR_NOT_DISABLEABLE,
+    CR_REMOVE_VETOED,
+    CR_SUCCESS,
+    DEFAULT_PROPERTY_BYTES,
+    DEVPKEY_FriendlyName,
+    AccessDeniedError,
+    BufferTooSmallError,
+    CfgMgr32,
+    ConfigRetError,
+    NoSuchDevNodeError,
+    NoSuchValueError,
+    VetoedError,
+    check,
+)
+from devices import MOUSE_CLASS_GUID
+from simulator import SimulatedBackend, SimulatedCfgMgr32
+
+LONG_NAME = "Very Long Wireless Mouse " * 20  # 超过 DEFAULT_PROPERTY_BYTES
+
+class VetoingCfgMgr32(SimulatedCfgMgr32):
+    def _CM_Disable_DevNode(self, dev_inst, flags):
+        return CR_REMOVE_VETOED
+
+    def _CM_Enable_DevNode(self, dev_inst, flags):
+        return CR_ACCESS_DENIED
+
+class GrowingListCfgMgr32(SimulatedCfgMgr32):
+    """CM_Get_Device_ID_List_SizeW 报告的大小比实际列表小 (两次调用之间有设备插入)，前 stale 次如此"""
+
+    def __init__(self, sim, stale):
+        super().__init__(sim)
+        self.stale = stale
+
+    def _CM_Get_Device_ID_List_SizeW(self, out, class_guid, flags):
+        ret = super()._CM_Get_Device_ID_List_SizeW(out, class_guid, flags)
+        if self.stale:
+            self.stale -= 1
+            self._put_ulong(out, 4)
+        return ret
+
+def _binding(library_class=SimulatedCfgMgr32, *args):
+    sim = SimulatedBackend.generate(100)
+    library = library_class(sim, *args)
+    return sim, library, CfgMgr32(library)
+
+def _allocations(func):
+    recorder = instrumentation.enable()
+    try:
+        result = func()
+    finally:
+        instrumentation.disable()
+    return result, recorder.counters.get("alloc.cfgmgr", 0)
+
+@pytest.mark.parametrize("code, error", [
+    (CR_INVALID_DEVNODE, NoSuchDevNodeError),
+    (CR_NO_SUCH_DEVNODE, NoSuchDevNodeError),
+    (CR_NO_SUCH_VALUE, NoSuchValueError),
+    (CR_BUFFER_SMALL, BufferTooSmallError),
+    (CR_REMOVE_VETOED, VetoedError),
+    (CR_NOT_DISABLEABLE, VetoedError),
+    (CR_ACCESS_DENIED, AccessDeniedError),
+    (CR_FAILURE, ConfigRetError),
+    (0x7777, ConfigRetError),
+])
+def test_configret_maps_to_error_subclass(code, error):
+    with pytest.raises(error) as info:
+        check(code, "CM_Test")
+    assert type(info.value) is error
+    assert isinstance(info.value, OSError)
+    assert info.value.code == code and info.value.function == "CM_Test"
+    assert f"0x{code:08X}" in str(info.value)
+    check(CR_SUCCESS, "CM_Test")
+
+def test_access_denied_is_a_permission_error():
+    assert issubclass(AccessDeniedError, PermissionError)
+    assert "CR_UNKNOWN" in str(ConfigRetError(0x7777, "CM_Test"))
+
+def test_binding_raises_mapped_errors():
+    sim, _, binding = _binding()
+    with pytest.raises(NoSuchDevNodeError) as info:
+        binding.locate_devnode("HID\\VID_0000&PID_0000\\missing")
+    assert info.value.function == "CM_Locate_DevNodeW"
+
+    unnamed = sim.add_device("HID\\VID_1234&PID_0001\\1", MOUSE_CLASS_GUID)
+    with pytest.raises(NoSuchValueError):
+        binding.get_property(unnamed, DEVPKEY_FriendlyName)
+    # 根节点没有父节点
+    with pytest.raises(NoSuchDevNodeError):
+        binding.get_parent(unnamed)
+
+    sim, _, binding = _binding(VetoingCfgMgr32)
+    dev_inst = binding.locate_devnode(next(iter(sim._by_id)))
+    with pytest.raises(VetoedError):
+        binding.disable_devnode(dev_inst)
+    with pytest.raises(PermissionError):
+        binding.enable_devnode(dev_inst)
+
+def test_property_buffer_grows_once_and_size_is_remembered():
+    sim, library, binding = _binding()
+    dev_inst = sim.add_device("HID\\VID_1234&PID_0002\\1", MOUSE_CLASS_GUID, friendly_name=LONG_NAME)
+    assert (len(LONG_NAME) + 1) * 2 > DEFAULT_PROPERTY_BYTES
+
+    name, allocations = _allocations(lambda: binding.get_property(dev_inst, DEVPKEY_FriendlyName))
+    assert name == LONG_NAME
+    # 默认大小的缓冲区返回 CR_BUFFER_SMALL，按系统给出的大小扩大后再读一次
+    assert library.calls["CM_Get_DevNode_PropertyW"] == 2
+    assert allocations == 2
+
+    name, allocations = _allocations(lambda: binding.get_property(dev_inst, DEVPKEY_FriendlyName))
+    assert name == LONG_NAME
+    assert library.calls["CM_Get_DevNode_PropertyW"] == 3
+    assert allocations == 0
+
+    # 较短的名称复用同一个缓冲区
+    short = binding.locate_devnode(next(pnp_id for pnp_id, i in sim._by_id.items() if sim._nodes[i].friendly_name))
+    _, allocations = _allocations(lambda: binding.get_property(short, DEVPKEY_FriendlyName))
+    assert allocations == 0
+
+def test_device_id_list_retries_when_list_grows():
+    flags = CM_GETIDLIST_FILTER_CLASS | CM_GETIDLIST_FILTER_PRESENT
+    sim, library, binding = _binding(GrowingListCfgMgr32, 2)
+    expected = sim.get_class_device_ids(MOUSE_CLASS_GUID)
+    assert binding.get_device_id_list(MOUSE_CLASS_GUID, flags) == expected
+    assert library.calls["CM_Get_Device_ID_ListW"] == 3
+
+    _, _, binding = _binding(GrowingListCfgMgr32, 3)
+    with pytest.raises(BufferTooSmallError):
+        binding.get_device_id_list(MOUSE_CLASS_GUID, flags)
+
+def test_scratch_buffers_are_per_thread():
+    sim, library, binding = _binding()
+    pnp_ids = [pnp_id for pnp_id, dev_inst in sim._by_id.items() if sim._nodes[dev_inst].friendly_name]
+    expected = {pnp_id: sim._nodes[sim._by_id[pnp_id]].friendly_name for pnp_id in pnp_ids}
+
+    binding.get_property(binding.locate_devnode(pnp_ids[0]), DEVPKEY_FriendlyName)
+    main_buffer = binding._scratch.buffer
+    results, errors, buffers = {}, [], []
+    start = threading.Barrier(4)
+
+    def worker():
+        try:
+            start.wait()
+            for _ in range(50):
+                for pnp_id in pnp_ids:
+                    results.setdefault(pnp_id, set()).add(
+                        binding.get_property(binding.locate_devnode(pnp_id), DEVPKEY_FriendlyName))
+            buffers.append(binding._scratch.buffer)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results == {pnp_id: {name} for pnp_id, name in expected.items()}
+    # 每个线程一个缓冲区，主线程的缓冲区没有被其他线程替换
+    assert len({id(buffer) for buffer in buffers + [main_buffer]}) == 5
+    assert binding._scratch.buffer is main_buffer
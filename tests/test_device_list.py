@@ -0,0 +1,267 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark import _HeadlessWidget
+from device_list import ROW_HEIGHT, ROW_PADDING, KeyedDeviceList, VirtualDeviceList
+from devices import DeviceRecord
+
+class PackedWidget(_HeadlessWidget):
+    """在 benchmark 的假控件上记录 pack 顺序和 configure 的取值"""
+
+    def __init__(self, master=None, **kwargs):
+        super().__init__()
+        self.master = master
+        self.options = dict(kwargs)
+        self.packed = []
+        self.packs = 0
+        self.destroyed = False
+
+    def pack(self, **kwargs):
+        self.packs += 1
+        if self.master is not None and self not in self.master.packed:
+            self.master.packed.append(self)
+
+    def pack_forget(self):
+        if self.master is not None and self in self.master.packed:
+            self.master.packed.remove(self)
+
+    def configure(self, **kwargs):
+        self.options.update(kwargs)
+
+    def destroy(self):
+        self.pack_forget()
+        self.destroyed = True
+
+class PackedWidgets:
+    CTkFrame = CTkScrollableFrame = CTkCheckBox = CTkButton = CTkLabel = CTkScrollbar = PackedWidget
+
+# 各颜色互不相同，才能从按钮的 fg_color 判断是否着色为选中
+THEME = {"text_main": "#000001", "text_sub": "#000002", "list_hover": "#000003",
+         "list_selected": "#000004", "accent": "#000005"}
+
+def _devices(count, start=0):
+    return [DeviceRecord.from_pnp_id(f"HID\\VID_046D&PID_C52B&MI_01&COL01\\7&{0xa1b2c300 + i:08x}&0&0000", f"Mouse {i}")
+            for i in range(start, start + count)]
+
+def _list(list_class, **kwargs):
+    events = []
+    device_list = list_class(None, PackedWidgets, THEME, on_select=lambda pnp_id: events.append(("select", pnp_id)),
+                             on_check=lambda pnp_id, checked: events.append(("check", pnp_id, checked)), **kwargs)
+    return device_list, events
+
+def _rows(device_list):
+    """按显示顺序返回可见的行"""
+    rows = device_list.rows.values() if isinstance(device_list, KeyedDeviceList) else device_list.pool
+    by_frame = {id(row["frame"]): row for row in rows}
+    body = device_list.frame if isinstance(device_list, KeyedDeviceList) else device_list.body
+    return [by_frame[id(frame)] for frame in body.packed if id(frame) in by_frame]
+
+def _shown(device_list):
+    """按显示顺序返回 [(PNP_ID(大写), 是否勾选)]"""
+    return [(row["key"], bool(row["check"].get())) for row in _rows(device_list)]
+
+def _keys(devices):
+    return [dev.pnp_id.upper() for dev in devices]
+
+def _painted(device_list):
+    """可见行中按钮被着色为选中的 PNP_ID(大写)"""
+    return [row["key"] for row in _rows(device_list) if row["button"].options["fg_color"] == THEME["list_selected"]]
+
+def _packs(device_list):
+    """每行的累计 pack 次数，按 PNP_ID(大写)"""
+    return {key: row["frame"].packs for key, row in device_list.rows.items()}
+
+def _counts(device_list):
+    return device_list.created, device_list.configured
+
+@pytest.mark.parametrize("list_class", [KeyedDeviceList, VirtualDeviceList])
+def test_checked_ids_are_case_insensitive(list_class):
+    scanned = _devices(3)
+    # 插拔通知产生的记录为大写，勾选集合里可能是另一种写法
+    hotplugged = [DeviceRecord.from_pnp_id(dev.pnp_id.upper(), dev.name) for dev in scanned]
+    device_list, _ = _list(list_class)
+
+    device_list.sync(scanned, {scanned[1].pnp_id.upper()})
+    assert [checked for _, checked in _shown(device_list)] == [False, True, False]
+    device_list.sync(hotplugged, {scanned[1].pnp_id})
+    assert [checked for _, checked in _shown(device_list)] == [False, True, False]
+    device_list.set_checked({scanned[2].pnp_id.lower()})
+    assert [checked for _, checked in _shown(device_list)] == [False, False, True]
+
+def test_keyed_removal_from_the_middle_repacks_nothing():
+    devices = _devices(6)
+    device_list, _ = _list(KeyedDeviceList)
+    device_list.sync(devices, set())
+    removed = device_list.rows[_keys(devices)[2]]
+    packs, counts = _packs(device_list), _counts(device_list)
+
+    remaining = devices[:2] + devices[3:]
+    device_list.sync(remaining, set())
+    assert [key for key, _ in _shown(device_list)] == _keys(remaining)
+    assert removed["frame"].destroyed and _keys(devices)[2] not in device_list.rows
+    # 销毁控件后其余行的相对顺序不变：不创建控件、不 configure，也不重新 pack
+    assert _counts(device_list) == counts
+    assert _packs(device_list) == {key: packs[key] for key in _keys(remaining)}
+
+def test_keyed_reorder_and_append_repack_from_first_changed_position():
+    devices = _devices(6)
+    device_list, _ = _list(KeyedDeviceList)
+    device_list.sync(devices, set())
+    rows, counts = dict(device_list.rows), _counts(device_list)
+
+    packs = _packs(device_list)
+    reordered = devices[:3] + [devices[4], devices[3], devices[5]]
+    device_list.sync(reordered, set())
+    assert [key for key, _ in _shown(device_list)] == _keys(reordered)
+    after = _packs(device_list)
+    assert [after[key] - packs[key] for key in _keys(reordered)] == [0, 0, 0, 1, 1, 1]
+    # 原有的行原样保留
+    assert device_list.rows == rows and _counts(device_list) == counts
+
+    packs = _packs(device_list)
+    appended = reordered + _devices(2, start=6)
+    device_list.sync(appended, set())
+    assert [key for key, _ in _shown(device_list)] == _keys(appended)
+    after = _packs(device_list)
+    assert [after[key] - packs.get(key, 0) for key in _keys(appended)] == [0] * 6 + [1, 1]
+    assert device_list.created == counts[0] + 2 * 3
+
+    # 没有变化的同步什么都不做
+    packs, counts = _packs(device_list), _counts(device_list)
+    device_list.sync(appended, set())
+    assert _packs(device_list) == packs and _counts(device_list) == counts
+
+def test_keyed_select_and_set_checked_touch_only_changed_rows():
+    devices = _devices(5)
+    keys = _keys(devices)
+    device_list, events = _list(KeyedDeviceList)
+    device_list.sync(devices, set())
+
+    configured = device_list.configured
+    device_list.select(devices[1].pnp_id)
+    assert _painted(device_list) == [keys[1]] and device_list.configured == configured + 1
+    device_list.select(devices[3].pnp_id.lower())
+    assert _painted(device_list) == [keys[3]] and device_list.configured == configured + 3
+    device_list.select(devices[3].pnp_id)
+    assert device_list.configured == configured + 3
+    device_list.select(None)
+    assert _painted(device_list) == [] and device_list.configured == configured + 4
+
+    configured = device_list.configured
+    device_list.set_checked({devices[0].pnp_id, devices[2].pnp_id})
+    assert [checked for _, checked in _shown(device_list)] == [True, False, True, False, False]
+    assert device_list.configured == configured + 2
+    device_list.set_checked({devices[2].pnp_id})
+    assert [checked for _, checked in _shown(device_list)] == [False, False, True, False, False]
+    assert device_list.configured == configured + 3
+
+    # 选中的设备被移除后重新出现，新建的行按选中状态着色
+    device_list.select(devices[4].pnp_id)
+    device_list.sync(devices[:4], set())
+    device_list.sync(devices, set())
+    assert _painted(device_list) == [keys[4]]
+
+    # 回调带回设备原本的 PNP ID 写法
+    row = device_list.rows[keys[2]]
+    row["button"].options["command"]()
+    row["check"].select()
+    row["check"].options["command"]()
+    assert events == [("select", devices[2].pnp_id), ("check", devices[2].pnp_id, True)]
+
+def test_virtual_pool_is_reused_for_any_number_of_devices():
+    device_list, _ = _list(VirtualDeviceList, visible_rows=8)
+    created = device_list.created
+    assert created == 3 + 8 * 3
+    for count in (3, 1000, 20):
+        device_list.sync(_devices(count), set())
+        assert [key for key, _ in _shown(device_list)] == _keys(_devices(min(count, 8)))
+        assert device_list.created == created
+    # 空列表只额外创建提示标签，有设备后销毁
+    device_list.sync([], set())
+    assert _shown(device_list) == [] and device_list.empty_label is not None
+    device_list.sync(_devices(50), set())
+    assert device_list.empty_label is None
+
+    # 从中间移除设备：可见行重新绑定，不创建控件
+    devices = _devices(50)
+    device_list.sync(devices[:2] + devices[3:], set())
+    assert [key for key, _ in _shown(device_list)] == _keys(devices[:2] + devices[3:9])
+    assert device_list.created == created + 1
+
+def test_virtual_scrolling_rebinds_rows_and_clamps_past_the_end():
+    devices = _devices(50)
+    device_list, _ = _list(VirtualDeviceList, visible_rows=8)
+    device_list.sync(devices, set())
+    created = device_list.created
+
+    def first_shown():
+        return _keys(devices).index(_shown(device_list)[0][0])
+
+    device_list._on_scroll("scroll", 1, "units")
+    assert first_shown() == 1
+    device_list._on_scroll("scroll", 2, "pages")
+    assert first_shown() == 17
+    device_list._on_wheel(SimpleNamespace(delta=120))
+    assert first_shown() == 16
+    device_list._on_scroll("moveto", "0.5")
+    assert first_shown() == 25
+    # 超过末尾或开头时停在边界，始终显示满 8 行
+    device_list._on_scroll("moveto", "1.0")
+    assert first_shown() == 42 and [key for key, _ in _shown(device_list)] == _keys(devices[42:])
+    device_list._on_scroll("scroll", 5, "pages")
+    assert first_shown() == 42
+    device_list._on_wheel(SimpleNamespace(delta=-120 * 1000))
+    assert first_shown() == 42
+    device_list._on_wheel(SimpleNamespace(delta=120 * 1000))
+    assert first_shown() == 0
+    assert device_list.created == created
+
+    # 停在末尾时列表缩短：回到能显示的位置，多余的行隐藏
+    device_list._on_scroll("moveto", "1.0")
+    device_list.sync(devices[:3], set())
+    assert [key for key, _ in _shown(device_list)] == _keys(devices[:3])
+    assert device_list.first == 0 and all(row["key"] is None for row in device_list.pool[3:])
+    device_list._on_scroll("scroll", 1, "units")
+    assert device_list.first == 0
+
+def test_virtual_selection_and_checks_follow_devices_when_scrolling():
+    devices = _devices(50)
+    keys = _keys(devices)
+    device_list, _ = _list(VirtualDeviceList, visible_rows=8)
+    device_list.sync(devices, {devices[1].pnp_id})
+
+    device_list.select(devices[0].pnp_id)
+    assert _painted(device_list) == [keys[0]]
+    # 滚动一行后，原先显示设备 0 的行改为显示设备 1，必须取消着色
+    device_list._on_scroll("scroll", 1, "units")
+    assert _painted(device_list) == []
+    assert _shown(device_list)[0] == (keys[1], True)
+    device_list._on_scroll("scroll", -1, "units")
+    assert _painted(device_list) == [keys[0]]
+
+    # 选中不可见的设备只修改可见行，滚动到它时才着色
+    configured = device_list.configured
+    device_list.select(devices[30].pnp_id)
+    assert _painted(device_list) == [] and device_list.configured == configured + 1
+    device_list._on_scroll("moveto", str(27 / 50))
+    assert _painted(device_list) == [keys[30]]
+
+    configured = device_list.configured
+    device_list.set_checked({devices[29].pnp_id, devices[40].pnp_id})
+    assert [checked for _, checked in _shown(device_list)] == [False, False, True] + [False] * 5
+    # 只有设备 29 的可见行发生变化 (设备 1 已不可见，设备 40 尚不可见)
+    assert device_list.configured == configured + 1
+    device_list._on_scroll("moveto", str(36 / 50))
+    assert _shown(device_list) == [(key, key == keys[40]) for key in keys[36:44]]
+
+def test_virtual_resize_grows_and_shrinks_the_pool():
+    devices = _devices(50)
+    device_list, _ = _list(VirtualDeviceList, visible_rows=4)
+    device_list.sync(devices, set())
+    device_list._on_resize(SimpleNamespace(height=(ROW_HEIGHT + ROW_PADDING) * 9))
+    assert [key for key, _ in _shown(device_list)] == _keys(devices[:10])
+    removed = device_list.pool[3:]
+    device_list._on_resize(SimpleNamespace(height=(ROW_HEIGHT + ROW_PADDING) * 2))
+    assert [key for key, _ in _shown(device_list)] == _keys(devices[:3])
+    assert all(row["frame"].destroyed for row in removed)
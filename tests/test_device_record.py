@@ -0,0 +1,95 @@
+import pytest
+
+from devices import ENUM_ROOT, PARAM_WHEEL, DeviceIndex, DeviceRecord
+
+USB_MOUSE = "HID\\VID_046D&PID_C52B&MI_01&COL01\\7&1a2b3c4d&0&0000"
+BT_MOUSE = "BTHENUM\\{00001124-0000-1000-8000-00805F9B34FB}_VID&0002046D_PID&B023\\8&2f3e4d5c&0&AABBCCDDEEFF_C00000000"
+
+def test_record_splits_pnp_id_and_parses_vid_pid():
+    usb = DeviceRecord.from_pnp_id(USB_MOUSE, "USB Receiver", {PARAM_WHEEL: 0})
+    assert (usb.bus, usb.device_id, usb.instance) == ("HID", "VID_046D&PID_C52B&MI_01&COL01", "7&1a2b3c4d&0&0000")
+    assert usb.pnp_id == USB_MOUSE
+    assert usb.reg_path == f"{ENUM_ROOT}\\{USB_MOUSE}\\Device Parameters"
+    assert usb.id_display == "VID_046D PID_C52B"
+
+    bluetooth = DeviceRecord.from_pnp_id(BT_MOUSE, "MX Master 3S")
+    assert (bluetooth.vid, bluetooth.pid) == ("0002046D", "B023")
+    assert bluetooth.params == {}
+
+    no_vid = DeviceRecord.from_pnp_id("HID\\CONVERTEDDEVICE&COL01\\5&1&0&0000", "Touchpad")
+    assert no_vid.vid is None and no_vid.id_display == "CONVERTEDDEVICE&COL01"
+
+    # 同型号的实例共享 device-ID 字符串
+    other = DeviceRecord.from_pnp_id(USB_MOUSE.replace("1a2b3c4d", "5e6f7a8b"), "USB Receiver")
+    assert other.device_id is usb.device_id and other.bus is usb.bus
+
+def test_record_is_immutable():
+    params = {PARAM_WHEEL: 0}
+    dev = DeviceRecord.from_pnp_id(USB_MOUSE, "USB Receiver", params)
+    for attr in DeviceRecord.__slots__ + ("extra",):
+        with pytest.raises(AttributeError):
+            setattr(dev, attr, "x")
+    with pytest.raises(AttributeError):
+        del dev.name
+    # pnp_id 等是只读属性
+    with pytest.raises(AttributeError):
+        dev.pnp_id = BT_MOUSE
+
+    # params 是创建时的快照：传入的字典和 to_dict() 的结果被修改都不影响记录
+    params[PARAM_WHEEL] = 1
+    dev.to_dict()["params"][PARAM_WHEEL] = 1
+    assert dev.params == {PARAM_WHEEL: 0}
+    assert dev.name == "USB Receiver" and dev.pnp_id == USB_MOUSE
+
+def test_record_dict_round_trip():
+    dev = DeviceRecord.from_pnp_id(BT_MOUSE, "MX Master 3S", {PARAM_WHEEL: 1})
+    data = dev.to_dict()
+    assert data == {"name": "MX Master 3S", "id_display": "VID_0002046D PID_B023", "reg_path": dev.reg_path,
+                    "pnp_id": BT_MOUSE, "params": {PARAM_WHEEL: 1}}
+    restored = DeviceRecord.from_dict(data)
+    assert restored.to_dict() == data
+
+    for bad in ({}, {"pnp_id": USB_MOUSE}, {"pnp_id": "HID\\no-instance", "name": "x"}, {"pnp_id": 1, "name": "x"}):
+        with pytest.raises(ValueError):
+            DeviceRecord.from_dict(bad)
+
+def _pnp_ids(count):
+    return [f"HID\\VID_046D&PID_C52B&MI_01&COL01\\7&{0xabcdef00 + i:08x}&0&0000" for i in range(count)]
+
+def test_index_lookup_is_case_insensitive():
+    pnp_ids = _pnp_ids(5)
+    index = DeviceIndex(DeviceRecord.from_pnp_id(pnp_id, f"Mouse {i}") for i, pnp_id in enumerate(pnp_ids))
+    assert len(index) == 5
+    assert [dev.pnp_id for dev in index] == pnp_ids
+    for i, pnp_id in enumerate(pnp_ids):
+        for spelling in (pnp_id, pnp_id.upper(), pnp_id.lower()):
+            assert spelling in index
+            assert index.get(spelling).name == f"Mouse {i}"
+    missing = USB_MOUSE
+    assert missing not in index
+    assert index.get(missing) is None
+    assert index.get(missing, "default") == "default"
+
+def test_index_add_replaces_in_place_and_discard_removes():
+    pnp_ids = _pnp_ids(4)
+    index = DeviceIndex(DeviceRecord.from_pnp_id(pnp_id, "old") for pnp_id in pnp_ids)
+
+    # 同一设备的新记录 (插拔通知产生的大写 ID) 原位替换，顺序与数量不变
+    replacement = DeviceRecord.from_pnp_id(pnp_ids[1].upper(), "new", {PARAM_WHEEL: 1})
+    index.add(replacement)
+    assert len(index) == 4
+    assert [dev.name for dev in index] == ["old", "new", "old", "old"]
+    assert index.get(pnp_ids[1]) is replacement
+
+    added = DeviceRecord.from_pnp_id(USB_MOUSE, "added")
+    index.add(added)
+    assert list(index)[-1] is added
+
+    removed = index.discard(pnp_ids[2].lower())
+    assert removed.pnp_id == pnp_ids[2]
+    assert pnp_ids[2] not in index and len(index) == 4
+    assert index.discard(pnp_ids[2]) is None
+
+    # 重新加入的设备排在末尾
+    index.add(removed)
+    assert [dev.pnp_id for dev in index] == [pnp_ids[0], pnp_ids[1].upper(), pnp_ids[3], USB_MOUSE, pnp_ids[2]]
@@ -0,0 +1,158 @@
+import threading
+
+import instrumentation
+from devices import (
+    DEVPKEY_FriendlyName,
+    MOUSE_CLASS_GUID,
+    DevnodeSnapshot,
+    IncrementalScanner,
+    MouseEnumerator,
+    resolve_real_name,
+)
+from simulator import HID_CLASS_GUID, USB_CLASS_GUID, SimulatedBackend
+
+def _by_id(devices):
+    return sorted((dev.to_dict() for dev in devices), key=lambda entry: entry["pnp_id"])
+
+def test_bulk_scan_matches_registry_walk():
+    sim = SimulatedBackend.generate(2000, receivers=3, bluetooth=2)
+    bulk = MouseEnumerator(sim).scan()
+    walk = MouseEnumerator(sim).scan_walk()
+    assert len(bulk) == 5
+    assert _by_id(bulk) == _by_id(walk)
+
+def test_scan_falls_back_to_walk_without_bulk_list():
+    with_bulk = MouseEnumerator(SimulatedBackend.generate(500)).scan()
+    without_bulk = MouseEnumerator(SimulatedBackend.generate(500, bulk_list=False)).scan()
+    assert _by_id(with_bulk) == _by_id(without_bulk)
+
+def test_bulk_scan_never_touches_ghost_instances():
+    small = SimulatedBackend.generate(10)
+    large = SimulatedBackend.generate(5000)
+    calls = []
+    for sim in (small, large):
+        recorder = instrumentation.enable()
+        MouseEnumerator(sim).scan()
+        instrumentation.disable()
+        calls.append(sum(recorder.counters.values()))
+    # 调用次数只取决于在线设备，与注册表中的幽灵实例数量无关
+    assert calls[0] == calls[1]
+
+def test_bulk_list_is_filtered_to_mouse_buses_and_class():
+    sim = SimulatedBackend.generate(10)
+    sim.add_device("USB\\VID_1234&PID_5678\\1", MOUSE_CLASS_GUID, params={"FlipFlopWheel": 0})
+    assert all(not dev.pnp_id.startswith("USB\\") for dev in MouseEnumerator(sim).scan())
+
+def test_streaming_walk_yields_first_device_early_and_stops_when_closed():
+    sim = SimulatedBackend.generate(5000, bulk_list=False)
+    recorder = instrumentation.enable()
+    scan = MouseEnumerator(sim).iter_scan()
+    assert next(scan) is not None
+    first = sum(recorder.counters.values())
+    scan.close()
+    instrumentation.disable()
+    assert sum(recorder.counters.values()) == first
+
+    recorder = instrumentation.enable()
+    MouseEnumerator(sim).scan()
+    instrumentation.disable()
+    assert first * 100 < sum(recorder.counters.values())
+
+class CancelAfter:
+    """透传给模拟器，第 limit 次后端调用之后设置 cancel"""
+
+    def __init__(self, sim, limit):
+        self.sim = sim
+        self.limit = limit
+        self.calls = 0
+        self.cancel = threading.Event()
+
+    def __getattr__(self, name):
+        method = getattr(self.sim, name)
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            if self.calls >= self.limit:
+                self.cancel.set()
+            return method(*args, **kwargs)
+        return call
+
+def test_cancelled_walk_stops_at_the_next_key_not_the_next_device():
+    for cls in (MouseEnumerator, IncrementalScanner):
+        for warm in (False, True):
+            sim = SimulatedBackend.generate(5000, receivers=0, bluetooth=0, bulk_list=False)
+            backend = CancelAfter(sim, limit=10 ** 9)
+            scanner = cls(backend)
+            if warm:
+                scanner.scan()
+            # 树中没有在线设备：旧实现要遍历完所有幽灵实例才会回到调用方检查取消
+            backend.calls, backend.limit = 0, 20
+            assert list(scanner.iter_scan(backend.cancel)) == []
+            assert backend.calls <= 21, (cls.__name__, warm, backend.calls)
+
+def test_cancelled_incremental_refresh_is_completed_by_the_next_scan():
+    sim = SimulatedBackend.generate(2000, bulk_list=False)
+    expected = _by_id(MouseEnumerator(sim).scan())
+    backend = CancelAfter(sim, limit=5)
+    scanner = IncrementalScanner(backend)
+    assert list(scanner.iter_scan(backend.cancel)) == []
+    assert _by_id(scanner.scan()) == expected
+    assert _by_id(scanner.scan()) == expected
+
+def _receiver_with_collections(collections):
+    """一个接收器下 collections 个鼠标 HID 集合，共享同一个没有友好名称的接口父节点"""
+    sim = SimulatedBackend.generate(0, receivers=0, bluetooth=0)
+    receiver = sim.add_device("USB\\VID_046D&PID_C52B\\5&1a2b3c4d&0&1", USB_CLASS_GUID,
+                              friendly_name="Logitech USB Receiver")
+    interface = sim.add_device("USB\\VID_046D&PID_C52B&MI_01\\6&1a2b3c4d&0&0001", HID_CLASS_GUID, receiver)
+    pnp_ids = [f"HID\\VID_046D&PID_C52B&MI_01&COL{c + 1:02d}\\7&1a2b3c4d&0&{c:04X}" for c in range(collections)]
+    for pnp_id in pnp_ids:
+        sim.add_device(pnp_id, MOUSE_CLASS_GUID, interface, params={"FlipFlopWheel": 0})
+    return sim, receiver, pnp_ids
+
+def _name_lookups(backend, sim, pnp_ids):
+    recorder = instrumentation.enable()
+    names = [resolve_real_name(backend, sim.locate_devnode(pnp_id), pnp_id, "HID-compliant mouse") for pnp_id in pnp_ids]
+    instrumentation.disable()
+    counters = recorder.counters
+    return names, counters.get("cfgmgr.get_property", 0), counters.get("cfgmgr.get_parent", 0)
+
+def test_snapshot_queries_each_devnode_once_per_scan():
+    sim, _, pnp_ids = _receiver_with_collections(8)
+    direct = _name_lookups(sim, sim, pnp_ids)
+    cached = _name_lookups(DevnodeSnapshot(sim), sim, pnp_ids)
+    assert direct[0] == cached[0] == ["Logitech USB Receiver"] * 8
+    # 无缓存：每个集合都要读 自身/接口/接收器 三个属性、两次父节点
+    assert direct[1:] == (3 * 8, 2 * 8)
+    # 快照：接口和接收器只查一次，之后每个集合只剩自身的一次属性和一次父节点
+    assert cached[1:] == (8 + 2, 8 + 1)
+
+def test_scan_invalidates_snapshot_between_scans():
+    sim, receiver, pnp_ids = _receiver_with_collections(4)
+    enumerator = MouseEnumerator(sim)
+    recorder = instrumentation.enable()
+    first = enumerator.scan()
+    instrumentation.disable()
+    assert [dev.name for dev in first] == ["Logitech USB Receiver"] * 4
+    assert recorder.counters["cfgmgr.get_property"] == 4 + 2
+    assert recorder.counters["cfgmgr.get_parent"] == 4 + 1
+
+    # 第二次扫描重新查询，能看到两次扫描之间改名的父节点
+    sim._nodes[receiver].friendly_name = "Logitech Unifying Receiver"
+    recorder = instrumentation.enable()
+    second = enumerator.scan()
+    instrumentation.disable()
+    assert [dev.name for dev in second] == ["Logitech Unifying Receiver"] * 4
+    assert recorder.counters["cfgmgr.get_property"] == 4 + 2
+
+def test_snapshot_caches_by_property_key_contents():
+    sim, receiver, _ = _receiver_with_collections(1)
+    snapshot = DevnodeSnapshot(sim)
+    recorder = instrumentation.enable()
+    # 两个内容相同的 DEVPROPKEY 实例命中同一个缓存项
+    copy = type(DEVPKEY_FriendlyName).from_buffer_copy(bytes(DEVPKEY_FriendlyName))
+    assert snapshot.get_property(receiver, DEVPKEY_FriendlyName) == snapshot.get_property(receiver, copy)
+    instrumentation.disable()
+    assert recorder.counters["cfgmgr.get_property"] == 1
+    # 未缓存的方法原样透传
+    assert snapshot.locate_devnode("USB\\VID_046D&PID_C52B\\5&1a2b3c4d&0&1") == receiver
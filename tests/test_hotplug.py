@@ -0,0 +1,112 @@
+import instrumentation
+from devices import (
+    DEVICE_ARRIVAL,
+    DEVICE_REMOVAL,
+    MOUSE_CLASS_GUID,
+    PARAM_WHEEL,
+    DeviceEventSource,
+    HotplugMonitor,
+    IncrementalScanner,
+    MouseEnumerator,
+)
+from simulator import SimulatedBackend
+
+NEW_MOUSE = "HID\\VID_05AC&PID_0269&MI_00\\7&1f2e3d4c&0&0000"
+
+class ScriptedEventSource(DeviceEventSource):
+    def start(self, callback):
+        self.emit = callback
+        return True
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _monitor(sim):
+    clock = Clock()
+    source = ScriptedEventSource()
+    monitor = HotplugMonitor(source, MouseEnumerator(sim), quiet=0.5, clock=clock)
+    devices = MouseEnumerator(sim).scan()
+    assert monitor.start(devices)
+    return monitor, source, clock, devices
+
+def test_flapping_within_quiet_collapses_to_final_state():
+    sim = SimulatedBackend.generate(100)
+    monitor, source, clock, devices = _monitor(sim)
+    target = devices[0].pnp_id
+
+    for action in (DEVICE_REMOVAL, DEVICE_ARRIVAL, DEVICE_REMOVAL):
+        source.emit(action, target)
+        clock.now += 0.1
+    assert monitor.poll() == []
+    sim.remove_device(target)
+    clock.now += 0.5
+    assert monitor.poll() == [("removed", target.upper())]
+
+    # 拔出后又插回，最终状态与初始状态相同：不产生增量
+    sim2 = SimulatedBackend.generate(100)
+    monitor, source, clock, devices = _monitor(sim2)
+    for action in (DEVICE_REMOVAL, DEVICE_ARRIVAL):
+        source.emit(action, devices[0].pnp_id)
+        clock.now += 0.1
+    clock.now += 0.5
+    assert monitor.poll() == []
+
+def test_duplicate_arrivals_are_ignored():
+    sim = SimulatedBackend.generate(100)
+    monitor, source, clock, _ = _monitor(sim)
+    sim.add_device(NEW_MOUSE, MOUSE_CLASS_GUID, friendly_name="Magic Mouse", params={PARAM_WHEEL: 1})
+
+    source.emit(DEVICE_ARRIVAL, NEW_MOUSE)
+    source.emit(DEVICE_ARRIVAL, NEW_MOUSE)
+    clock.now += 0.5
+    deltas = monitor.poll()
+    assert [(kind, dev.pnp_id.upper()) for kind, dev in deltas] == [("added", NEW_MOUSE.upper())]
+    assert deltas[0][1].name == "Magic Mouse"
+
+    source.emit(DEVICE_ARRIVAL, NEW_MOUSE)
+    clock.now += 0.5
+    assert monitor.poll() == []
+
+def test_non_mouse_buses_are_filtered_without_probing():
+    sim = SimulatedBackend.generate(100)
+    monitor, source, clock, _ = _monitor(sim)
+    usb_mouse = "USB\\VID_1234&PID_5678\\1"
+    sim.add_device(usb_mouse, MOUSE_CLASS_GUID, params={PARAM_WHEEL: 0})
+
+    source.emit(DEVICE_ARRIVAL, usb_mouse)
+    clock.now += 0.5
+    recorder = instrumentation.enable()
+    assert monitor.poll() == []
+    instrumentation.disable()
+    assert recorder.counters == {}
+
+def test_removal_of_unknown_device_is_ignored():
+    sim = SimulatedBackend.generate(100)
+    monitor, source, clock, _ = _monitor(sim)
+    source.emit(DEVICE_REMOVAL, NEW_MOUSE)
+    clock.now += 0.5
+    assert monitor.poll() == []
+
+def test_replugged_ghost_is_found_by_next_walk_when_ghosts_are_shared():
+    sim = SimulatedBackend.generate(100, bulk_list=False)
+    scanner = IncrementalScanner(sim)
+    target = scanner.scan()[0].pnp_id
+    sim.remove_device(target)
+    assert target not in {dev.pnp_id for dev in scanner.scan()}
+
+    # 实例键没有变化，下一次遍历仍会把它当作幽灵实例跳过，只能靠插拔通知发现
+    sim.replug_device(target)
+    assert target not in {dev.pnp_id for dev in scanner.scan()}
+
+    clock = Clock()
+    source = ScriptedEventSource()
+    monitor = HotplugMonitor(source, MouseEnumerator(sim, ghosts=scanner.ghosts), quiet=0.5, clock=clock)
+    assert monitor.start(scanner.scan())
+    source.emit(DEVICE_ARRIVAL, target)
+    clock.now += 0.5
+    assert [kind for kind, _ in monitor.poll()] == ["added"]
+    assert target in {dev.pnp_id for dev in scanner.scan()}
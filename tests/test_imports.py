@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _loaded_modules(code: str) -> set:
+    proc = subprocess.run([sys.executable, "-c", f"{code}; import sys; print('\\n'.join(sys.modules))"],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(proc.stdout.split())
+
+def test_cli_path_does_not_load_gui_modules():
+    modules = _loaded_modules("import main, cli")
+    assert not {name for name in modules if name.split(".")[0] in ("tkinter", "_tkinter", "customtkinter", "gui")}
@@ -0,0 +1,64 @@
+import instrumentation
+from devices import ENUM_ROOT, MOUSE_CLASS_GUID, PARAM_WHEEL, IncrementalScanner, MouseEnumerator
+from simulator import SimulatedBackend
+
+NEW_MOUSE = "HID\\VID_05AC&PID_0269&MI_00\\7&1f2e3d4c&0&0000"
+
+def _ids(devices):
+    return sorted(dev.pnp_id for dev in devices)
+
+def _rescan_calls(sim, scanner) -> int:
+    recorder = instrumentation.enable()
+    scanner.scan()
+    instrumentation.disable()
+    return sum(recorder.counters.values())
+
+def test_unchanged_rescan_cost_does_not_depend_on_instance_count():
+    costs = []
+    for size in (100, 20000):
+        sim = SimulatedBackend.generate(size)
+        scanner = IncrementalScanner(sim)
+        scanner.scan()
+        costs.append(_rescan_calls(sim, scanner))
+    # 3 个 bus 键 + 一次批量列表 + 每个在线设备一次 Device Parameters 查询
+    assert costs[0] == costs[1] == 3 + 1 + 3
+
+def test_rescan_picks_up_new_and_removed_instances():
+    for bulk_list in (True, False):
+        sim = SimulatedBackend.generate(1000, bulk_list=bulk_list)
+        scanner = IncrementalScanner(sim)
+        before = scanner.scan()
+
+        sim.add_device(NEW_MOUSE, MOUSE_CLASS_GUID, friendly_name="Magic Mouse", params={PARAM_WHEEL: 1})
+        assert _ids(scanner.scan()) == sorted(_ids(before) + [NEW_MOUSE])
+
+        sim.remove_device(before[0].pnp_id)
+        after = scanner.scan()
+        assert _ids(after) == sorted(_ids(before[1:]) + [NEW_MOUSE])
+        assert _ids(after) == _ids(MouseEnumerator(sim).scan())
+
+def test_rescan_picks_up_device_parameters_changes():
+    for bulk_list in (True, False):
+        sim = SimulatedBackend.generate(1000, bulk_list=bulk_list)
+        sim.add_device(NEW_MOUSE, MOUSE_CLASS_GUID, friendly_name="Magic Mouse", params={})
+        scanner = IncrementalScanner(sim)
+        assert NEW_MOUSE not in _ids(scanner.scan())
+
+        # 在 regedit 中新建 FlipFlopWheel 后刷新
+        params_path = f"{ENUM_ROOT}\\{NEW_MOUSE}\\Device Parameters"
+        sim.write_values(params_path, {PARAM_WHEEL: 1})
+        found = {dev.pnp_id: dev for dev in scanner.scan()}
+        assert found[NEW_MOUSE].params == {PARAM_WHEEL: 1}
+
+        # 其他工具改写取值后，缓存的 params 也要更新
+        sim.write_values(params_path, {PARAM_WHEEL: 0})
+        found = {dev.pnp_id: dev for dev in scanner.scan()}
+        assert found[NEW_MOUSE].params == {PARAM_WHEEL: 0}
+
+def test_invalidate_forces_full_scan():
+    sim = SimulatedBackend.generate(1000)
+    scanner = IncrementalScanner(sim)
+    scanner.scan()
+    cached = _rescan_calls(sim, scanner)
+    scanner.invalidate()
+    assert _rescan_calls(sim, scanner) > cached
@@ -0,0 +1,90 @@
+import json
+import re
+
+import pytest
+
+import instrumentation
+from devices import MouseEnumerator
+from simulator import DEFAULT_LATENCY, SimulatedBackend
+
+SCAN_COUNTERS = {
+    "cfgmgr.get_class_device_ids": 1,
+    "cfgmgr.get_devnode_status": 3,
+    "cfgmgr.get_property": 8,
+    "cfgmgr.get_parent": 5,
+    "registry.query_values": 3,
+    "registry.read_all_values": 3,
+}
+SCAN_SPANS = {"scan": 1, "scan.enumerate": 1, "scan.devnode_status": 3, "scan.class_filter": 3, "scan.resolve_name": 3}
+
+# Prometheus 文本格式：# TYPE <名称> <类型> 或 <名称>{<标签>="<值>"} <数值>
+PROM_TYPE_RE = re.compile(r"# TYPE ([a-z_]+) (counter|gauge|summary)")
+PROM_SAMPLE_RE = re.compile(r'([a-z_]+)\{([a-z]+)="([^"]+)"\} (\d+(?:\.\d+)?)')
+
+@pytest.fixture
+def recorder():
+    sim = SimulatedBackend.generate(100)
+    enumerator = MouseEnumerator(sim)
+    # 用模拟器的虚拟时钟计时，span 耗时只取决于后端调用次数
+    recorder = instrumentation.enable(instrumentation.Recorder(clock=sim.clock))
+    try:
+        assert len(enumerator.scan()) == 3
+    finally:
+        instrumentation.disable()
+    return recorder
+
+def test_scan_counters_and_spans(recorder):
+    assert recorder.counters == SCAN_COUNTERS
+    assert {name: timing[0] for name, timing in recorder.timings.items()} == SCAN_SPANS
+
+    cfgmgr = sum(value for name, value in SCAN_COUNTERS.items() if name.startswith("cfgmgr."))
+    registry = sum(value for name, value in SCAN_COUNTERS.items() if name.startswith("registry."))
+    count, total, peak = recorder.timings["scan"]
+    assert total == peak == pytest.approx(cfgmgr * DEFAULT_LATENCY["cfgmgr"] + registry * DEFAULT_LATENCY["registry"])
+    # 子 span 互不重叠，耗时之和就是整次扫描
+    children = sum(timing[1] for name, timing in recorder.timings.items() if name.startswith("scan."))
+    assert children == pytest.approx(total)
+
+def test_disabled_recorder_sees_nothing(recorder):
+    sim = SimulatedBackend.generate(100)
+    MouseEnumerator(sim).scan()
+    assert recorder.counters == SCAN_COUNTERS
+    assert instrumentation.current() is None
+
+def test_json_lines_export_parses(recorder):
+    entries = [json.loads(line) for line in recorder.to_json_lines().splitlines()]
+    assert entries == recorder.report()
+    spans = {entry["name"]: entry for entry in entries if entry["type"] == "span"}
+    counters = {entry["name"]: entry["value"] for entry in entries if entry["type"] == "counter"}
+    assert counters == SCAN_COUNTERS
+    assert {name: entry["count"] for name, entry in spans.items()} == SCAN_SPANS
+    assert all(0 < entry["max"] <= entry["total"] for entry in spans.values())
+
+def test_prometheus_export_parses(recorder):
+    types, samples = {}, {}
+    for line in recorder.to_prometheus().splitlines():
+        declared = PROM_TYPE_RE.fullmatch(line)
+        if declared:
+            types[declared.group(1)] = declared.group(2)
+            continue
+        sample = PROM_SAMPLE_RE.fullmatch(line)
+        assert sample, line
+        metric, _, label, value = sample.groups()
+        # 每个样本都必须属于前面声明过的指标 (summary 的 _sum / _count 属于其基础名称)
+        assert metric in types or re.sub(r"_(sum|count)$", "", metric) in types, line
+        samples[metric, label] = float(value)
+
+    assert types == {"mousewheel_span_seconds": "summary", "mousewheel_span_seconds_max": "gauge",
+                     "mousewheel_calls_total": "counter"}
+    assert {label: value for (metric, label), value in samples.items()
+            if metric == "mousewheel_calls_total"} == SCAN_COUNTERS
+    assert {label: value for (metric, label), value in samples.items()
+            if metric == "mousewheel_span_seconds_count"} == SCAN_SPANS
+    assert samples["mousewheel_span_seconds_sum", "scan"] == pytest.approx(recorder.timings["scan"][1], abs=1e-6)
+
+@pytest.mark.parametrize("suffix", [".prom", ".jsonl"])
+def test_write_picks_format_from_extension(recorder, tmp_path, suffix):
+    path = tmp_path / f"scan{suffix}"
+    recorder.write(str(path))
+    expected = recorder.to_prometheus() if suffix == ".prom" else recorder.to_json_lines()
+    assert path.read_text(encoding="utf-8") == expected
@@ -0,0 +1,126 @@
+import instrumentation
+from devices import (
+    ENUM_ROOT,
+    MOUSE_CLASS_GUID,
+    PARAM_HSCROLL,
+    PARAM_WHEEL,
+    RESTART_EACH_CHILD,
+    DeviceRecord,
+    apply_to_devices,
+    commit_change,
+    read_parameters,
+)
+from simulator import SimulatedBackend
+
+MICE = [f"HID\\VID_046D&PID_C52B&MI_01&COL01\\7&{0xa1b2c3d0 + i:08x}&0&0000" for i in range(4)]
+
+def _path(pnp_id):
+    return f"{ENUM_ROOT}\\{pnp_id}\\Device Parameters"
+
+class FailingWrites:
+    """透传给模拟器，对 failing 中的路径写入返回 False (如没有权限)"""
+
+    def __init__(self, sim, failing=()):
+        self.sim = sim
+        self.failing = {path.upper() for path in failing}
+        self.writes = []
+
+    def write_values(self, path, values):
+        self.writes.append(path)
+        if path.upper() in self.failing:
+            return False
+        return self.sim.write_values(path, values)
+
+    def __getattr__(self, name):
+        return getattr(self.sim, name)
+
+class Restarter:
+    def __init__(self):
+        self.calls = []
+
+    def restart(self, pnp_id):
+        self.calls.append(pnp_id)
+        return {"pnp_id": pnp_id, "ok": True, "stage": "done", "error": None,
+                "disable_latency": 0.0, "enable_latency": 0.0}
+
+    def wait_started(self, pnp_id, timeout=None):
+        return 0.0
+
+def _sim(params):
+    """MICE[i] 的 Device Parameters 为 params[i]，None 表示没有这个键"""
+    sim = SimulatedBackend.generate(0, receivers=0, bluetooth=0)
+    for pnp_id, values in zip(MICE, params):
+        sim.add_device(pnp_id, MOUSE_CLASS_GUID, params=values)
+    return sim, [DeviceRecord.from_pnp_id(pnp_id, "Mouse") for pnp_id in MICE[:len(params)]]
+
+def test_read_parameters_returns_only_known_int_values_in_one_read():
+    sim, _ = _sim([
+        {PARAM_WHEEL: 1, PARAM_HSCROLL: 0, "SelectiveSuspendEnabled": 1},
+        {PARAM_WHEEL: 0},
+        {PARAM_HSCROLL: "1", "WaitWakeEnabled": 1},  # 类型不对的值视为不存在
+        {},
+    ])
+    recorder = instrumentation.enable()
+    found = [read_parameters(sim, _path(pnp_id)) for pnp_id in MICE]
+    instrumentation.disable()
+    assert found == [{PARAM_WHEEL: 1, PARAM_HSCROLL: 0}, {PARAM_WHEEL: 0}, {}, {}]
+    # 每个键只打开一次，不逐个查询参数
+    assert recorder.counters == {"registry.read_all_values": 4}
+
+def test_read_parameters_of_missing_key_is_none():
+    sim, _ = _sim([None])
+    assert read_parameters(sim, _path(MICE[0])) is None
+    assert read_parameters(sim, _path(MICE[1])) is None
+
+def test_write_values_sets_and_deletes_in_one_call():
+    sim, _ = _sim([{PARAM_WHEEL: 0, "SelectiveSuspendEnabled": 1}])
+    path = _path(MICE[0])
+    assert sim.write_values(path, {PARAM_WHEEL: 1, PARAM_HSCROLL: 1})
+    assert sim.read_all_values(path) == {PARAM_WHEEL: 1, PARAM_HSCROLL: 1, "SelectiveSuspendEnabled": 1}
+    # None 删除该值，删除不存在的值不算失败；其他值不受影响
+    assert sim.write_values(path, {PARAM_HSCROLL: None, "NoSuchValue": None})
+    assert sim.read_all_values(path) == {PARAM_WHEEL: 1, "SelectiveSuspendEnabled": 1}
+    assert read_parameters(sim, path) == {PARAM_WHEEL: 1}
+
+def test_write_values_to_missing_key_fails_without_creating_it():
+    sim, _ = _sim([None])
+    path = _path(MICE[0])
+    assert not sim.write_values(path, {PARAM_WHEEL: 1})
+    assert sim.read_all_values(path) is None
+
+def test_batch_with_partial_write_failure_restarts_only_written_devices():
+    sim, devices = _sim([{PARAM_WHEEL: 0}, None, {PARAM_WHEEL: 0, PARAM_HSCROLL: 0}, {PARAM_WHEEL: 0}])
+    backend = FailingWrites(sim, failing=[devices[3].reg_path])
+    restarter = Restarter()
+    results = apply_to_devices(devices, {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}, backend,
+                               restart_mode=RESTART_EACH_CHILD, restarter=restarter)
+
+    # 每个设备都尝试写入一次；没有 Device Parameters 键或拒绝写入的设备不重启
+    assert backend.writes == [dev.reg_path for dev in devices]
+    assert [r["written"] for r in results] == [True, False, True, False]
+    assert [r["restart"] is not None for r in results] == [True, False, True, False]
+    assert sorted(restarter.calls) == sorted([MICE[0], MICE[2]])
+
+    assert read_parameters(sim, devices[0].reg_path) == {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}
+    assert read_parameters(sim, devices[1].reg_path) is None
+    assert read_parameters(sim, devices[2].reg_path) == {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}
+    assert read_parameters(sim, devices[3].reg_path) == {PARAM_WHEEL: 0}
+
+def test_commit_writes_only_changed_values_and_reports_write_failure():
+    sim, devices = _sim([{PARAM_WHEEL: 1}, None])
+    restarter = Restarter()
+
+    # 只写入与当前值不同的参数；原来不存在的参数按 0 比较
+    backend = FailingWrites(sim)
+    result = commit_change(devices[0], {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}, backend, restarter)
+    assert result["ok"] and result["previous"] == {PARAM_WHEEL: 1}
+    assert read_parameters(sim, devices[0].reg_path) == {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}
+    result = commit_change(devices[0], {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}, backend, restarter)
+    assert result["ok"] and result["unchanged"]
+    assert len(backend.writes) == 1 and restarter.calls == [MICE[0]]
+
+    # 没有 Device Parameters 键：写入失败，不重启也不回滚
+    result = commit_change(devices[1], {PARAM_WHEEL: 1}, backend, restarter)
+    assert not result["ok"] and result["error"] and not result["rolled_back"]
+    assert result["previous"] == {} and result["restart"] is None
+    assert restarter.calls == [MICE[0]]
@@ -0,0 +1,75 @@
+from devices import ENUM_ROOT, MOUSE_CLASS_GUID, PARAM_HSCROLL, PARAM_WHEEL, DeviceRecord
+from profiles import ACTION_CHANGE, ACTION_KEEP, Profile
+from simulator import HID_SERVICE_UUID, SimulatedBackend
+
+USB_MOUSE = "HID\\VID_046D&PID_C08B&MI_00\\7&2a3b4c5d&0&0000"
+BT_MOUSE = f"HID\\{HID_SERVICE_UUID}_VID&0002046D_PID&B019\\9&1a2b3c4d&0&0000"
+MAGIC_MOUSE = "HID\\VID_05AC&PID_0269&MI_00\\7&1f2e3d4c&0&0000"
+
+def _registry(**params):
+    """只有注册表实例的假注册表，params 为 {pnp_id: Device Parameters}"""
+    sim = SimulatedBackend()
+    devices = []
+    for name, (pnp_id, values) in params.items():
+        sim.add_instance(pnp_id, MOUSE_CLASS_GUID, params=values)
+        devices.append(DeviceRecord.from_pnp_id(pnp_id, name))
+    return sim, devices
+
+def _plan(data, sim, devices):
+    return {entry["device"].name: entry for entry in Profile.from_dict(data).plan(devices, sim)}
+
+def test_login_without_changes_plans_nothing():
+    sim, devices = _registry(G502=(USB_MOUSE, {PARAM_WHEEL: 1, PARAM_HSCROLL: 0}),
+                             Magic=(MAGIC_MOUSE, {PARAM_WHEEL: 0}))
+    data = {"default": "windows", "rules": [{"match": {"vid": "046D"}, "mode": "mac", "hscroll": "off"}]}
+    plan = _plan(data, sim, devices)
+    assert [entry["action"] for entry in plan.values()] == [ACTION_KEEP, ACTION_KEEP]
+    # 缺省的参数按 0 比较
+    sim.write_values(f"{ENUM_ROOT}\\{USB_MOUSE}\\Device Parameters", {PARAM_HSCROLL: None})
+    assert not any(entry["action"] == ACTION_CHANGE for entry in _plan(data, sim, devices).values())
+
+def test_last_matching_rule_wins_per_parameter():
+    sim, devices = _registry(G502=(USB_MOUSE, {PARAM_WHEEL: 0, PARAM_HSCROLL: 0}))
+    rules = [{"match": {"vid": "046D"}, "mode": "mac", "hscroll": "on"},
+             {"match": {"name": "g5*"}, "mode": "windows"}]
+    entry = _plan({"rules": rules}, sim, devices)["G502"]
+    # 后一条规则只覆盖 mode，hscroll 仍来自前一条
+    assert entry["wanted"] == {PARAM_WHEEL: 0, PARAM_HSCROLL: 1}
+    assert entry["rule"] == "vid=046D; name=g5*"
+    assert entry["action"] == ACTION_CHANGE
+
+    entry = _plan({"rules": rules[::-1]}, sim, devices)["G502"]
+    assert entry["wanted"] == {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}
+
+def test_exact_pnp_id_rules_keep_their_position():
+    sim, devices = _registry(G502=(USB_MOUSE, {PARAM_WHEEL: 0}))
+    rules = [{"match": {"pnp_id": USB_MOUSE.lower()}, "mode": "mac"},
+             {"match": {"vid": "046D"}, "mode": "windows"}]
+    assert _plan({"rules": rules}, sim, devices)["G502"]["wanted"] == {PARAM_WHEEL: 0}
+    assert _plan({"rules": rules[::-1]}, sim, devices)["G502"]["wanted"] == {PARAM_WHEEL: 1}
+
+def test_bluetooth_vid_matches_low_16_bits():
+    sim, devices = _registry(MX=(BT_MOUSE, {PARAM_WHEEL: 0}))
+    assert devices[0].vid.upper() == "0002046D"
+    for vid in ("046D", "0002046D", "04*"):
+        plan = _plan({"rules": [{"match": {"vid": vid, "pid": "B019"}, "mode": "mac"}]}, sim, devices)
+        assert plan["MX"]["action"] == ACTION_CHANGE, vid
+    # 来源前缀本身不是 VID
+    assert _plan({"rules": [{"match": {"vid": "0002"}, "mode": "mac"}]}, sim, devices) == {}
+
+def test_default_applies_only_to_mode():
+    sim, devices = _registry(G502=(USB_MOUSE, {PARAM_WHEEL: 0, PARAM_HSCROLL: 1}),
+                             Magic=(MAGIC_MOUSE, {PARAM_WHEEL: 1}))
+    data = {"default": "mac", "rules": [{"match": {"vid": "046D"}, "hscroll": "off"},
+                                        {"match": {"name": "Magic"}, "mode": "windows"}]}
+    plan = _plan(data, sim, devices)
+    assert plan["G502"]["wanted"] == {PARAM_HSCROLL: 0, PARAM_WHEEL: 1}
+    assert plan["G502"]["rule"] == "vid=046D; default"
+    # 规则设置了 mode 时 default 不生效
+    assert plan["Magic"]["wanted"] == {PARAM_WHEEL: 0}
+
+    sim, devices = _registry(Other=(MAGIC_MOUSE, {PARAM_WHEEL: 1, PARAM_HSCROLL: 1}))
+    entry = _plan({"default": "mac", "rules": [{"match": {"vid": "046D"}, "mode": "windows"}]}, sim, devices)["Other"]
+    assert entry["wanted"] == {PARAM_WHEEL: 1}
+    assert entry["rule"] == "default"
+    assert entry["action"] == ACTION_KEEP
@@ -0,0 +1,107 @@
+import re
+
+from devices import PARAM_HSCROLL, PARAM_WHEEL, DeviceRecord, DeviceRestarter, MouseEnumerator, read_parameters
+from profiles import Profile
+from provisioning import dump_plan, export_plan, format_reg, import_plan, plan_import, write_reg
+from simulator import SimulatedBackend
+
+MAC = Profile.from_dict({"default": "mac", "rules": []})
+
+class FailingBackend:
+    """透传给模拟器，对 fail 中的 PNP ID 写入失败"""
+
+    def __init__(self, sim, fail):
+        self.sim = sim
+        self.fail = {pnp_id.upper() for pnp_id in fail}
+
+    def write_values(self, path, values):
+        if any(path.upper().startswith(f"SYSTEM\\CURRENTCONTROLSET\\ENUM\\{pnp_id}\\") for pnp_id in self.fail):
+            return False
+        return self.sim.write_values(path, values)
+
+    def __getattr__(self, name):
+        return getattr(self.sim, name)
+
+def _setup(**kwargs):
+    sim = SimulatedBackend.generate(300, **kwargs)
+    registered = list(MouseEnumerator(sim).iter_registered())
+    online = {dev.pnp_id for dev in MouseEnumerator(sim).scan()}
+    return sim, registered, online
+
+def _restarter(sim):
+    return DeviceRestarter(sim, clock=sim.clock, sleep=sim.sleep)
+
+def test_export_includes_offline_instances_and_round_trips(tmp_path):
+    sim, registered, online = _setup()
+    offline = [dev for dev in registered if dev.pnp_id not in online]
+    assert online < {dev.pnp_id for dev in registered} and len(offline) > 100
+    # 与型号多数设置不同的离线实例单独成一条 pnp_id 规则
+    odd = offline[0]
+    sim.write_values(odd.reg_path, {PARAM_WHEEL: 1, PARAM_HSCROLL: 1})
+    registered = list(MouseEnumerator(sim).iter_registered())
+
+    plan = export_plan(registered)
+    assert {"match": {"pnp_id": odd.pnp_id}, "mode": "mac", "hscroll": "on"} in plan["rules"]
+    # 每个 VID/PID 一条规则，而不是每个实例一条
+    assert len(plan["rules"]) < len(registered) / 5
+
+    path = tmp_path / "plan.json"
+    dump_plan(plan, str(path))
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == len(plan["rules"]) + 2
+    # 导出的计划应用到同一台机器上不需要任何修改
+    assert plan_import(Profile.load(str(path)), registered) == []
+
+def test_format_reg_is_well_formed_and_escaped(tmp_path):
+    dev = DeviceRecord.from_pnp_id("HID\\VID_046D&PID_C52B&MI_01&COL01\\7&42485e3a&0&F728", "Receiver")
+    text = format_reg([(dev, {PARAM_WHEEL: 1, PARAM_HSCROLL: 0}), (dev, {'Odd"Name\\': 0xFFFFFFFF})])
+
+    assert text.startswith("Windows Registry Editor Version 5.00\r\n\r\n")
+    assert "\n" not in text.replace("\r\n", "")
+    lines = text.split("\r\n")
+    assert lines[2] == "[HKEY_LOCAL_MACHINE\\SYSTEM\\CurrentControlSet\\Enum\\HID\\VID_046D&PID_C52B&MI_01&COL01\\7&42485e3a&0&F728\\Device Parameters]"
+    assert lines[3:6] == ['"FlipFlopWheel"=dword:00000001', '"FlipFlopHScroll"=dword:00000000', ""]
+    assert lines[7] == '"Odd\\"Name\\\\"=dword:ffffffff'
+    for line in lines[2:]:
+        assert line == "" or re.fullmatch(r"\[HKEY_LOCAL_MACHINE\\[^\]]+\]", line) \
+            or re.fullmatch(r'"(?:[^"\\]|\\.)*"=dword:[0-9a-f]{8}', line), line
+
+    path = tmp_path / "plan.reg"
+    write_reg([(dev, {PARAM_WHEEL: 1})], str(path))
+    # regedit 要求 UTF-16 (带 BOM)
+    assert path.read_bytes()[:2] == b"\xff\xfe"
+    assert path.read_bytes().decode("utf-16") == format_reg([(dev, {PARAM_WHEEL: 1})])
+
+def test_import_writes_offline_instances_and_restarts_only_online_ones():
+    for bulk_list in (True, False):
+        sim, registered, online = _setup(bulk_list=bulk_list)
+        result = import_plan(MAC, sim, restarter=_restarter(sim))
+
+        needed = {dev.pnp_id for dev in registered if dev.params.get(PARAM_WHEEL) != 1}
+        assert result["instances"] == len(registered)
+        assert set(result["written"]) == needed and result["failed"] == []
+        assert set(result["online"]) == needed & online
+        assert set(result["restarts"]) == set(result["online"])
+        assert all(outcome["ok"] for outcome in result["restarts"].values())
+        assert all(read_parameters(sim, dev.reg_path)[PARAM_WHEEL] == 1 for dev in registered)
+        # 再导入一次时已经没有需要修改的实例
+        assert import_plan(MAC, sim, restarter=_restarter(sim))["changes"] == []
+
+def test_dry_run_and_no_restart():
+    sim, registered, _ = _setup()
+    result = import_plan(MAC, sim, dry_run=True)
+    assert len(result["changes"]) > 100 and result["written"] == []
+    assert all(read_parameters(sim, dev.reg_path) == dev.params for dev in registered)
+
+    result = import_plan(MAC, sim, restart=False)
+    assert len(result["written"]) == len(result["changes"])
+    assert result["online"] == [] and result["restarts"] == {}
+
+def test_failed_writes_are_reported_and_not_restarted():
+    sim, registered, online = _setup()
+    broken = sorted(online)[0]
+    result = import_plan(MAC, FailingBackend(sim, [broken]), restarter=_restarter(sim))
+    assert result["failed"] == [broken]
+    assert broken not in result["written"] and broken not in result["restarts"]
+    already_mac = {dev.pnp_id for dev in registered if dev.params.get(PARAM_WHEEL) == 1}
+    assert set(result["online"]) == online - already_mac - {broken}
@@ -0,0 +1,61 @@
+import instrumentation
+from devices import DeviceRestarter, MouseEnumerator
+from simulator import SimulatedBackend
+
+def _setup(**kwargs):
+    sim = SimulatedBackend.generate(100, **kwargs)
+    target = MouseEnumerator(sim).scan()[0].pnp_id
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        sim.sleep(seconds)
+
+    return sim, target, sleeps, sleep
+
+def test_poll_interval_backs_off_exponentially_up_to_max_delay():
+    sim, target, sleeps, sleep = _setup(off_delay=0.05, on_delay=0.8)
+    restarter = DeviceRestarter(sim, initial_delay=0.005, max_delay=0.1, clock=sim.clock, sleep=sleep)
+    assert restarter.restart(target)["ok"]
+
+    # 禁用阶段 0.005 -> 0.01 -> 0.02 -> 0.04；启用阶段重新从 0.005 开始，封顶 0.1
+    assert sleeps[:4] == [0.005, 0.01, 0.02, 0.04]
+    enable_sleeps = sleeps[4:]
+    assert enable_sleeps[:5] == [0.005, 0.01, 0.02, 0.04, 0.08]
+    assert set(enable_sleeps[5:]) == {0.1}
+
+def test_latencies_match_simulated_devnode_delays():
+    sim, target, _, sleep = _setup(off_delay=0.05, on_delay=0.3)
+    restarter = DeviceRestarter(sim, initial_delay=0.005, max_delay=0.1, clock=sim.clock, sleep=sleep)
+    result = restarter.restart(target)
+    assert result["ok"] and result["stage"] == "done"
+    # 轮询粒度最多 max_delay，再加上每次后端调用的模拟耗时
+    assert 0.05 <= result["disable_latency"] <= 0.05 + 0.1 + 0.001
+    assert 0.3 <= result["enable_latency"] <= 0.3 + 0.1 + 0.001
+
+def test_disable_timeout_still_re_enables_the_device():
+    sim, target, _, sleep = _setup(off_delay=10.0, on_delay=0.0)
+    restarter = DeviceRestarter(sim, disable_timeout=0.2, clock=sim.clock, sleep=sleep)
+    recorder = instrumentation.enable()
+    result = restarter.restart(target)
+    instrumentation.disable()
+
+    assert not result["ok"]
+    assert result["error"] == "等待设备停止超时"
+    assert result["disable_latency"] is None
+    assert recorder.counters["cfgmgr.enable_devnode"] == 1
+    assert sim.get_devnode_status(target)[0]
+
+def test_enable_timeout_reports_failure():
+    sim, target, _, sleep = _setup(off_delay=0.0, on_delay=10.0)
+    restarter = DeviceRestarter(sim, enable_timeout=0.5, clock=sim.clock, sleep=sleep)
+    result = restarter.restart(target)
+    assert not result["ok"]
+    assert result["stage"] == "wait_started"
+    assert result["error"] == "等待设备重新启动超时"
+    assert result["disable_latency"] is not None and result["enable_latency"] is None
+
+def test_missing_device_fails_at_locate():
+    sim = SimulatedBackend.generate(10)
+    result = DeviceRestarter(sim, clock=sim.clock, sleep=sim.sleep).restart("HID\\VID_0000&PID_0000\\0")
+    assert not result["ok"] and result["stage"] == "locate"
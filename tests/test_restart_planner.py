@@ -0,0 +1,75 @@
+import pytest
+
+from devices import RESTART_EACH_CHILD, RESTART_SHARED_PARENT, DeviceRestarter, RestartPlanner
+from simulator import SimulatedBackend
+
+def _tree():
+    sim = SimulatedBackend.generate(100, receivers=2, collections=3, bluetooth=2)
+    ids = [node.pnp_id for node in sim._nodes.values()]
+    return sim, ids
+
+def _find(ids, prefix):
+    return [pnp_id for pnp_id in ids if pnp_id.startswith(prefix)]
+
+def test_sibling_collections_restart_through_shared_parent():
+    sim, ids = _tree()
+    collections = _find(ids, "HID\\VID_046D&PID_C52B&MI_01&COL")
+    steps = RestartPlanner(sim).plan(collections)
+    assert len(steps) == 1
+    assert steps[0]["target"].startswith("USB\\VID_046D&PID_C52B&MI_01\\")
+    assert steps[0]["covers"] == collections
+
+def test_one_step_per_receiver():
+    sim, ids = _tree()
+    collections = _find(ids, "HID\\VID_046D&PID_C52B&MI_01&COL") + _find(ids, "HID\\VID_046D&PID_C52C&MI_01&COL")
+    assert len(RestartPlanner(sim).plan(collections)) == 2
+
+def test_bluetooth_radio_and_hub_parents_are_not_used():
+    sim, ids = _tree()
+    # 两个蓝牙鼠标共享同一个蓝牙适配器，两个接收器共享同一个 USB Hub：都不能合并
+    bluetooth = _find(ids, "BTHENUM\\")
+    receivers = _find(ids, "USB\\VID_046D&PID_C52B\\") + _find(ids, "USB\\VID_046D&PID_C52C\\")
+    for pending in (bluetooth, receivers):
+        assert len(pending) == 2
+        steps = RestartPlanner(sim).plan(pending)
+        assert [step["target"] for step in steps] == pending
+        assert all(step["covers"] == [step["target"]] for step in steps)
+
+def test_each_child_mode_restarts_every_device():
+    sim, ids = _tree()
+    collections = _find(ids, "HID\\VID_046D&PID_C52B&MI_01&COL")
+    steps = RestartPlanner(sim, RESTART_EACH_CHILD).plan(collections + collections[:1])
+    assert [step["target"] for step in steps] == collections
+
+def test_unknown_mode_is_rejected():
+    sim, _ = _tree()
+    with pytest.raises(ValueError):
+        RestartPlanner(sim, "bogus")
+
+class WaitRecordingRestarter(DeviceRestarter):
+    def __init__(self, sim):
+        super().__init__(sim, clock=sim.clock, sleep=sim.sleep)
+        self.restarted = []
+        self.waited = []
+
+    def restart(self, pnp_id):
+        self.restarted.append(pnp_id)
+        return super().restart(pnp_id)
+
+    def wait_started(self, pnp_id, timeout=None):
+        self.waited.append(pnp_id)
+        return super().wait_started(pnp_id, timeout)
+
+def test_execute_waits_for_covered_children():
+    sim, ids = _tree()
+    collections = _find(ids, "HID\\VID_046D&PID_C52B&MI_01&COL")
+    planner = RestartPlanner(sim, RESTART_SHARED_PARENT)
+    steps = planner.plan(collections)
+    restarter = WaitRecordingRestarter(sim)
+    results = planner.execute(steps, restarter=restarter)
+
+    assert restarter.restarted == [steps[0]["target"]]
+    assert restarter.waited == collections
+    assert set(results) == set(collections)
+    assert all(outcome["ok"] for outcome in results.values())
+    assert all(sim.get_devnode_status(pnp_id)[0] for pnp_id in collections)
@@ -0,0 +1,105 @@
+from devices import PARAM_WHEEL, MouseEnumerator, RegistryWatcher, StateCache
+from simulator import SimulatedBackend
+
+class FakeWatcher(RegistryWatcher):
+    """手动触发通知；limit 模拟句柄不够时只监视前 limit 个键"""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.callback = None
+
+    def watch(self, paths, callback) -> set:
+        self.callback = callback
+        return set(paths[:self.limit])
+
+    def notify(self, path):
+        self.callback(path)
+
+class RacingBackend:
+    """读出旧值之后、返回之前执行 during_read (模拟通知恰好在读取期间到达)"""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.during_read = None
+
+    def read_all_values(self, path):
+        values = self.sim.read_all_values(path)
+        if self.during_read:
+            hook, self.during_read = self.during_read, None
+            hook()
+        return values
+
+    def __getattr__(self, name):
+        return getattr(self.sim, name)
+
+def _setup(limit=None):
+    sim = SimulatedBackend.generate(100)
+    paths = [dev.reg_path for dev in MouseEnumerator(sim).scan()]
+    for path in paths:
+        sim.write_values(path, {PARAM_WHEEL: 0})
+    changes = []
+    watcher = FakeWatcher(limit)
+    backend = RacingBackend(sim)
+    cache = StateCache(backend, watcher, on_change=changes.append)
+    cache.watch(paths)
+    return sim, backend, watcher, cache, paths, changes
+
+def test_hits_and_misses_are_counted():
+    _, _, _, cache, paths, _ = _setup()
+    assert cache.get(paths[0]) == 0
+    assert cache.get(paths[0]) == 0
+    assert cache.get(paths[0].lower()) == 0
+    assert cache.stats() == {"hits": 2, "misses": 1, "cached": 1, "watched": len(paths)}
+
+def test_notification_invalidates_and_reports_change():
+    sim, _, watcher, cache, paths, changes = _setup()
+    cache.get(paths[0])
+    sim.write_values(paths[0], {PARAM_WHEEL: 1})
+    # 通知到达前仍返回缓存的旧值
+    assert cache.get(paths[0]) == 0
+
+    watcher.notify(paths[0])
+    assert changes == [paths[0]]
+    assert cache.get(paths[0]) == 1
+    assert cache.misses == 2
+
+def test_unwatched_keys_are_never_cached():
+    sim, _, _, cache, paths, _ = _setup(limit=1)
+    for _ in range(3):
+        cache.get(paths[1])
+    assert cache.stats()["cached"] == 0
+    assert cache.misses == 3
+    sim.write_values(paths[1], {PARAM_WHEEL: 1})
+    assert cache.get(paths[1]) == 1
+
+def test_failed_watcher_disables_caching():
+    _, _, watcher, cache, paths, _ = _setup()
+    watcher.failed = True
+    cache.get(paths[0])
+    cache.get(paths[0])
+    assert cache.stats()["cached"] == 0
+    assert cache.hits == 0
+
+def test_notification_during_miss_does_not_store_stale_value():
+    sim, backend, watcher, cache, paths, _ = _setup()
+
+    def changed_while_reading():
+        sim.write_values(paths[0], {PARAM_WHEEL: 1})
+        watcher.notify(paths[0])
+
+    backend.during_read = changed_while_reading
+    # 本次读取到的是旧值，但不能进入缓存
+    assert cache.get(paths[0]) == 0
+    assert cache.get(paths[0]) == 1
+    assert cache.misses == 2
+
+def test_full_invalidate_during_miss_does_not_store_stale_value():
+    sim, backend, _, cache, paths, _ = _setup()
+
+    def changed_while_reading():
+        sim.write_values(paths[0], {PARAM_WHEEL: 1})
+        cache.invalidate()
+
+    backend.during_read = changed_while_reading
+    cache.get(paths[0])
+    assert cache.get(paths[0]) == 1